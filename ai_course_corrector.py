@@ -20,14 +20,8 @@ load_dotenv()
 # Setup logger
 logger = logging.getLogger('AICourseCorrector')
 
-# OpenAI client (optional)
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-    openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY')) if os.getenv('OPENAI_API_KEY') else None
-except ImportError:
-    OPENAI_AVAILABLE = False
-    openai_client = None
+# Shared LLM gateway (pooled client, response cache, usage metering)
+from llm_gateway import get_gateway
 
 
 class PerformanceAnalyzer:
@@ -194,13 +188,13 @@ class AIDiagnostician:
     """Uses AI to diagnose root causes and recommend fixes"""
     
     def __init__(self):
-        self.openai_client = openai_client
+        self.llm = get_gateway()
     
     def diagnose(self, metrics: Dict[str, Any], issues: List[Dict[str, Any]], 
                  recent_logs: Optional[str] = None) -> Dict[str, Any]:
         """Use AI to diagnose root causes"""
         
-        if not self.openai_client:
+        if not self.llm.is_available():
             # Fallback to rule-based diagnosis
             return self._rule_based_diagnosis(metrics, issues)
         
@@ -236,9 +230,9 @@ Provide:
 Format as JSON with keys: root_causes, fixes (array of objects with: priority, action, expected_impact, implementation_steps)
 """
             
-            response = self.openai_client.chat.completions.create(
-                model=os.getenv('OPENAI_MODEL', 'gpt-4'),
-                messages=[
+            response = self.llm.complete(
+                "ai_diagnostician",
+                [
                     {"role": "system", "content": "You are an expert revenue system analyst. Provide specific, actionable technical recommendations."},
                     {"role": "user", "content": prompt + "\n\nContext:\n" + context}
                 ],
@@ -246,7 +240,7 @@ Format as JSON with keys: root_causes, fixes (array of objects with: priority, a
                 max_tokens=2000
             )
             
-            result_text = response.choices[0].message.content
+            result_text = response.text
             
             # Try to parse JSON from response
             try:
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Benchmark evaluating many concurrent template A/B tests
+
+Compares the old per-test path (get_test_results plus determine_winner for
+every active test, one query each) against
+TemplateABTesting.evaluate_active_tests, which loads all tests in one grouped
+query and computes every posterior at once with NumPy. Also times
+TemplateBandit's per-decision Thompson-sampling cost and event recording
+through the in-memory A/B counters, including from several threads at once.
+
+Usage:
+    python benchmark_ab_testing.py --tests 5000 --decisions 100000
+"""
+
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import cash_engine
+from cash_engine import CONFIG, TemplateABTesting, TemplateBandit
+
+
+def make_db(test_count: int, seed: int = 42) -> sqlite3.Connection:
+    """Active tests with one result row per variant; about a tenth have a real lift"""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.executescript('''
+        CREATE TABLE template_ab_tests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_name TEXT, template_a_id TEXT, template_b_id TEXT,
+            start_date DATETIME, end_date DATETIME, status TEXT DEFAULT 'active',
+            winner_id TEXT, metadata TEXT
+        );
+        CREATE TABLE template_ab_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_id INTEGER, variant_id TEXT, impressions INTEGER DEFAULT 0,
+            conversions INTEGER DEFAULT 0, revenue REAL DEFAULT 0,
+            conversion_rate REAL DEFAULT 0, date DATETIME
+        );
+        CREATE UNIQUE INDEX idx_template_ab_results_variant ON template_ab_results (test_id, variant_id);
+    ''')
+    conn.executemany('INSERT INTO template_ab_tests (id, test_name, template_a_id, template_b_id) VALUES (?, ?, ?, ?)',
+                     [(i, f"test_{i}", f"template_{i}_a", f"template_{i}_b") for i in range(1, test_count + 1)])
+    rows = []
+    for test_id in range(1, test_count + 1):
+        base = rng.uniform(0.01, 0.05)
+        lift = rng.uniform(1.3, 2.0) if rng.random() < 0.1 else 1.0
+        for variant, rate in (("A", base), ("B", base * lift)):
+            impressions = int(rng.integers(350, 2800))
+            conversions = int(rng.binomial(impressions, rate))
+            rows.append((test_id, variant, impressions, conversions, conversions * 19.99))
+    conn.executemany('''
+        INSERT INTO template_ab_results (test_id, variant_id, impressions, conversions, revenue)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    return conn
+
+
+def naive_evaluate(ab_testing: TemplateABTesting, min_conversions: int) -> int:
+    """The original loop: load and judge one test at a time"""
+    decided = 0
+    for test in ab_testing.get_active_tests():
+        results = ab_testing.get_test_results(test["id"])
+        if sum(r.get("conversions", 0) for r in results.values()) >= min_conversions:
+            if ab_testing.determine_winner(test["id"], min_conversions):
+                decided += 1
+    return decided
+
+
+def time_counters(ab_testing: TemplateABTesting, events: int, threads: int = 4):
+    """Nanoseconds per recorded event, and a check that concurrent recording loses nothing"""
+    conn = ab_testing.db
+    before = conn.execute('SELECT TOTAL(impressions), TOTAL(conversions) FROM template_ab_results').fetchone()
+    start = time.perf_counter()
+    for i in range(events):
+        ab_testing.record_impression(1 + i % 100, "A")
+    record_ns = (time.perf_counter() - start) / events * 1e9
+
+    def worker(offset: int):
+        for i in range(events):
+            ab_testing.record_impression(1 + (i + offset) % 100, "B")
+            if i % 10 == 0:
+                ab_testing.record_conversion(1 + (i + offset) % 100, "B", 19.99)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    start = time.perf_counter()
+    ab_testing.flush()
+    flush_ms = (time.perf_counter() - start) * 1000
+    after = conn.execute('SELECT TOTAL(impressions), TOTAL(conversions) FROM template_ab_results').fetchone()
+    assert after[0] - before[0] == events * (1 + threads), after
+    assert after[1] - before[1] == threads * len(range(0, events, 10)), after
+    print(f"counters    record {record_ns:.0f} ns   {threads} threads x {events} events, none lost   "
+          f"last flush {flush_ms:.1f} ms")
+
+
+def time_decisions(ab_testing: TemplateABTesting, decisions: int):
+    """Microseconds per Thompson-sampled choice and per recorded impression"""
+    bandit = TemplateBandit(ab_testing, seed=42)
+    test_ids = list(bandit._arms)
+    start = time.perf_counter()
+    for i in range(decisions):
+        bandit.choose(test_ids[i % len(test_ids)])
+    choose_us = (time.perf_counter() - start) / decisions * 1e6
+    start = time.perf_counter()
+    for i in range(decisions):
+        bandit.record_impression(test_ids[i % len(test_ids)], "A")
+    record_us = (time.perf_counter() - start) / decisions * 1e6
+    print(f"bandit      choose {choose_us:.2f} us   record {record_us:.2f} us")
+
+
+def main(test_count: int, decisions: int):
+    cash_engine.logger = logging.getLogger("benchmark")
+    min_conversions = CONFIG["template_optimization"]["ab_test_min_conversions"]
+    print(f"Active tests: {test_count}   result rows: {test_count * 2}")
+
+    conn = make_db(test_count)
+    ab_testing = TemplateABTesting(conn, flush_interval=3600)
+
+    start = time.perf_counter()
+    naive_decided = naive_evaluate(ab_testing, min_conversions)
+    naive_elapsed = time.perf_counter() - start
+    print(f"naive       decided {naive_decided:5d} in {naive_elapsed * 1000:8.1f} ms")
+
+    start = time.perf_counter()
+    evaluations = ab_testing.evaluate_active_tests(min_conversions=min_conversions, close=False)
+    batch_elapsed = time.perf_counter() - start
+    batch_decided = sum(1 for e in evaluations if e["winner"])
+    print(f"vectorized  decided {batch_decided:5d} in {batch_elapsed * 1000:8.1f} ms")
+    assert batch_decided == naive_decided
+
+    start = time.perf_counter()
+    ab_testing.evaluate_active_tests(min_conversions=min_conversions)
+    closed = conn.execute("SELECT COUNT(*) FROM template_ab_tests WHERE status = 'completed'").fetchone()[0]
+    print(f"evaluate and close {closed} tests in {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(f"speedup: {naive_elapsed / batch_elapsed:.1f}x")
+
+    time_decisions(TemplateABTesting(make_db(test_count), flush_interval=3600), decisions)
+    time_counters(TemplateABTesting(make_db(test_count), flush_interval=3600), decisions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark A/B test evaluation")
+    parser.add_argument("--tests", type=int, default=5000)
+    parser.add_argument("--decisions", type=int, default=100000, help="bandit decisions to time")
+    args = parser.parse_args()
+    main(args.tests, args.decisions)
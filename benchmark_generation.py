@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Benchmark template generation offline through the LLM gateway's stub backend
+
+Compares one-at-a-time TemplateGenerator.generate_template calls against
+generate_templates_batch and prints the per-stage timings of the batch.
+
+Usage:
+    python benchmark_generation.py --topics 8 --latency-ms 500 --concurrency 4
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import cash_engine
+import llm_gateway
+from cash_engine import TemplateCorpusIndex, TemplateGenerator
+from llm_gateway import LLMGateway, StubBackend
+
+TOPICS = [
+    "budget planning", "side hustle", "habit tracking", "passive income", "content calendar",
+    "freelance pricing", "notion dashboard", "email marketing", "crypto basics", "morning routine",
+    "goal setting", "productivity system", "client onboarding", "course launch", "etsy shop", "seo audit",
+]
+
+
+def make_generator(products_dir: Path) -> TemplateGenerator:
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute('''
+        CREATE TABLE performance_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            metric_type TEXT,
+            metric_name TEXT,
+            value REAL,
+            metadata TEXT,
+            source TEXT
+        )
+    ''')
+    generator = TemplateGenerator(conn, corpus=TemplateCorpusIndex(conn, products_dir))
+    generator.products_dir = products_dir
+    return generator
+
+
+def main(topic_count: int, latency_ms: float, concurrency: int, variants: bool):
+    cash_engine.logger = logging.getLogger("benchmark")
+    topics = (TOPICS * (topic_count // len(TOPICS) + 1))[:topic_count]
+    topics = [f"{topic} {i}" if i >= len(TOPICS) else topic for i, topic in enumerate(topics)]
+
+    os.environ["LLM_MAX_CONCURRENCY"] = str(concurrency)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Gateway without engine.db: no persistent cache, no metering rows
+        llm_gateway._gateway = LLMGateway(backend=StubBackend(latency_ms), db_path=Path(tmp) / "missing" / "engine.db")
+
+        generator = make_generator(Path(tmp) / "sequential")
+        start = time.perf_counter()
+        sequential = sum(1 for topic in topics if generator.generate_template(topic))
+        sequential_s = time.perf_counter() - start
+
+        generator = make_generator(Path(tmp) / "batch")
+        batch = generator.generate_templates_batch(topics, create_variants=variants, max_workers=concurrency)
+        batch_s = batch["wall_ms"] / 1000
+
+    print(f"Topics: {topic_count}   stub latency: {latency_ms:.0f} ms   concurrency: {concurrency}")
+    print(f"sequential: {sequential} templates in {sequential_s:6.2f}s  ({sequential * 3600 / sequential_s:8.0f}/hour)")
+    print(f"batch:      {batch['generated']} templates in {batch_s:6.2f}s  ({batch['generated'] * 3600 / batch_s:8.0f}/hour)"
+          f"   speedup: {sequential_s / batch_s:.1f}x")
+    for stage, totals in batch["stages"].items():
+        print(f"  {stage:<9} mean {totals['total_ms'] / totals['count']:8.2f} ms   max {totals['max_ms']:8.2f} ms   n={totals['count']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batch template generation")
+    parser.add_argument("--topics", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--variants", action="store_true", help="also create A/B variants in the batch")
+    args = parser.parse_args()
+    main(args.topics, args.latency_ms, args.concurrency, args.variants)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Benchmark Shopify product matching and affiliate link embedding on a large catalog
+
+Compares the old per-product substring scans against ShopifyManager's
+ProductKeywordIndex and ContentSyndicator's KeywordAutomaton.
+
+Usage:
+    python benchmark_matching.py --products 10000 --runs 50
+"""
+
+import argparse
+import logging
+import os
+import random
+import time
+
+import cash_engine
+from cash_engine import ShopifyManager, ContentSyndicator, AffiliateManager
+
+WORDS = [
+    "wealth", "budget", "planner", "journal", "habit", "tracker", "passive", "income", "startup",
+    "business", "growth", "template", "notion", "finance", "savings", "crypto", "investing",
+    "productivity", "focus", "workflow", "marketing", "content", "calendar", "goal", "mindset",
+    "kit", "guide", "bundle", "pack", "system", "blueprint", "playbook", "masterclass", "checklist",
+    "dashboard", "spreadsheet", "course", "toolkit", "prompts", "swipe", "file", "vault", "library",
+    "creator", "freelancer", "agency", "coach", "side", "hustle", "ecommerce", "shopify", "etsy",
+    "email", "newsletter", "launch", "funnel", "sales", "copywriting", "branding", "design", "canva",
+    "social", "media", "instagram", "tiktok", "youtube", "podcast", "seo", "blog", "affiliate",
+    "ai", "automation", "chatgpt", "resume", "career", "interview", "study", "student", "wellness",
+]
+
+FILLER = [
+    "this", "week", "we", "looked", "at", "how", "small", "teams", "ship", "more", "by", "doing",
+    "less", "most", "people", "start", "with", "too", "many", "ideas", "pick", "one", "thing",
+    "measure", "it", "then", "repeat", "every", "morning", "write", "down", "what", "matters",
+]
+
+
+def make_catalog(count: int):
+    """Synthetic catalog of `count` products with titles, handles, tags and types"""
+    rng = random.Random(42)
+    products = {}
+    for product_id in range(1, count + 1):
+        words = rng.sample(WORDS, 3)
+        title = " ".join(w.capitalize() for w in words) + f" {product_id}"
+        products[product_id] = {
+            "id": product_id,
+            "title": title,
+            "handle": title.lower().replace(" ", "-"),
+            "tags": ", ".join(rng.sample(WORDS, 3)) + f", sku{product_id}",
+            "product_type": rng.choice(["Digital", "Template", "Course", "Ebook"]) + f" {product_id % 500}",
+        }
+    return products
+
+
+def make_content(catalog, paragraphs: int) -> str:
+    """Markdown-like content mentioning a couple of catalog products"""
+    rng = random.Random(7)
+    mentioned = rng.sample(list(catalog.values()), 2)
+    body = []
+    for i in range(paragraphs):
+        # Mostly ordinary prose with the odd catalog keyword
+        body.append(" ".join(rng.choice(WORDS if rng.random() < 0.05 else FILLER) for _ in range(60)))
+        if i in (1, paragraphs - 1):
+            body.append(f"Check out {mentioned[0 if i == 1 else 1]['title']} today.")
+    return "# Weekly Notes\n\n" + "\n\n".join(body)
+
+
+def naive_find_matching_product(products, content: str):
+    """The original O(content x catalog) scan, kept here as the baseline"""
+    content_lower = content.lower()
+    best_match = None
+    best_score = 0
+    for product in products.values():
+        title = product.get("title", "").lower()
+        handle = product.get("handle", "").lower()
+        tags = [t.lower() for t in product.get("tags", "").split(",") if t.strip()]
+        score = 0
+        if title in content_lower:
+            score += 10
+        if handle in content_lower:
+            score += 8
+        for tag in tags:
+            if tag.strip() in content_lower:
+                score += 5
+        product_type = product.get("product_type", "").lower()
+        if product_type and product_type in content_lower:
+            score += 7
+        if score > best_score:
+            best_score = score
+            best_match = product
+    return best_match if best_score >= 5 else None
+
+
+def timed(fn, runs: int) -> float:
+    """Mean milliseconds per call"""
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+def main(product_count: int, runs: int):
+    cash_engine.logger = logging.getLogger("benchmark")
+    catalog = make_catalog(product_count)
+
+    shopify = ShopifyManager()
+    shopify.products_cache = catalog
+
+    build_start = time.perf_counter()
+    shopify.product_index.rebuild(catalog.values())
+    build_ms = (time.perf_counter() - build_start) * 1000
+    print(f"Catalog: {product_count} products")
+    print(f"Index build (full sync): {build_ms:.1f} ms")
+
+    for label, paragraphs in (("social post", 3), ("long article", 40)):
+        content = make_content(catalog, paragraphs)
+        expected = naive_find_matching_product(catalog, content)
+        actual = shopify.find_matching_product(content)
+
+        naive_ms = timed(lambda: naive_find_matching_product(catalog, content), max(1, runs // 10))
+        index_ms = timed(lambda: shopify.find_matching_product(content), runs)
+        print(f"find_matching_product ({label}, {len(content)} chars)  naive: {naive_ms:8.2f} ms   "
+              f"index: {index_ms:8.3f} ms   speedup: {naive_ms / index_ms:.0f}x")
+        print(f"  naive match: {(expected or {}).get('title')!r}   index match: {(actual or {}).get('title')!r}")
+
+    update = dict(catalog[1], title="Renamed Planner 1")
+    update_ms = timed(lambda: shopify.product_index.add(update), runs)
+    print(f"Incremental product update: {update_ms:.3f} ms")
+
+    # Affiliate embedding with one campaign per product name
+    os.environ.setdefault("GUMROAD_TOKEN", "benchmark")
+    affiliate = AffiliateManager("http://localhost:0")
+    affiliate.campaigns = [
+        {"id": str(p["id"]), "name": f"Affiliate - {p['title']}", "product_url": f"https://gumroad.com/l/{p['handle']}"}
+        for p in catalog.values()
+    ]
+    syndicator = ContentSyndicator(affiliate)
+    syndicator._matching_gumroad_campaigns(content)  # build once (content is the long article)
+
+    def naive_campaign_scan():
+        content_lower = content.lower()
+        return [c for c in affiliate.campaigns
+                if c["name"].replace("Affiliate - ", "").strip().lower() in content_lower]
+
+    naive_ms = timed(naive_campaign_scan, max(1, runs // 10))
+    automaton_ms = timed(lambda: syndicator._matching_gumroad_campaigns(content), runs)
+    print(f"campaign matching      naive: {naive_ms:8.2f} ms   automaton: {automaton_ms:8.2f} ms   "
+          f"speedup: {naive_ms / automaton_ms:.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark product and campaign matching")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    main(args.products, args.runs)
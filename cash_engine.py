@@ -13,9 +13,9 @@ import threading
 import hashlib
 import base64
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterable
 import requests
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -106,11 +106,9 @@ try:
 except ImportError:
     MOUSE_AVAILABLE = False
 
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+# All LLM calls go through the shared gateway (pooled client, cache, metering)
+from llm_gateway import get_gateway
+from document_ingestion import DocumentIngestor
 
 from forex_python.converter import CurrencyRates
 import stripe
@@ -120,8 +118,9 @@ import sys
 import re
 import html
 import itertools
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, OrderedDict, deque
 import statistics
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import math
 
 # ============================================
@@ -131,6 +130,7 @@ CONFIG = {
     "system_name": "AUTONOMOUS_CASH_ENGINE",
     "template_generation_enabled": os.getenv("TEMPLATE_GENERATION_ENABLED", "false").lower() == "true",
     "min_template_interval": int(os.getenv("MIN_TEMPLATE_GENERATION_INTERVAL", "7")),
+    "template_batch_size": int(os.getenv("TEMPLATE_BATCH_SIZE", "3")),  # templates per generation cycle
     "template_topics": ["wealth", "business", "productivity", "entrepreneurship", "finance", "passive income"],
     "version": "2.0",
     "target_monthly": 10000,  # USD
@@ -169,6 +169,9 @@ CONFIG = {
         "sales_optimization_enabled": os.getenv("SALES_OPTIMIZATION_ENABLED", "true").lower() == "true",
         "trend_analysis_interval": int(os.getenv("TREND_ANALYSIS_INTERVAL", "24")),  # hours
         "ab_test_min_conversions": int(os.getenv("AB_TEST_MIN_CONVERSIONS", "10")),  # minimum conversions before declaring winner
+        "ab_test_confidence": float(os.getenv("AB_TEST_CONFIDENCE", "0.95")),  # posterior probability the winner is better
+        "ab_test_max_expected_loss": float(os.getenv("AB_TEST_MAX_EXPECTED_LOSS", "0.01")),  # risk of picking the winner, relative to its value
+        "ab_results_flush_seconds": int(os.getenv("AB_RESULTS_FLUSH_SECONDS", "60")),  # how often in-memory A/B counts are written to template_ab_results
         "optimization_threshold": float(os.getenv("OPTIMIZATION_THRESHOLD", "0.3"))  # optimize templates below 30% of average performance
     }
 }
@@ -186,11 +189,27 @@ ENCRYPTED_KEYS = {
 # ============================================
 # GUMROAD API CLIENT
 # ============================================
+class GumroadUploadError(Exception):
+    """Failed request during a Gumroad product file upload"""
+
+
 class GumroadClient:
     """Python client for Gumroad API"""
+    HASH_BLOCK_SIZE = 1024 * 1024
+    _upload_skip_logged = False  # "uploads not configured" is logged once per process
+    
     def __init__(self, access_token: Optional[str] = None):
         self.access_token = access_token or os.getenv('GUMROAD_TOKEN')
         self.base_url = 'https://api.gumroad.com/v2'
+        # File uploads: multipart, resumable, over one pooled session shared by all upload threads.
+        # Gumroad's public API has no file upload endpoint, so this is opt-in: unset means uploads are skipped.
+        self.upload_url = os.getenv('GUMROAD_UPLOAD_URL', '').rstrip('/')
+        self.upload_part_size = int(float(os.getenv('GUMROAD_UPLOAD_PART_MB', '8')) * 1024 * 1024)
+        self.upload_retries = int(os.getenv('GUMROAD_UPLOAD_RETRIES', '3'))
+        self.upload_backoff = float(os.getenv('GUMROAD_UPLOAD_BACKOFF_SECONDS', '1'))
+        self.upload_concurrency = int(os.getenv('GUMROAD_UPLOAD_CONCURRENCY', '4'))
+        self._upload_session = None
+        self._upload_session_lock = threading.Lock()
     
     def has_access_token(self) -> bool:
         """Check if access token is available"""
@@ -295,19 +314,321 @@ class GumroadClient:
             return None
     
     def upload_product_file(self, product_id: str, file_path: Path) -> bool:
-        """Upload a file to a Gumroad product (requires file upload API)"""
+        """Upload a delivery file to a Gumroad product as a resumable multipart upload
+        
+        Gumroad's public API has no file upload endpoint, so this needs an upload
+        service that speaks the protocol below, set with GUMROAD_UPLOAD_URL. Without
+        it the upload is skipped (logged once) and True is returned, as before.
+        
+        Protocol, relative to GUMROAD_UPLOAD_URL (access_token as a query parameter):
+            POST /products/{id}/files/uploads  {filename, size, sha256, part_size}
+                 -> {"upload": {"id", "part_size", "parts": [part numbers already received]}}
+                 An unfinished upload of the same sha256 is returned instead of a new
+                 one, which is how an interrupted upload resumes.
+            PUT  /products/{id}/files/uploads/{upload_id}/parts/{n}  raw bytes, X-Part-SHA256 header
+            POST /products/{id}/files/uploads/{upload_id}/complete  -> {"file": {"id", "size", "sha256"}}
+        
+        The file is streamed from disk one part at a time, failed requests are
+        retried (GUMROAD_UPLOAD_RETRIES), and the assembled file's sha256 must
+        match the local file.
+        """
         if not self.has_access_token() or not product_id:
             return False
+        if not self.upload_url:
+            if not GumroadClient._upload_skip_logged:
+                GumroadClient._upload_skip_logged = True
+                logger.info("GUMROAD_UPLOAD_URL not set - skipping product file uploads "
+                            "(Gumroad's API has no file upload endpoint; attach files in the Gumroad dashboard)")
+            return True
         
+        file_path = Path(file_path)
         try:
-            # Gumroad file upload typically requires multipart/form-data
-            # This is a placeholder - actual implementation would use requests with file upload
-            logger.info(f"Would upload file {file_path.name} to product {product_id} (file upload API integration needed)")
-            # TODO: Implement actual file upload when Gumroad API supports it
+            size = file_path.stat().st_size
+            checksum = self.file_sha256(file_path)
+            uploads_url = f"{self.upload_url}/products/{product_id}/files/uploads"
+            upload = self._upload_request("POST", uploads_url, json={
+                "filename": file_path.name,
+                "size": size,
+                "sha256": checksum,
+                "part_size": self.upload_part_size
+            })["upload"]
+            upload_id = upload["id"]
+            part_size = int(upload.get("part_size") or self.upload_part_size)
+            received = set(upload.get("parts") or [])
+            part_count = max(1, math.ceil(size / part_size))
+            
+            with open(file_path, 'rb') as f:
+                for part in range(1, part_count + 1):
+                    if part in received:
+                        continue
+                    f.seek((part - 1) * part_size)
+                    chunk = f.read(part_size)
+                    self._upload_request("PUT", f"{uploads_url}/{upload_id}/parts/{part}", data=chunk, headers={
+                        "Content-Type": "application/octet-stream",
+                        "X-Part-SHA256": hashlib.sha256(chunk).hexdigest()
+                    })
+            
+            uploaded = self._upload_request("POST", f"{uploads_url}/{upload_id}/complete", json={})["file"]
+            if uploaded.get("sha256") != checksum:
+                logger.error(f"Gumroad upload of {file_path.name} failed verification: "
+                             f"sha256 {uploaded.get('sha256')} != local {checksum}")
+                return False
+            
+            resumed = f", resumed with {len(received)} parts already uploaded" if received else ""
+            logger.info(f"✅ Uploaded {file_path.name} to Gumroad product {product_id} "
+                        f"({size / (1024 * 1024):.1f} MB in {part_count} parts{resumed})")
             return True
-        except Exception as e:
-            logger.error(f"Error uploading file to Gumroad: {e}")
+        except (GumroadUploadError, OSError, KeyError, ValueError) as e:
+            logger.error(f"Error uploading {file_path.name} to Gumroad: {e}")
             return False
+    
+    def upload_product_files(self, uploads: List[Tuple[str, Path]], max_workers: Optional[int] = None) -> Dict[str, bool]:
+        """Upload (product_id, file) pairs concurrently (GUMROAD_UPLOAD_CONCURRENCY); product_id -> success"""
+        if not uploads:
+            return {}
+        workers = max(1, min(max_workers or self.upload_concurrency, len(uploads)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gumroad-upload") as pool:
+            futures = {pool.submit(self.upload_product_file, product_id, file_path): product_id
+                       for product_id, file_path in uploads}
+            return {futures[future]: future.result() for future in as_completed(futures)}
+    
+    @classmethod
+    def file_sha256(cls, file_path: Path) -> str:
+        """sha256 of a file, read in blocks"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(cls.HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _get_upload_session(self) -> requests.Session:
+        """Session whose connection pool is sized for concurrent uploads"""
+        with self._upload_session_lock:
+            if self._upload_session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(1, self.upload_concurrency))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._upload_session = session
+            return self._upload_session
+    
+    def _upload_request(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
+        """One upload API call, retried with exponential backoff on connection errors, 429 and 5xx"""
+        session = self._get_upload_session()
+        attempts = max(1, self.upload_retries)
+        for attempt in range(1, attempts + 1):
+            try:
+                response = session.request(method, url, params={"access_token": self.access_token},
+                                           timeout=(10, 120), **kwargs)
+            except requests.exceptions.RequestException as e:
+                error = str(e)
+            else:
+                if response.status_code < 400:
+                    result = response.json()
+                    if result.get("success", True):
+                        return result
+                    raise GumroadUploadError(result.get("message") or f"{method} {url} failed")
+                error = f"HTTP {response.status_code} - {response.text[:200]}"
+                if response.status_code != 429 and response.status_code < 500:
+                    raise GumroadUploadError(error)
+            if attempt < attempts:
+                logger.debug(f"Gumroad upload request failed ({error}), retrying ({attempt}/{attempts})")
+                time.sleep(self.upload_backoff * 2 ** (attempt - 1))
+        raise GumroadUploadError(f"{method} {url} failed after {attempts} attempts: {error}")
+
+
+# ============================================
+# KEYWORD MATCHING
+# ============================================
+class KeywordAutomaton:
+    """Aho-Corasick automaton: finds every keyword contained in a text in one pass.
+    
+    Matching is case-insensitive and reports the same keywords as running
+    `keyword in text.lower()` for each keyword, but costs O(len(text)) no
+    matter how many keywords there are.
+    """
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self.size = 0
+        for keyword in keywords:
+            self._add(keyword.lower())
+        self._build_failure_links()
+    
+    def _add(self, keyword: str):
+        if not keyword:
+            return
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        if keyword not in self._out[state]:
+            self._out[state] = self._out[state] + (keyword,)
+            self.size += 1
+    
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+    
+    def find_all(self, text: str) -> set:
+        """Return the set of keywords that occur in text"""
+        found = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text.lower():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class ProductKeywordIndex:
+    """Inverted index from tokens to products with TF-IDF-style scoring.
+    
+    Each product contributes the tokens of its title, handle, tags and product
+    type, weighted by field. A query only touches the postings of tokens that
+    occur in the content, and products can be added or removed without
+    rebuilding the index.
+    
+    A product only matches when the content covers one of its phrases - the
+    whole title, handle, product type or a single tag - so a lone shared word
+    like "business" doesn't pull in "Business Kit". Scores rank the products
+    that qualify.
+    """
+    FIELD_WEIGHTS = {"title": 10, "handle": 8, "product_type": 7, "tags": 5}
+    STOPWORDS = frozenset({"a", "an", "and", "for", "in", "of", "on", "or", "the", "to", "with", "your", "you"})
+    TOKEN_RE = re.compile(r"[a-z0-9]+")
+    _versions = itertools.count(1)
+    
+    def __init__(self):
+        self.version = next(self._versions)  # changes whenever the indexed catalog does
+        self._postings = defaultdict(dict)  # token -> {slot: field weight}
+        self._arrays = {}  # token -> (slots, weights) numpy arrays, rebuilt lazily after changes
+        self._slots = {}  # product_id -> dense slot; slot order is catalog order, used for tie-breaking
+        self._slot_ids = []  # slot -> product_id (None once removed)
+        self._product_tokens = {}  # product_id -> tokens, for removal
+        self._product_phrases = {}  # product_id -> token sets the content must cover for a match
+    
+    def __len__(self) -> int:
+        return len(self._product_tokens)
+    
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        return [t for t in cls.TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in cls.STOPWORDS]
+    
+    def rebuild(self, products):
+        """Replace the index contents with the given products"""
+        self.__init__()
+        for product in products:
+            self.add(product)
+    
+    def add(self, product: Dict[str, Any]):
+        """Index a product, replacing any previous version of it"""
+        product_id = product["id"]
+        self._remove_tokens(product_id)
+        slot = self._slots.get(product_id)
+        if slot is None:
+            slot = self._slots[product_id] = len(self._slot_ids)
+            self._slot_ids.append(product_id)
+        weights = {}
+        phrases = set()
+        for field, weight in self.FIELD_WEIGHTS.items():
+            value = product.get(field) or ""
+            if field == "handle":
+                value = value.replace("-", " ")
+            for phrase in (value.split(",") if field == "tags" else [value]):
+                tokens = self.tokenize(phrase)
+                if tokens:
+                    phrases.add(frozenset(tokens))
+                for token in tokens:
+                    # A token counts once per product, at its strongest field
+                    weights[token] = max(weights.get(token, 0), weight)
+        for token, weight in weights.items():
+            self._postings[token][slot] = weight
+            self._arrays.pop(token, None)
+        self._product_tokens[product_id] = tuple(weights)
+        self._product_phrases[product_id] = tuple(phrases)
+        self.version = next(self._versions)
+    
+    def remove(self, product_id):
+        """Drop a product from the index"""
+        self._remove_tokens(product_id)
+        self.version = next(self._versions)
+        slot = self._slots.pop(product_id, None)
+        if slot is not None:
+            self._slot_ids[slot] = None
+    
+    def _remove_tokens(self, product_id):
+        slot = self._slots.get(product_id)
+        self._product_phrases.pop(product_id, None)
+        for token in self._product_tokens.pop(product_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(slot, None)
+                self._arrays.pop(token, None)
+                if not postings:
+                    del self._postings[token]
+    
+    def _posting_arrays(self, token: str):
+        arrays = self._arrays.get(token)
+        if arrays is None:
+            postings = self._postings[token]
+            arrays = self._arrays[token] = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                np.fromiter(postings.values(), dtype=np.float64, count=len(postings)),
+            )
+        return arrays
+    
+    def search(self, content: str) -> Tuple[Optional[Any], float]:
+        """Return (best product_id, score) for content, or (None, 0.0) when no product's phrase is covered"""
+        total = len(self._product_tokens)
+        if not total:
+            return None, 0.0
+        scores = np.zeros(len(self._slot_ids))
+        # Products are the short side, so a token counts once however often the content repeats it;
+        # the field weight plays the role of term frequency
+        content_tokens = set(self.tokenize(content))
+        for token in content_tokens:
+            if token not in self._postings:
+                continue
+            slots, weights = self._posting_arrays(token)
+            # Smoothed IDF stays >= 1 so a lone tag hit still scores its field weight
+            scores[slots] += weights * (1.0 + math.log(total / len(slots)))
+        # Best score first, ties to the product indexed first (argmax and the stable sort both pick
+        # the lowest slot). The top few usually decide it, so only sort when they all fail.
+        for _ in range(16):
+            slot = int(np.argmax(scores))
+            if not scores[slot]:
+                return None, 0.0
+            if self._covers(slot, content_tokens):
+                return self._slot_ids[slot], float(scores[slot])
+            scores[slot] = 0.0
+        candidates = np.flatnonzero(scores)
+        for slot in candidates[np.argsort(-scores[candidates], kind="stable")].tolist():
+            if self._covers(slot, content_tokens):
+                return self._slot_ids[slot], float(scores[slot])
+        return None, 0.0
+    
+    def _covers(self, slot: int, content_tokens: set) -> bool:
+        """Whether the content contains every token of one of the product's phrases"""
+        return any(phrase <= content_tokens for phrase in self._product_phrases[self._slot_ids[slot]])
 
 
 # ============================================
@@ -489,14 +810,205 @@ class MarketScanner:
         return opportunities
 
 
+class TemplateCorpusIndex:
+    """Index of the Markdown templates and PDF products in products/, persisted in engine.db.
+
+    One row per template with its mtime, size, content hash and parsed
+    structure (title, ## sections, length, Sales Blurb offset). refresh() only
+    stats the directory and re-reads files whose mtime or size changed, so
+    product creation, template generation and optimization can consult the
+    corpus without re-reading every template each cycle. PDFs are indexed from
+    their cached DocumentIngestor extraction, with the PDF outline as sections.
+    """
+    TITLE_SCAN_LINES = 10
+    SALES_BLURB_RE = re.compile(r"^##\s+Sales Blurb", re.IGNORECASE | re.MULTILINE)
+    PATTERNS = ("*.md", "*.pdf")
+
+    def __init__(self, db_conn=None, products_dir: Path = Path("./products"),
+                 documents: Optional[DocumentIngestor] = None):
+        self.db = db_conn or sqlite3.connect(":memory:", check_same_thread=False)
+        self.products_dir = Path(products_dir)
+        self.documents = documents or DocumentIngestor(self.db)
+        self._lock = threading.Lock()
+        self._entries = None  # file name -> entry, loaded from the table on first use
+        self._ensure_table()
+
+    def _ensure_table(self):
+        """Create the template corpus table if it doesn't exist"""
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS template_corpus (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                title TEXT,
+                sections TEXT,
+                length INTEGER,
+                sales_blurb_offset INTEGER,
+                indexed_at REAL
+            )
+        ''')
+        self.db.commit()
+
+    @classmethod
+    def parse(cls, content: str) -> Dict[str, Any]:
+        """Title, ## sections, length and Sales Blurb offset of a template"""
+        lines = content.split('\n')
+        title = ""
+        for line in lines[:cls.TITLE_SCAN_LINES]:
+            if line.strip().startswith('# '):
+                title = line.strip('# ').strip()
+                break
+        sections = [line.strip('## ').strip() for line in lines if line.strip().startswith('## ')]
+        blurb = cls.SALES_BLURB_RE.search(content)
+        return {
+            "title": title,
+            "sections": sections,
+            "length": len(content),
+            "sales_blurb_offset": blurb.start() if blurb else None
+        }
+
+    @classmethod
+    def parse_document(cls, extraction: Dict[str, Any]) -> Dict[str, Any]:
+        """Index fields of an extracted PDF: its title, outline entries as sections, and text length"""
+        blurb = cls.SALES_BLURB_RE.search(extraction["text"])
+        return {
+            "title": extraction["title"],
+            "sections": [item["title"] for item in extraction["outline"]],
+            "length": len(extraction["text"]),
+            "sales_blurb_offset": blurb.start() if blurb else None
+        }
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        rows = self.db.execute('''
+            SELECT path, mtime, size, content_hash, title, sections, length, sales_blurb_offset
+            FROM template_corpus
+        ''').fetchall()
+        entries = {}
+        for path, mtime, size, content_hash, title, sections, length, blurb_offset in rows:
+            path = Path(path)
+            if path.parent != self.products_dir:
+                continue
+            if self.documents.handles(path) and not self.documents.has_extraction(content_hash):
+                continue  # e.g. a placeholder PDF an earlier version indexed as text; refresh re-checks it
+            entries[path.name] = {
+                "path": path, "format": path.suffix.lstrip(".").lower(), "mtime": mtime, "size": size, "content_hash": content_hash,
+                "title": title or "", "sections": json.loads(sections or "[]"),
+                "length": length or 0, "sales_blurb_offset": blurb_offset
+            }
+        return entries
+
+    def refresh(self) -> int:
+        """Bring the index up to date with products/; returns the number of templates (re)indexed"""
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+
+            current = {}
+            if self.products_dir.exists():
+                for pattern in self.PATTERNS:
+                    for template_file in self.products_dir.glob(pattern):
+                        try:
+                            stat = template_file.stat()
+                        except OSError:
+                            continue
+                        current[template_file.name] = (template_file, stat.st_mtime, stat.st_size)
+
+            changed = []
+            changed_documents = []
+            for name, (template_file, mtime, size) in current.items():
+                entry = self._entries.get(name)
+                if entry and entry["mtime"] == mtime and entry["size"] == size:
+                    continue
+                if self.documents.handles(template_file):
+                    changed_documents.append(template_file)
+                    continue
+                try:
+                    data = template_file.read_bytes()
+                except OSError as e:
+                    logger.warning(f"Could not index template {name}: {e}")
+                    continue
+                entry = {"path": template_file, "format": "md", "mtime": mtime, "size": size,
+                         "content_hash": hashlib.sha256(data).hexdigest()}
+                entry.update(self.parse(data.decode('utf-8', errors='replace')))
+                self._entries[name] = entry
+                changed.append(entry)
+
+            # New or changed PDFs: one ingest call, so uncached ones are extracted in parallel
+            for template_file, extraction in self.documents.ingest(changed_documents).items():
+                _, mtime, size = current[template_file.name]
+                entry = {"path": template_file, "format": template_file.suffix.lstrip(".").lower(),
+                         "mtime": mtime, "size": size, "content_hash": extraction["content_hash"]}
+                entry.update(self.parse_document(extraction))
+                self._entries[template_file.name] = entry
+                changed.append(entry)
+
+            removed = [name for name in self._entries if name not in current]
+            if not changed and not removed:
+                return 0
+
+            now_ts = time.time()
+            self.db.executemany('''
+                INSERT OR REPLACE INTO template_corpus
+                (path, mtime, size, content_hash, title, sections, length, sales_blurb_offset, indexed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(str(e["path"]), e["mtime"], e["size"], e["content_hash"], e["title"],
+                   json.dumps(e["sections"]), e["length"], e["sales_blurb_offset"], now_ts) for e in changed])
+            self.db.executemany('DELETE FROM template_corpus WHERE path = ?',
+                                [(str(self._entries.pop(name)["path"]),) for name in removed])
+            self.db.commit()
+            logger.debug(f"Template corpus: {len(changed)} indexed, {len(removed)} removed")
+            return len(changed)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """All indexed templates, sorted by file name"""
+        self.refresh()
+        with self._lock:
+            return [dict(self._entries[name]) for name in sorted(self._entries)]
+
+    def get(self, template_id: str, refresh: bool = True) -> Optional[Dict[str, Any]]:
+        """Index entry for a template id (file stem, Markdown before PDF) or file name.
+
+        Returns None if there is no such template. Pass refresh=False for
+        lookups right after entries(), e.g. inside a batch.
+        """
+        if refresh or self._entries is None:
+            self.refresh()
+        with self._lock:
+            for name in (template_id, f"{template_id}.md", f"{template_id}.pdf"):
+                entry = self._entries.get(name)
+                if entry:
+                    return dict(entry)
+            return None
+
+    def read(self, template_id: str, limit: Optional[int] = None, refresh: bool = True) -> Optional[str]:
+        """Content of a template (only the first `limit` characters if given)"""
+        entry = self.get(template_id, refresh=refresh)
+        if not entry:
+            return None
+        if self.documents.handles(entry["path"]):
+            text = self.documents.text(entry["path"])
+            return text[:limit] if limit else text
+        try:
+            with open(entry["path"], encoding='utf-8') as f:
+                return f.read(limit) if limit else f.read()
+        except OSError as e:
+            logger.warning(f"Error reading template {template_id}: {e}")
+            return None
+
+
 class ProductFactory:
     """Automated digital product creation with Gumroad integration"""
-    def __init__(self, db_conn):
+    # Descriptions use at most 500 chars over 20 lines, so a 1024-char prefix gives the same result
+    DESCRIPTION_SOURCE_CHARS = 1024
+    
+    def __init__(self, db_conn, corpus: Optional[TemplateCorpusIndex] = None):
         self.db = db_conn
         self.cursor = db_conn.cursor()
         self.templates = []
         self.gumroad = GumroadClient()
         self.products_dir = Path("./products")
+        self.corpus = corpus or TemplateCorpusIndex(db_conn, self.products_dir)
     
     def sync_gumroad_products(self) -> int:
         """Sync products from Gumroad to local database"""
@@ -605,7 +1117,10 @@ class ProductFactory:
             if not template_file.exists():
                 logger.error(f"Template not found: {template_file}")
                 return None
-            content = template_file.read_text(encoding='utf-8')
+            if self.corpus.documents.handles(template_file):
+                content = self.corpus.documents.text(template_file)
+            else:
+                content = template_file.read_text(encoding='utf-8')
             description = self._generate_product_description(content, product_name)
             template_id = template_file.stem
             
@@ -638,19 +1153,53 @@ class ProductFactory:
     
     def upload_product_to_gumroad(self, product_id: int, price_cents: int = None) -> Optional[str]:
         """Upload a locally created product to Gumroad (REVENUE GENERATION)"""
+        published = self._publish_to_gumroad(product_id, price_cents)
+        if not published:
+            return None
+        gumroad_id, gumroad_url, delivery_file = published
+        if delivery_file:
+            self.gumroad.upload_product_file(gumroad_id, delivery_file)
+        return gumroad_url
+    
+    def upload_products_to_gumroad(self, product_ids: List[int]) -> int:
+        """Publish several products, then upload their delivery files concurrently; returns the number published"""
+        published = 0
+        uploads = []  # (Gumroad product id, delivery file)
+        for product_id in product_ids:
+            result = self._publish_to_gumroad(product_id)
+            if not result:
+                continue
+            published += 1
+            if result[2]:
+                uploads.append((result[0], result[2]))
+        
+        results = self.gumroad.upload_product_files(uploads)
+        failed = [product_id for product_id, ok in results.items() if not ok]
+        if failed:
+            logger.warning(f"Gumroad file upload failed for {len(failed)} of {len(uploads)} products; "
+                           f"the next upload of the same file resumes where it stopped")
+        return published
+    
+    def _delivery_file(self, template_id: Optional[str]) -> Optional[Path]:
+        """File buyers receive for a product: its template, Markdown or PDF"""
+        entry = self.corpus.get(template_id) if template_id else None
+        return entry["path"] if entry else None
+    
+    def _publish_to_gumroad(self, product_id: int, price_cents: int = None) -> Optional[Tuple[str, str, Optional[Path]]]:
+        """Create a local product on Gumroad; returns (Gumroad id, URL, delivery file to upload)"""
         if not self.gumroad.has_access_token():
             logger.warning("Cannot upload to Gumroad: no access token")
             return None
         
         try:
             # Get product from database
-            self.cursor.execute('SELECT name, price, description FROM products WHERE id = ?', (product_id,))
+            self.cursor.execute('SELECT name, price, description, template_id FROM products WHERE id = ?', (product_id,))
             product = self.cursor.fetchone()
             if not product:
                 logger.error(f"Product {product_id} not found in database")
                 return None
             
-            name, price, description = product
+            name, price, description, template_id = product
             price_cents = price_cents or int(price * 100)  # Convert to cents
             
             # Create product on Gumroad
@@ -674,7 +1223,7 @@ class ProductFactory:
                 self.db.commit()
                 
                 logger.info(f"✅ Uploaded product '{name}' to Gumroad: {gumroad_url}")
-                return gumroad_url
+                return gumroad_id, gumroad_url, self._delivery_file(template_id)
             else:
                 logger.error(f"Failed to create product '{name}' on Gumroad")
                 return None
@@ -682,21 +1231,53 @@ class ProductFactory:
             logger.error(f"Error uploading product to Gumroad: {e}")
             return None
     
-    def scan_templates_and_create_products(self) -> int:
-        """Scan products/ folder and create products from templates (REVENUE GENERATION)"""
-        if not self.products_dir.exists():
-            return 0
-        created = 0
-        for template_file in self.products_dir.glob("*.md"):
-            product_name = template_file.stem.replace("_", " ").title()
-            self.cursor.execute('SELECT id FROM products WHERE name = ?', (product_name,))
-            if self.cursor.fetchone():
-                continue
+    def scan_templates_and_create_products(self, max_workers: Optional[int] = None) -> int:
+        """Scan products/ folder and create products from templates (REVENUE GENERATION)
+        
+        Diffs the template corpus against the existing product names (one query),
+        builds the new products' descriptions on a worker pool
+        (PRODUCT_DESCRIPTION_WORKERS) and inserts them all in one transaction.
+        """
+        try:
+            existing = {row[0] for row in self.cursor.execute('SELECT name FROM products')}
+            new_templates = {}  # product name -> template file, first file wins on name clashes
+            for entry in self.corpus.entries():
+                product_name = entry["path"].stem.replace("_", " ").title()
+                if product_name not in existing and product_name not in new_templates:
+                    new_templates[product_name] = entry["path"]
+            if not new_templates:
+                return 0
+            
+            workers = max_workers or int(os.getenv("PRODUCT_DESCRIPTION_WORKERS", "8"))
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(new_templates)))) as pool:
+                descriptions = list(pool.map(self._describe_template, new_templates.values(), new_templates.keys()))
+            
             price = 9.99
-            product_id = self.create_product_from_template(template_file, product_name, price)
-            if product_id:
-                created += 1
-        return created
+            created_date = datetime.now()
+            rows = [
+                (product_name, price, "digital", description, created_date, template_file.stem, None)
+                for (product_name, template_file), description in zip(new_templates.items(), descriptions)
+                if description is not None
+            ]
+            with self.db:
+                self.cursor.executemany('''
+                    INSERT INTO products (name, price, type, description, created_date, template_id, ab_test_variant)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+            if rows:
+                logger.info(f"Created {len(rows)} products from templates")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Error creating products from templates: {e}")
+            return 0
+    
+    def _describe_template(self, template_file: Path, product_name: str) -> Optional[str]:
+        """Product description for a template, reading only the prefix the description can use"""
+        content = self.corpus.read(template_file.stem, self.DESCRIPTION_SOURCE_CHARS, refresh=False)
+        if content is None:
+            logger.error(f"Template not found: {template_file}")
+            return None
+        return self._generate_product_description(content, product_name)
     
     def list_products(self) -> List[Dict[str, Any]]:
         """List all products"""
@@ -707,33 +1288,25 @@ class ProductFactory:
 
 class TemplateGenerator:
     """AI-powered template generator using OpenAI API"""
-    def __init__(self, db_conn):
+    def __init__(self, db_conn, corpus: Optional[TemplateCorpusIndex] = None):
         self.db = db_conn
         self.cursor = db_conn.cursor()
         self.products_dir = Path("./products")
-        self.api_key = os.getenv("OPENAI_API_KEY")
+        self.corpus = corpus or TemplateCorpusIndex(db_conn, self.products_dir)
         self.model = os.getenv("TEMPLATE_GENERATION_MODEL", "gpt-4-turbo-preview")
-        self.client = None
+        self.llm = get_gateway()
         
-        if OPENAI_AVAILABLE and self.api_key:
-            try:
-                self.client = OpenAI(api_key=self.api_key)
-                logger.info("✅ OpenAI client initialized for template generation")
-            except Exception as e:
-                logger.warning(f"OpenAI initialization failed: {e}")
+        if self.llm.is_available():
+            logger.info("✅ LLM gateway available for template generation")
         else:
-            if not OPENAI_AVAILABLE:
-                logger.debug("OpenAI package not available")
-            if not self.api_key:
-                logger.debug("OPENAI_API_KEY not set")
+            logger.debug("LLM gateway not available (OpenAI package or OPENAI_API_KEY missing)")
     
     def is_available(self) -> bool:
         """Check if template generation is available"""
-        return self.client is not None
+        return self.llm.is_available()
     
     def analyze_existing_templates(self) -> Dict[str, Any]:
         """Analyze existing templates to learn structure and patterns"""
-        templates = {}
         structure_patterns = {
             "sections": [],
             "common_elements": [],
@@ -741,46 +1314,25 @@ class TemplateGenerator:
             "sample_content": []
         }
         
-        if not self.products_dir.exists():
-            return structure_patterns
-        
-        total_length = 0
-        template_files = list(self.products_dir.glob("*.md"))
+        # Title, sections and length come from the corpus index; only the
+        # sampled previews are read from disk. PDF products aren't templates
+        # the generator should imitate, so only Markdown is analyzed.
+        entries = [entry for entry in self.corpus.entries() if entry["format"] == "md"]
         
-        for template_file in template_files[:3]:  # Analyze up to 3 templates
-            try:
-                content = template_file.read_text(encoding='utf-8')
-                total_length += len(content)
-                
-                # Extract title (first line starting with #)
-                lines = content.split('\n')
-                title = ""
-                for line in lines[:10]:
-                    if line.strip().startswith('# '):
-                        title = line.strip('# ').strip()
-                        break
-                
-                # Extract sections (## headings)
-                sections = []
-                current_section = None
-                for line in lines:
-                    if line.strip().startswith('## '):
-                        section_name = line.strip('## ').strip()
-                        sections.append(section_name)
-                        current_section = section_name
-                
-                structure_patterns["sections"].extend(sections)
-                structure_patterns["sample_content"].append({
-                    "title": title,
-                    "sections": sections,
-                    "length": len(content),
-                    "first_500_chars": content[:500]
-                })
-            except Exception as e:
-                logger.error(f"Error analyzing template {template_file.name}: {e}")
+        for entry in entries[:3]:  # Analyze up to 3 templates
+            preview = self.corpus.read(entry["path"].stem, 500, refresh=False)
+            if preview is None:
+                continue
+            structure_patterns["sections"].extend(entry["sections"])
+            structure_patterns["sample_content"].append({
+                "title": entry["title"],
+                "sections": entry["sections"],
+                "length": entry["length"],
+                "first_500_chars": preview
+            })
         
-        if template_files:
-            structure_patterns["avg_length"] = total_length // len(template_files)
+        if entries:
+            structure_patterns["avg_length"] = sum(entry["length"] for entry in entries) // len(entries)
         
         # Find common sections
         section_counts = {}
@@ -798,21 +1350,75 @@ class TemplateGenerator:
     def generate_template(self, topic: str, product_type: str = "digital") -> Optional[Path]:
         """Generate a new template using OpenAI API"""
         if not self.is_available():
-            logger.warning("Template generation not available - OpenAI client not initialized")
+            logger.warning("Template generation not available - LLM gateway not available")
             return None
         
-        try:
-            # Analyze existing templates for structure
-            patterns = self.analyze_existing_templates()
-            
-            # Build system prompt
-            system_prompt = """You are an expert digital product creator specializing in high-converting product descriptions and templates.
+        result = self._generate_one(topic, product_type, self.analyze_existing_templates())
+        if result["path"]:
+            self.track_generation(topic, product_type, result["length"], result["tokens"])
+        return result["path"]
+    
+    def generate_templates_batch(self, topics: List[str], product_type: str = "digital",
+                                 create_variants: bool = False, max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """Generate, validate and save templates for several topics concurrently.
+        
+        Existing templates are analyzed once for the whole batch. Each topic runs
+        on a bounded worker pool (TEMPLATE_BATCH_CONCURRENCY, and the gateway's
+        LLM_MAX_CONCURRENCY), optionally followed by its A/B variant. Database
+        writes stay on the calling thread, and per-stage timings are recorded in
+        performance_metrics.
+        """
+        batch = {"results": [], "generated": 0, "wall_ms": 0.0, "stages": {}}
+        topics = list(dict.fromkeys(t for t in topics if t))  # one template per topic per batch
+        if not topics:
+            return batch
+        if not self.is_available():
+            logger.warning("Template generation not available - LLM gateway not available")
+            return batch
+        
+        batch_start = time.perf_counter()
+        patterns = self.analyze_existing_templates()
+        analyze_ms = (time.perf_counter() - batch_start) * 1000
+        
+        workers = max_workers or int(os.getenv("TEMPLATE_BATCH_CONCURRENCY", "3"))
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(topics))), thread_name_prefix="template-gen") as executor:
+            futures = {
+                executor.submit(self._generate_one, topic, product_type, patterns, create_variants): topic
+                for topic in topics
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                batch["results"].append(result)
+                if result["path"]:
+                    batch["generated"] += 1
+                    self.track_generation(result["topic"], product_type, result["length"], result["tokens"])
+        
+        batch["wall_ms"] = (time.perf_counter() - batch_start) * 1000
+        stages = {"analyze": {"count": 1, "total_ms": analyze_ms, "max_ms": analyze_ms}}
+        for result in batch["results"]:
+            for stage, ms in result["timings"].items():
+                totals = stages.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                totals["count"] += 1
+                totals["total_ms"] += ms
+                totals["max_ms"] = max(totals["max_ms"], ms)
+        batch["stages"] = stages
+        self.track_batch(len(topics), batch)
+        
+        stage_summary = ", ".join(f"{stage} {t['total_ms'] / t['count']:.0f}ms" for stage, t in stages.items())
+        logger.info(
+            f"✅ Template batch: {batch['generated']}/{len(topics)} generated in {batch['wall_ms'] / 1000:.1f}s ({stage_summary})"
+        )
+        return batch
+    
+    def _build_prompts(self, topic: str, product_type: str, patterns: Dict[str, Any]) -> Tuple[str, str]:
+        """System and user prompts for a template on topic"""
+        system_prompt = """You are an expert digital product creator specializing in high-converting product descriptions and templates.
 Generate product templates in Markdown format that match the structure and style of successful digital products.
 Focus on wealth, business, productivity, and entrepreneurship niches.
 Create compelling sales copy that converts."""
-            
-            # Build user prompt with examples
-            user_prompt = f"""Create a new digital product template for a {product_type} product in the "{topic}" niche.
+        
+        # Build user prompt with examples
+        user_prompt = f"""Create a new digital product template for a {product_type} product in the "{topic}" niche.
 
 Structure the template as a Markdown file with:
 1. Title/Name (starting with #)
@@ -821,56 +1427,99 @@ Structure the template as a Markdown file with:
 4. Detailed sections as needed
 
 """
-            
-            # Add examples from existing templates
-            if patterns["sample_content"]:
-                user_prompt += "Here are examples of successful templates:\n\n"
-                for i, sample in enumerate(patterns["sample_content"][:2], 1):
-                    user_prompt += f"Example {i}:\n"
-                    user_prompt += f"Title: {sample['title']}\n"
-                    user_prompt += f"Key Sections: {', '.join(sample['sections'][:5])}\n"
-                    user_prompt += f"Sample content:\n{sample['first_500_chars']}\n\n"
-            
-            user_prompt += f"""
+        
+        # Add examples from existing templates
+        if patterns["sample_content"]:
+            user_prompt += "Here are examples of successful templates:\n\n"
+            for i, sample in enumerate(patterns["sample_content"][:2], 1):
+                user_prompt += f"Example {i}:\n"
+                user_prompt += f"Title: {sample['title']}\n"
+                user_prompt += f"Key Sections: {', '.join(sample['sections'][:5])}\n"
+                user_prompt += f"Sample content:\n{sample['first_500_chars']}\n\n"
+        
+        user_prompt += f"""
 Create a complete, compelling template for a {topic}-themed product. 
 Make it engaging, persuasive, and ready to use. 
 Minimum 2000 characters. Include a sales blurb, structure outline, and detailed content sections.
 """
+        return system_prompt, user_prompt
+    
+    def _generate_one(self, topic: str, product_type: str, patterns: Dict[str, Any],
+                      create_variant: bool = False) -> Dict[str, Any]:
+        """Prompt, generate, validate and save one template, timing each stage (safe to run on a worker thread)"""
+        result = {"topic": topic, "path": None, "variant_path": None, "length": 0, "tokens": 0, "timings": {}, "error": None}
+        timings = result["timings"]
+        
+        def timed(stage, func, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[stage] = (time.perf_counter() - start) * 1000
+        
+        try:
+            system_prompt, user_prompt = timed("prompt", self._build_prompts, topic, product_type, patterns)
             
-            # Generate template using OpenAI
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
+            # Generate template; never cached, every run should produce a new product
+            response = timed(
+                "llm", self.llm.complete,
+                "template_generator",
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
+                model=self.model,
                 temperature=0.8,
-                max_tokens=3000
+                max_tokens=3000,
+                cache=False
             )
-            
-            generated_content = response.choices[0].message.content
+            generated_content = response.text
+            result["tokens"] = response.total_tokens
+            result["length"] = len(generated_content)
             
             # Validate before saving
-            if self.validate_template_content(generated_content):
-                # Generate filename
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                safe_topic = "".join(c for c in topic if c.isalnum() or c in (' ', '-', '_')).strip()[:30]
-                filename = f"{safe_topic.replace(' ', '_')}_{timestamp}.md"
-                
-                # Save template
-                template_path = self.save_template(generated_content, filename)
-                
-                # Track generation
-                self.track_generation(topic, product_type, len(generated_content), response.usage.total_tokens if hasattr(response, 'usage') else 0)
-                
-                logger.info(f"✅ Generated template: {filename} (topic: {topic})")
-                return template_path
-            else:
+            if not timed("validate", self.validate_template_content, generated_content):
                 logger.warning(f"Generated template failed validation (topic: {topic})")
-                return None
-                
+                result["error"] = "validation failed"
+                return result
+            
+            # Generate filename
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            safe_topic = "".join(c for c in topic if c.isalnum() or c in (' ', '-', '_')).strip()[:30]
+            # Batch jobs run concurrently, so the timestamp alone doesn't keep names unique
+            filename = f"{safe_topic.replace(' ', '_')}_{timestamp}_{uuid.uuid4().hex[:6]}.md"
+            result["path"] = timed("save", self.save_template, generated_content, filename)
+            logger.info(f"✅ Generated template: {filename} (topic: {topic})")
+            
+            if create_variant:
+                result["variant_path"] = timed("variant", self.create_variant, result["path"])
         except Exception as e:
             logger.error(f"Error generating template: {e}")
+            result["error"] = str(e)
+        return result
+    
+    def create_variant(self, template_path: Path) -> Optional[Path]:
+        """Create a variant of a template for A/B testing"""
+        if not template_path.exists():
+            return None
+        
+        try:
+            content = template_path.read_text(encoding='utf-8')
+            
+            # Simple variant: modify sales blurb slightly (could use AI for better variants)
+            # For now, create a copy with "_variant" suffix
+            variant_path = template_path.parent / f"{template_path.stem}_variant.md"
+            
+            # Add variant marker in content
+            variant_content = content.replace(
+                "Sales Blurb",
+                "Sales Blurb\n\n*Variant for A/B Testing*"
+            )
+            
+            variant_path.write_text(variant_content, encoding='utf-8')
+            return variant_path
+        except Exception as e:
+            logger.error(f"Error creating template variant: {e}")
             return None
     
     def validate_template_content(self, content: str) -> bool:
@@ -908,6 +1557,32 @@ Minimum 2000 characters. Include a sales blurb, structure outline, and detailed
         template_path.write_text(content, encoding='utf-8')
         return template_path
     
+    def track_batch(self, batch_size: int, batch: Dict[str, Any]):
+        """Record per-stage timings and throughput of a template batch"""
+        try:
+            rows = []
+            for stage, totals in batch["stages"].items():
+                metadata = json.dumps({
+                    "batch_size": batch_size,
+                    "count": totals["count"],
+                    "total_ms": round(totals["total_ms"], 1),
+                    "max_ms": round(totals["max_ms"], 1)
+                })
+                rows.append(("template_generation", f"stage_{stage}_ms", totals["total_ms"] / totals["count"], "batch", metadata))
+            metadata = json.dumps({"batch_size": batch_size, "generated": batch["generated"]})
+            rows.append(("template_generation", "batch_wall_ms", batch["wall_ms"], "batch", metadata))
+            if batch["wall_ms"] > 0:
+                rows.append(("template_generation", "templates_per_hour",
+                             batch["generated"] * 3600000 / batch["wall_ms"], "batch", metadata))
+            
+            self.cursor.executemany('''
+                INSERT INTO performance_metrics (metric_type, metric_name, value, source, metadata)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+            self.db.commit()
+        except Exception as e:
+            logger.error(f"Error tracking template batch: {e}")
+    
     def track_generation(self, topic: str, product_type: str, content_length: int, tokens_used: int):
         """Track template generation in database"""
         try:
@@ -939,12 +1614,78 @@ Minimum 2000 characters. Include a sales blurb, structure outline, and detailed
             logger.error(f"Error tracking template generation: {e}")
 
 
+class ABTestCounters:
+    """In-memory impression, conversion and revenue counters for A/B test variants
+    
+    Recording an event is one deque append, which is atomic, so threads record
+    without a lock and no increment is lost. flush() drains the events, sums
+    them per (test_id, variant_id) and adds the sums to template_ab_results with
+    one UPSERT, so the increments happen in SQL. It runs at most every
+    AB_RESULTS_FLUSH_SECONDS from the recording path, and whenever results are read.
+    """
+    UPSERT = '''
+        INSERT INTO template_ab_results (test_id, variant_id, impressions, conversions, revenue, conversion_rate)
+        VALUES (?1, ?2, ?3, ?4, ?5, CASE WHEN ?3 > 0 THEN CAST(?4 AS REAL) / ?3 ELSE 0 END)
+        ON CONFLICT(test_id, variant_id) DO UPDATE SET
+            impressions = impressions + excluded.impressions,
+            conversions = conversions + excluded.conversions,
+            revenue = revenue + excluded.revenue,
+            conversion_rate = CASE WHEN impressions + excluded.impressions > 0
+                              THEN CAST(conversions + excluded.conversions AS REAL) / (impressions + excluded.impressions)
+                              ELSE 0 END
+    '''
+    
+    def __init__(self, db_conn, flush_interval: Optional[float] = None):
+        self.db = db_conn
+        self.flush_interval = flush_interval if flush_interval is not None else CONFIG["template_optimization"]["ab_results_flush_seconds"]
+        self._events = deque()  # (test_id, variant_id, impressions, conversions, revenue)
+        self._flush_lock = threading.Lock()
+        self._next_flush = time.monotonic() + self.flush_interval
+    
+    def add(self, test_id: int, variant_id: str, impressions: int = 0, conversions: int = 0, revenue: float = 0.0):
+        """Count an event; written to the database on the next flush"""
+        self._events.append((test_id, variant_id, impressions, conversions, revenue))
+        if time.monotonic() >= self._next_flush:
+            self.flush(wait=False)
+    
+    def flush(self, wait: bool = True) -> bool:
+        """Add everything counted since the last flush to template_ab_results
+        
+        With wait=False the call returns at once if another thread is flushing.
+        Sums that could not be written are kept for the next flush.
+        """
+        if not self._flush_lock.acquire(blocking=wait):
+            return True
+        try:
+            self._next_flush = time.monotonic() + self.flush_interval
+            totals = {}  # (test_id, variant_id) -> [impressions, conversions, revenue]
+            while self._events:
+                test_id, variant_id, impressions, conversions, revenue = self._events.popleft()
+                total = totals.setdefault((test_id, variant_id), [0, 0, 0.0])
+                total[0] += impressions
+                total[1] += conversions
+                total[2] += revenue
+            if not totals:
+                return True
+            try:
+                with self.db:
+                    self.db.executemany(self.UPSERT, [(test_id, variant_id, *total) for (test_id, variant_id), total in totals.items()])
+                return True
+            except Exception as e:
+                logger.error(f"Error saving A/B test results: {e}")
+                self._events.extend((test_id, variant_id, *total) for (test_id, variant_id), total in totals.items())
+                return False
+        finally:
+            self._flush_lock.release()
+
+
 class TemplateABTesting:
     """A/B testing system for template variants"""
-    def __init__(self, db_conn):
+    def __init__(self, db_conn, flush_interval: Optional[float] = None):
         self.db = db_conn
         self.cursor = db_conn.cursor()
         self.products_dir = Path("./products")
+        self.counters = ABTestCounters(db_conn, flush_interval)
     
     def create_ab_test(self, template_a_path: Path, template_b_path: Path, test_name: str) -> Optional[int]:
         """Create a new A/B test"""
@@ -985,68 +1726,21 @@ class TemplateABTesting:
     
     def record_conversion(self, test_id: int, variant_id: str, sale_amount: float) -> bool:
         """Record a conversion for a specific variant"""
-        try:
-            # Get or create result row for this variant
-            self.cursor.execute('''
-                SELECT id, conversions, revenue FROM template_ab_results
-                WHERE test_id = ? AND variant_id = ?
-                ORDER BY date DESC LIMIT 1
-            ''', (test_id, variant_id))
-            
-            result = self.cursor.fetchone()
-            if result:
-                result_id, conversions, revenue = result
-                self.cursor.execute('''
-                    UPDATE template_ab_results
-                    SET conversions = ?, revenue = ?, conversion_rate = 
-                        CASE WHEN impressions > 0 THEN CAST(conversions AS REAL) / impressions ELSE 0 END
-                    WHERE id = ?
-                ''', (conversions + 1, revenue + sale_amount, result_id))
-            else:
-                # Create new result row
-                self.cursor.execute('''
-                    INSERT INTO template_ab_results (test_id, variant_id, conversions, revenue)
-                    VALUES (?, ?, ?, ?)
-                ''', (test_id, variant_id, 1, sale_amount))
-            
-            self.db.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Error recording conversion: {e}")
-            return False
+        self.counters.add(test_id, variant_id, conversions=1, revenue=sale_amount or 0.0)
+        return True
     
-    def record_impression(self, test_id: int, variant_id: str) -> bool:
-        """Record an impression (product created/viewed) for a variant"""
-        try:
-            self.cursor.execute('''
-                SELECT id, impressions FROM template_ab_results
-                WHERE test_id = ? AND variant_id = ?
-                ORDER BY date DESC LIMIT 1
-            ''', (test_id, variant_id))
-            
-            result = self.cursor.fetchone()
-            if result:
-                result_id, impressions = result
-                self.cursor.execute('''
-                    UPDATE template_ab_results
-                    SET impressions = ?, conversion_rate = 
-                        CASE WHEN impressions > 0 THEN CAST(conversions AS REAL) / impressions ELSE 0 END
-                    WHERE id = ?
-                ''', (impressions + 1, result_id))
-            else:
-                self.cursor.execute('''
-                    INSERT INTO template_ab_results (test_id, variant_id, impressions)
-                    VALUES (?, ?, ?)
-                ''', (test_id, variant_id, 1))
-            
-            self.db.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Error recording impression: {e}")
-            return False
+    def record_impression(self, test_id: int, variant_id: str, count: int = 1) -> bool:
+        """Record impressions (social posts distributed from the variant) for a variant"""
+        self.counters.add(test_id, variant_id, impressions=count)
+        return True
+    
+    def flush(self) -> bool:
+        """Write recorded impressions and conversions to template_ab_results"""
+        return self.counters.flush()
     
     def get_test_results(self, test_id: int) -> Dict[str, Any]:
         """Get performance metrics for an A/B test"""
+        self.flush()
         try:
             self.cursor.execute('''
                 SELECT variant_id, 
@@ -1077,52 +1771,171 @@ class TemplateABTesting:
             return {}
     
     def determine_winner(self, test_id: int, min_conversions: int = 10) -> Optional[str]:
-        """Determine the winning variant using statistical analysis"""
+        """Determine the winning variant using the Bayesian decision rule of evaluate_active_tests"""
         try:
             results = self.get_test_results(test_id)
-            if len(results) < 2:
-                return None
-            
             variant_a = results.get("A")
             variant_b = results.get("B")
-            
             if not variant_a or not variant_b:
                 return None
             
-            # Check if we have minimum conversions
-            total_conversions = variant_a["conversions"] + variant_b["conversions"]
-            if total_conversions < min_conversions:
-                return None
-            
-            # Statistical significance test (simple t-test approximation)
-            conv_a, imp_a = variant_a["conversions"], variant_a["impressions"]
-            conv_b, imp_b = variant_b["conversions"], variant_b["impressions"]
-            
-            if imp_a == 0 or imp_b == 0:
-                return None
-            
-            rate_a = conv_a / imp_a if imp_a > 0 else 0
-            rate_b = conv_b / imp_b if imp_b > 0 else 0
-            
-            # Simple winner determination (rate difference > 20% or revenue advantage)
-            revenue_diff = variant_b["revenue"] - variant_a["revenue"]
-            
-            if rate_b > rate_a * 1.2 or (rate_b > rate_a and revenue_diff > 0):
-                return "B"
-            elif rate_a > rate_b * 1.2 or (rate_a > rate_b and revenue_diff < 0):
-                return "A"
-            
-            # If rates are close, use revenue as tiebreaker
-            if revenue_diff > 0:
-                return "B"
-            elif revenue_diff < 0:
-                return "A"
-            
-            return None
+            counts = {
+                key: np.array([[variant_a[key]], [variant_b[key]]], dtype=float)
+                for key in ("impressions", "conversions", "revenue")
+            }
+            evaluation = self.compare_variants(counts["impressions"], counts["conversions"], counts["revenue"])
+            winners = self._decide(evaluation, counts["conversions"].sum(axis=0), min_conversions)
+            return str(winners[0]) or None
         except Exception as e:
             logger.error(f"Error determining winner: {e}")
             return None
     
+    @staticmethod
+    def _normal_cdf(z: np.ndarray) -> np.ndarray:
+        """Standard normal CDF (Abramowitz-Stegun 7.1.26 erf, |error| < 1.5e-7), vectorized"""
+        x = np.abs(z) / math.sqrt(2)
+        t = 1 / (1 + 0.3275911 * x)
+        poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+        erf = 1 - poly * np.exp(-x * x)
+        return 0.5 * (1 + np.sign(z) * erf)
+    
+    @classmethod
+    def compare_variants(cls, impressions: np.ndarray, conversions: np.ndarray, revenue: np.ndarray) -> Dict[str, np.ndarray]:
+        """Posterior comparison of variants A (row 0) and B (row 1) for any number of tests (columns) at once
+        
+        Each variant's conversion rate gets a Beta(1 + conversions, 1 + misses)
+        posterior, scaled by its average sale value (the test's pooled value
+        while a variant has no sales yet), so variants are compared on revenue
+        per impression. The difference of the two is approximated by a normal
+        with the posteriors' exact means and variances, which gives
+        P(B beats A) and each choice's expected loss in closed form.
+        """
+        alpha = 1 + conversions
+        beta = 1 + np.maximum(impressions - conversions, 0)
+        total = alpha + beta
+        rate_mean = alpha / total
+        rate_var = alpha * beta / (total * total * (total + 1))
+        
+        pooled_value = np.divide(revenue.sum(axis=0), conversions.sum(axis=0),
+                                 out=np.ones(revenue.shape[1]), where=(conversions.sum(axis=0) > 0) & (revenue.sum(axis=0) > 0))
+        value = np.where((conversions > 0) & (revenue > 0), np.divide(revenue, np.maximum(conversions, 1)), pooled_value)
+        
+        mean = value * rate_mean
+        diff = mean[1] - mean[0]
+        spread = np.sqrt(value[0] ** 2 * rate_var[0] + value[1] ** 2 * rate_var[1])
+        z = diff / spread
+        density = np.exp(-0.5 * z * z) / math.sqrt(2 * math.pi)
+        prob_b = cls._normal_cdf(z)
+        return {
+            "mean_a": mean[0],
+            "mean_b": mean[1],
+            "prob_b_beats_a": prob_b,
+            # E[max(other - chosen, 0)] for choosing A and for choosing B
+            "expected_loss_a": diff * prob_b + spread * density,
+            "expected_loss_b": -diff * (1 - prob_b) + spread * density,
+        }
+    
+    @staticmethod
+    def _decide(evaluation: Dict[str, np.ndarray], total_conversions: np.ndarray, min_conversions: int,
+                confidence: float = None, max_expected_loss: float = None) -> np.ndarray:
+        """Winning variant per test ("A", "B" or "") under the confidence and expected-loss thresholds"""
+        opt_config = CONFIG["template_optimization"]
+        confidence = confidence if confidence is not None else opt_config["ab_test_confidence"]
+        max_expected_loss = max_expected_loss if max_expected_loss is not None else opt_config["ab_test_max_expected_loss"]
+        enough_data = total_conversions >= min_conversions
+        prob_b = evaluation["prob_b_beats_a"]
+        b_wins = enough_data & (prob_b >= confidence) & (evaluation["expected_loss_b"] <= max_expected_loss * evaluation["mean_b"])
+        a_wins = enough_data & (1 - prob_b >= confidence) & (evaluation["expected_loss_a"] <= max_expected_loss * evaluation["mean_a"])
+        return np.where(b_wins, "B", np.where(a_wins, "A", ""))
+    
+    def evaluate_active_tests(self, min_conversions: Optional[int] = None, confidence: Optional[float] = None,
+                              max_expected_loss: Optional[float] = None, close: bool = True) -> List[Dict[str, Any]]:
+        """Evaluate every active A/B test at once and close the ones with a clear winner
+        
+        Loads all active tests' impression, conversion and revenue totals in one
+        grouped query, runs compare_variants over all of them as arrays, and
+        declares a winner where P(winner is better) >= AB_TEST_CONFIDENCE and
+        its expected loss is at most AB_TEST_MAX_EXPECTED_LOSS of its value,
+        once the test has AB_TEST_MIN_CONVERSIONS. Winners are written back in
+        one batch. Returns one evaluation per test that has results for both variants.
+        """
+        min_conversions = min_conversions if min_conversions is not None else CONFIG["template_optimization"]["ab_test_min_conversions"]
+        self.flush()
+        try:
+            # One row per test with both variants' totals side by side
+            self.cursor.execute('''
+                SELECT t.id, t.template_a_id, t.template_b_id,
+                       TOTAL(CASE WHEN r.variant_id = 'A' THEN r.impressions END),
+                       TOTAL(CASE WHEN r.variant_id = 'B' THEN r.impressions END),
+                       TOTAL(CASE WHEN r.variant_id = 'A' THEN r.conversions END),
+                       TOTAL(CASE WHEN r.variant_id = 'B' THEN r.conversions END),
+                       TOTAL(CASE WHEN r.variant_id = 'A' THEN r.revenue END),
+                       TOTAL(CASE WHEN r.variant_id = 'B' THEN r.revenue END)
+                FROM template_ab_tests t
+                JOIN template_ab_results r ON r.test_id = t.id
+                WHERE t.status = 'active'
+                GROUP BY t.id
+                HAVING COUNT(CASE WHEN r.variant_id = 'A' THEN 1 END) > 0
+                   AND COUNT(CASE WHEN r.variant_id = 'B' THEN 1 END) > 0
+            ''')
+            rows = self.cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error loading A/B test results: {e}")
+            return []
+        if not rows:
+            return []
+        
+        test_ids, template_a_ids, template_b_ids = zip(*(row[:3] for row in rows))
+        counts = np.array([row[3:] for row in rows], dtype=float).T.reshape(3, 2, len(rows))
+        impressions, conversions, revenue = counts  # each (A, B) x test
+        
+        evaluation = self.compare_variants(impressions, conversions, revenue)
+        winners = self._decide(evaluation, conversions.sum(axis=0), min_conversions, confidence, max_expected_loss)
+        
+        results = []
+        columns = zip(test_ids, template_a_ids, template_b_ids, winners.tolist(),
+                      impressions.T.astype(int).tolist(), conversions.T.astype(int).tolist(), revenue.T.tolist(),
+                      evaluation["prob_b_beats_a"].tolist(),
+                      evaluation["expected_loss_a"].tolist(), evaluation["expected_loss_b"].tolist())
+        for test_id, template_a_id, template_b_id, winner, imps, convs, revs, prob_b, loss_a, loss_b in columns:
+            results.append({
+                "test_id": test_id,
+                "impressions": {"A": imps[0], "B": imps[1]},
+                "conversions": {"A": convs[0], "B": convs[1]},
+                "revenue": {"A": revs[0], "B": revs[1]},
+                "prob_b_beats_a": prob_b,
+                "expected_loss": {"A": loss_a, "B": loss_b},
+                "winner": winner or None,
+                "winner_id": (template_a_id if winner == "A" else template_b_id) if winner else None,
+            })
+        
+        if close:
+            self._close_tests([r for r in results if r["winner"]])
+        return results
+    
+    def _close_tests(self, decided: List[Dict[str, Any]]):
+        """Mark decided tests completed with their winner and the evidence, in one transaction"""
+        if not decided:
+            return
+        end_date = datetime.now()
+        try:
+            with self.db:
+                self.cursor.executemany('''
+                    UPDATE template_ab_tests
+                    SET status = 'completed', winner_id = ?, end_date = ?, metadata = ?
+                    WHERE id = ? AND status = 'active'
+                ''', [(r["winner_id"], end_date, json.dumps({
+                    "prob_b_beats_a": round(r["prob_b_beats_a"], 6),
+                    "expected_loss": r["expected_loss"],
+                    "conversions": r["conversions"],
+                    "impressions": r["impressions"]
+                }), r["test_id"]) for r in decided])
+            for r in decided:
+                logger.info(f"✅ A/B test {r['test_id']} completed. Winner: {r['winner_id']} "
+                            f"(P(B>A)={r['prob_b_beats_a']:.3f})")
+        except Exception as e:
+            logger.error(f"Error closing A/B tests: {e}")
+    
     def apply_winner(self, test_id: int) -> bool:
         """Mark test as complete and apply winning template"""
         try:
@@ -1144,7 +1957,7 @@ class TemplateABTesting:
                 UPDATE template_ab_tests
                 SET status = 'completed', winner_id = ?, end_date = ?
                 WHERE id = ?
-            ''', ("completed", winner_id, datetime.now(), test_id))
+            ''', (winner_id, datetime.now(), test_id))
             
             self.db.commit()
             logger.info(f"✅ A/B test {test_id} completed. Winner: {winner_id}")
@@ -1154,6 +1967,124 @@ class TemplateABTesting:
             return False
 
 
+class TemplateBandit:
+    """Thompson-sampling traffic allocation across the variants of active template tests
+    
+    Each variant's posterior (impressions, conversions, revenue) is kept in
+    memory, seeded from template_ab_results, so a decision is one Beta draw
+    per variant: the variant with the highest sampled revenue per impression
+    gets the traffic. Traffic therefore drifts toward better variants as
+    evidence comes in, long before evaluate_active_tests can close the test.
+    Events are also recorded through TemplateABTesting, whose counters write
+    them to the database.
+    """
+    def __init__(self, ab_testing: TemplateABTesting, seed: Optional[int] = None):
+        self.ab_testing = ab_testing
+        self.db = ab_testing.db
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._arms = {}  # test_id -> [[variant_id, template_id, impressions, conversions, revenue], ...]
+        self._template_arms = {}  # template_id -> (test_id, variant_id)
+        self.refresh()
+    
+    def refresh(self):
+        """Flush recorded counts, then reload the active tests' variants and totals in one query"""
+        self.ab_testing.flush()
+        try:
+            rows = self.db.execute('''
+                SELECT v.test_id, v.variant_id, v.template_id,
+                       TOTAL(r.impressions), TOTAL(r.conversions), TOTAL(r.revenue)
+                FROM (
+                    SELECT id AS test_id, 'A' AS variant_id, template_a_id AS template_id FROM template_ab_tests WHERE status = 'active'
+                    UNION ALL
+                    SELECT id, 'B', template_b_id FROM template_ab_tests WHERE status = 'active'
+                ) v
+                LEFT JOIN template_ab_results r ON r.test_id = v.test_id AND r.variant_id = v.variant_id
+                GROUP BY v.test_id, v.variant_id
+                ORDER BY v.test_id, v.variant_id
+            ''').fetchall()
+        except Exception as e:
+            logger.error(f"Error loading bandit state: {e}")
+            return
+        arms, template_arms = {}, {}
+        for test_id, variant_id, template_id, impressions, conversions, revenue in rows:
+            arms.setdefault(test_id, []).append([variant_id, template_id, impressions, conversions, revenue])
+            template_arms[template_id] = (test_id, variant_id)
+        with self._lock:
+            self._arms = arms
+            self._template_arms = template_arms
+    
+    def arm_for_template(self, template_id: str) -> Optional[Tuple[int, str]]:
+        """(test_id, variant_id) of the active test variant built from template_id, if any"""
+        return self._template_arms.get(template_id)
+    
+    def choose(self, test_id: int, template_ids: Optional[Iterable[str]] = None) -> Optional[Tuple[str, str]]:
+        """Thompson-sample the variant to use for test_id, as (variant_id, template_id)
+        
+        template_ids restricts the draw to the variants that are actually
+        available (e.g. whose files exist). Conversion rates are drawn from
+        Beta(1 + conversions, 1 + misses) and scaled by each variant's average
+        sale value (the test's pooled value while a variant has no sales).
+        """
+        with self._lock:
+            arms = self._arms.get(test_id)
+            if not arms:
+                return None
+            if template_ids is not None:
+                allowed = set(template_ids)
+                arms = [arm for arm in arms if arm[1] in allowed]
+                if not arms:
+                    return None
+            total_conversions = sum(arm[3] for arm in arms)
+            total_revenue = sum(arm[4] for arm in arms)
+            pooled_value = total_revenue / total_conversions if total_conversions > 0 and total_revenue > 0 else 1.0
+            best, best_score = None, -1.0
+            for arm in arms:
+                _, _, impressions, conversions, revenue = arm
+                value = revenue / conversions if conversions > 0 and revenue > 0 else pooled_value
+                score = value * self._rng.betavariate(1 + conversions, 1 + max(impressions - conversions, 0))
+                if score > best_score:
+                    best, best_score = arm, score
+            return best[0], best[1]
+    
+    def allocate(self, content_files: Iterable[Path]) -> List[Path]:
+        """Content files to use this round: one Thompson-sampled variant per active test, everything else as-is"""
+        content_files = list(content_files)
+        by_test = {}  # test_id -> {template_id: content file}
+        selected = []
+        for content_file in content_files:
+            arm = self._template_arms.get(content_file.stem)
+            if arm:
+                by_test.setdefault(arm[0], {})[content_file.stem] = content_file
+            else:
+                selected.append(content_file)
+        for test_id, files in by_test.items():
+            choice = self.choose(test_id, files)
+            if choice:
+                selected.append(files[choice[1]])
+        return sorted(selected)
+    
+    def record_impression(self, test_id: int, variant_id: str, count: int = 1):
+        """Count traffic sent to a variant"""
+        self._update(test_id, variant_id, count, 0, 0.0)
+        self.ab_testing.record_impression(test_id, variant_id, count)
+    
+    def record_conversion(self, test_id: int, variant_id: str, sale_amount: float):
+        """Count a sale of a variant"""
+        self._update(test_id, variant_id, 0, 1, sale_amount or 0.0)
+        self.ab_testing.record_conversion(test_id, variant_id, sale_amount)
+    
+    def _update(self, test_id: int, variant_id: str, impressions: int, conversions: int, revenue: float):
+        """Fold an event into the in-memory posterior"""
+        with self._lock:
+            for arm in self._arms.get(test_id, ()):
+                if arm[0] == variant_id:
+                    arm[2] += impressions
+                    arm[3] += conversions
+                    arm[4] += revenue
+                    break
+
+
 class TrendAnalyzer:
     """Analyze trends from social media and keyword sources"""
     def __init__(self, db_conn):
@@ -1385,18 +2316,93 @@ class TrendAnalyzer:
 
 class TemplateOptimizer:
     """Optimize templates based on sales performance data"""
-    def __init__(self, db_conn):
+    def __init__(self, db_conn, corpus: Optional[TemplateCorpusIndex] = None):
         self.db = db_conn
         self.cursor = db_conn.cursor()
         self.products_dir = Path("./products")
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        self.client = None
+        self.corpus = corpus or TemplateCorpusIndex(db_conn, self.products_dir)
+        self.model = os.getenv("TEMPLATE_OPTIMIZATION_MODEL", "gpt-4-turbo-preview")
+        self.llm = get_gateway()
+        self._performance_view = None  # (catalog version, view)
+        self._performance_lock = threading.Lock()
+    
+    def _catalog_version(self) -> Tuple:
+        """Cheap fingerprint of the template-backed product rows the performance view is built from"""
+        self.cursor.execute('''
+            SELECT COUNT(*), MAX(id), TOTAL(sales_count), TOTAL(total_revenue), TOTAL(price)
+            FROM products
+            WHERE template_id IS NOT NULL
+        ''')
+        return tuple(self.cursor.fetchone())
+    
+    def performance_view(self) -> Dict[str, Any]:
+        """Per-template sales aggregates from one grouped query, cached per catalog version
+        
+        Returns {"templates": {template_id: metrics}, "summary": {...}}. Metrics
+        are the analyze_template_performance fields plus revenue_percentile (rank
+        of the template's revenue among all templates, 0-100) and
+        revenue_trend_slope: the least-squares change in revenue per product for
+        each day later a product was created, negative when newer products from
+        the template earn less.
+        """
+        version = self._catalog_version()
+        with self._performance_lock:
+            if self._performance_view and self._performance_view[0] == version:
+                return self._performance_view[1]
+        
+        # x = product age in days (negative), so the slope is revenue per day of creation date
+        self.cursor.execute('''
+            SELECT template_id, COUNT(*), TOTAL(sales_count), TOTAL(total_revenue), AVG(price),
+                   COUNT(x), TOTAL(x), TOTAL(CASE WHEN x IS NOT NULL THEN revenue END), TOTAL(x * x), TOTAL(x * revenue)
+            FROM (
+                SELECT template_id, sales_count, price, total_revenue,
+                       COALESCE(total_revenue, 0) AS revenue,
+                       julianday(created_date) - julianday('now') AS x
+                FROM products
+                WHERE template_id IS NOT NULL
+            )
+            GROUP BY template_id
+        ''')
+        templates = {}
+        trend_sums = {}  # template_id -> (n, sum x, sum y, sum x^2, sum xy) over dated products
+        for template_id, product_count, total_sales, total_revenue, avg_price, *sums in self.cursor.fetchall():
+            templates[template_id] = {
+                "template_id": template_id,
+                "product_count": product_count,
+                "total_sales": int(total_sales),
+                "total_revenue": total_revenue,
+                "avg_price": avg_price or 0.0,
+                "avg_revenue_per_product": total_revenue / product_count,
+                "avg_sales_per_product": total_sales / product_count,
+            }
+            trend_sums[template_id] = sums
+        
+        summary = {"template_count": len(templates), "product_count": 0, "total_revenue": 0.0,
+                   "avg_product_revenue": 0.0, "revenue_percentiles": {}}
+        if templates:
+            ids = list(templates)
+            revenue = np.array([templates[t]["total_revenue"] for t in ids])
+            # Percentile rank: share of templates earning less, counting ties as half
+            ordered = np.sort(revenue)
+            ranks = (np.searchsorted(ordered, revenue, side="left") + np.searchsorted(ordered, revenue, side="right")) / 2
+            for template_id, rank in zip(ids, ranks):
+                metrics = templates[template_id]
+                metrics["revenue_percentile"] = float(100 * rank / len(ids))
+                n, sx, sy, sxx, sxy = trend_sums[template_id]
+                denominator = n * sxx - sx * sx
+                # Products created within the same instant carry no trend
+                metrics["revenue_trend_slope"] = float((n * sxy - sx * sy) / denominator) if n > 1 and denominator > 1e-9 else 0.0
+            summary["product_count"] = int(sum(t["product_count"] for t in templates.values()))
+            summary["total_revenue"] = float(revenue.sum())
+            summary["avg_product_revenue"] = summary["total_revenue"] / summary["product_count"]
+            summary["revenue_percentiles"] = {
+                f"p{q}": float(v) for q, v in zip((25, 50, 75, 90), np.percentile(revenue, [25, 50, 75, 90]))
+            }
         
-        if OPENAI_AVAILABLE and self.api_key:
-            try:
-                self.client = OpenAI(api_key=self.api_key)
-            except Exception as e:
-                logger.warning(f"OpenAI initialization failed for optimizer: {e}")
+        view = {"templates": templates, "summary": summary}
+        with self._performance_lock:
+            self._performance_view = (version, view)
+        return view
     
     def analyze_template_performance(self, template_path: Path) -> Dict[str, Any]:
         """Analyze sales performance for a template"""
@@ -1405,75 +2411,48 @@ class TemplateOptimizer:
         
         try:
             template_id = template_path.stem
-            
-            # Get products created from this template
-            self.cursor.execute('''
-                SELECT 
-                    COUNT(*) as product_count,
-                    SUM(sales_count) as total_sales,
-                    SUM(total_revenue) as total_revenue,
-                    AVG(price) as avg_price
-                FROM products
-                WHERE template_id = ?
-            ''', (template_id,))
-            
-            row = self.cursor.fetchone()
-            if not row:
-                return {}
-            
-            product_count, total_sales, total_revenue, avg_price = row
-            
-            # Calculate metrics
-            avg_revenue_per_product = (total_revenue or 0) / product_count if product_count > 0 else 0
-            avg_sales_per_product = (total_sales or 0) / product_count if product_count > 0 else 0
-            
+            metrics = self.performance_view()["templates"].get(template_id)
+            if metrics:
+                return dict(metrics)
             return {
                 "template_id": template_id,
-                "product_count": product_count or 0,
-                "total_sales": total_sales or 0,
-                "total_revenue": total_revenue or 0.0,
-                "avg_price": avg_price or 0.0,
-                "avg_revenue_per_product": avg_revenue_per_product,
-                "avg_sales_per_product": avg_sales_per_product
+                "product_count": 0,
+                "total_sales": 0,
+                "total_revenue": 0.0,
+                "avg_price": 0.0,
+                "avg_revenue_per_product": 0,
+                "avg_sales_per_product": 0
             }
         except Exception as e:
             logger.error(f"Error analyzing template performance: {e}")
             return {}
     
     def identify_underperforming_templates(self, threshold: float = None) -> List[Dict[str, Any]]:
-        """Find templates performing below threshold"""
+        """Find templates performing below threshold, worst first
+        
+        A template underperforms when its total revenue is below threshold times
+        the average revenue per template-backed product. Served entirely from
+        the cached performance view.
+        """
         threshold = threshold or CONFIG["template_optimization"]["optimization_threshold"]
         
         try:
-            # Get average performance across all templates
-            self.cursor.execute('''
-                SELECT AVG(total_revenue) as avg_revenue
-                FROM products
-                WHERE template_id IS NOT NULL
-            ''')
-            
-            row = self.cursor.fetchone()
-            avg_revenue = (row[0] or 0.0) if row else 0.0
-            threshold_revenue = avg_revenue * threshold
-            
-            # Find underperforming templates
-            self.cursor.execute('''
-                SELECT template_id, SUM(total_revenue) as total_revenue, COUNT(*) as product_count
-                FROM products
-                WHERE template_id IS NOT NULL
-                GROUP BY template_id
-                HAVING SUM(total_revenue) < ?
-            ''', (threshold_revenue,))
+            view = self.performance_view()
+            threshold_revenue = view["summary"]["avg_product_revenue"] * threshold
             
+            self.corpus.refresh()
             underperforming = []
-            for row in self.cursor.fetchall():
-                template_id, revenue, count = row
-                template_path = self.products_dir / f"{template_id}.md"
-                if template_path.exists():
-                    performance = self.analyze_template_performance(template_path)
+            for template_id, metrics in view["templates"].items():
+                if metrics["total_revenue"] >= threshold_revenue:
+                    continue
+                # Only Markdown templates can be rewritten; PDF products are left alone
+                entry = self.corpus.get(template_id, refresh=False)
+                if entry and entry["format"] == "md":
+                    performance = dict(metrics)
                     performance["threshold_revenue"] = threshold_revenue
                     underperforming.append(performance)
             
+            underperforming.sort(key=lambda p: (p["total_revenue"], p["revenue_trend_slope"]))
             return underperforming
         except Exception as e:
             logger.error(f"Error identifying underperforming templates: {e}")
@@ -1494,35 +2473,36 @@ class TemplateOptimizer:
         """Extract successful elements from high-performing templates"""
         try:
             # Get top performing templates
-            self.cursor.execute('''
-                SELECT template_id, SUM(total_revenue) as total_revenue, COUNT(*) as product_count
-                FROM products
-                WHERE template_id IS NOT NULL AND total_revenue > 0
-                GROUP BY template_id
-                ORDER BY total_revenue DESC
-                LIMIT 5
-            ''')
+            earning = [m for m in self.performance_view()["templates"].values() if m["total_revenue"] > 0]
+            earning.sort(key=lambda m: m["total_revenue"], reverse=True)
             
+            self.corpus.refresh()
             top_templates = []
-            for row in self.cursor.fetchall():
-                template_id, revenue, count = row
-                template_path = self.products_dir / f"{template_id}.md"
-                if template_path.exists():
-                    try:
-                        content = template_path.read_text(encoding='utf-8')
-                        top_templates.append({
-                            "template_id": template_id,
-                            "revenue": revenue,
-                            "product_count": count,
-                            "content": content[:2000]  # First 2000 chars
-                        })
-                    except Exception as e:
-                        logger.warning(f"Error reading template {template_id}: {e}")
+            for metrics in earning[:5]:
+                template_id, revenue, count = metrics["template_id"], metrics["total_revenue"], metrics["product_count"]
+                entry = self.corpus.get(template_id, refresh=False)
+                if not entry:
+                    continue
+                content = self.corpus.read(template_id, 2000, refresh=False)  # First 2000 chars
+                if content is None:
+                    continue
+                top_templates.append({
+                    "template_id": template_id,
+                    "revenue": revenue,
+                    "product_count": count,
+                    "content": content,
+                    "length": entry["length"],
+                    "sections": entry["sections"]
+                })
             
-            # Extract common patterns (simple analysis)
+            # Extract common patterns (sections shared by at least 2 top templates)
+            section_counts = {}
+            for t in top_templates:
+                for section in dict.fromkeys(t["sections"]):
+                    section_counts[section] = section_counts.get(section, 0) + 1
             common_elements = {
-                "avg_length": sum(len(t.get("content", "")) for t in top_templates) / len(top_templates) if top_templates else 0,
-                "sections": [],
+                "avg_length": sum(t["length"] for t in top_templates) / len(top_templates) if top_templates else 0,
+                "sections": [section for section, count in section_counts.items() if count >= 2],
                 "keywords": []
             }
             
@@ -1536,8 +2516,8 @@ class TemplateOptimizer:
     
     def optimize_template(self, template_path: Path, performance_data: Dict[str, Any] = None) -> Optional[Path]:
         """Generate an optimized version of a template using AI"""
-        if not self.client:
-            logger.warning("OpenAI client not available for template optimization")
+        if not self.llm.is_available():
+            logger.warning("LLM gateway not available for template optimization")
             return None
         
         if not template_path.exists():
@@ -1551,8 +2531,12 @@ class TemplateOptimizer:
             # Get winning elements from top templates
             winning_elements = self.extract_winning_elements()
             
-            # Read current template
-            current_content = template_path.read_text(encoding='utf-8')
+            # Read current template (only the first 1500 chars go into the prompt)
+            current_content = None
+            if template_path.parent == self.corpus.products_dir:
+                current_content = self.corpus.read(template_path.stem, 1500)
+            if current_content is None:
+                current_content = template_path.read_text(encoding='utf-8')[:1500]
             
             # Build optimization prompt
             prompt = f"""You are optimizing a digital product template based on sales performance data.
@@ -1573,18 +2557,19 @@ Analyze the current template and create an improved version that:
 
 Return ONLY the optimized template content in markdown format, following the same structure as the original."""
 
-            # Generate optimized version using OpenAI
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
+            # Generate optimized version (cached: same template and numbers give the same prompt)
+            response = self.llm.complete(
+                "template_optimizer",
+                [
                     {"role": "system", "content": "You are an expert at optimizing digital product templates for sales performance."},
                     {"role": "user", "content": prompt}
                 ],
+                model=self.model,
                 max_tokens=3000,
                 temperature=0.7
             )
             
-            optimized_content = response.choices[0].message.content.strip()
+            optimized_content = response.text.strip()
             
             # Save optimized template
             optimized_filename = f"{template_path.stem}_optimized_{datetime.now().strftime('%Y%m%d')}.md"
@@ -1833,13 +2818,133 @@ class LeadBot:
 
 class AffiliateManager:
     """REAL affiliate automation - manages campaigns and generates revenue"""
-    def __init__(self, marketing_agent_url: Optional[str] = None):
+    def __init__(self, marketing_agent_url: Optional[str] = None, db_conn=None):
         self.marketing_agent_url = marketing_agent_url or os.getenv('MARKETING_AGENT_URL', 'http://localhost:9000')
         self.campaigns = []
         self.performance = {}
+        self.db = db_conn
+        # (campaign_id, destination_url, user_id) -> short URL; LRU front for the affiliate_links table
+        self._link_cache = OrderedDict()
+        self._link_cache_size = int(os.getenv('AFFILIATE_LINK_CACHE_SIZE', '5000'))
+        self._link_cache_lock = threading.Lock()
+        
+        # Campaign indexes; self.campaigns keeps creation order for iteration
+        self._campaigns_by_id = {}
+        self._campaigns_by_url = {}
+        
+        if self.db:
+            self._ensure_tables()
+            self._load_campaigns()
+    
+    def _ensure_tables(self):
+        """Create the campaign registry and affiliate link cache tables if they don't exist"""
+        cursor = self.db.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS affiliate_campaigns (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                product_url TEXT,
+                commission_rate REAL DEFAULT 0.30,
+                marketing_agent_id INTEGER,
+                created DATETIME DEFAULT CURRENT_TIMESTAMP,
+                clicks INTEGER DEFAULT 0,
+                conversions INTEGER DEFAULT 0,
+                revenue REAL DEFAULT 0.0,
+                commissions REAL DEFAULT 0.0
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_affiliate_campaigns_product_url ON affiliate_campaigns (product_url)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS affiliate_links (
+                campaign_id TEXT NOT NULL,
+                destination_url TEXT NOT NULL,
+                user_id TEXT NOT NULL DEFAULT '',
+                short_url TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (campaign_id, destination_url, user_id)
+            )
+        ''')
+        self.db.commit()
+    
+    def _get_cached_link(self, key: Tuple[str, str, str]) -> Optional[str]:
+        """Look up a short URL in the in-memory LRU, falling back to engine.db"""
+        with self._link_cache_lock:
+            if key in self._link_cache:
+                self._link_cache.move_to_end(key)
+                return self._link_cache[key]
+        if not self.db:
+            return None
+        try:
+            row = self.db.cursor().execute(
+                'SELECT short_url FROM affiliate_links WHERE campaign_id = ? AND destination_url = ? AND user_id = ?',
+                key
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Affiliate link cache lookup failed: {e}")
+            return None
+        if row:
+            self._remember_link(key, row[0])
+            return row[0]
+        return None
+    
+    def _remember_link(self, key: Tuple[str, str, str], short_url: str):
+        """Insert into the in-memory LRU, evicting the least recently used entry"""
+        with self._link_cache_lock:
+            self._link_cache[key] = short_url
+            self._link_cache.move_to_end(key)
+            while len(self._link_cache) > self._link_cache_size:
+                self._link_cache.popitem(last=False)
+    
+    def _store_links(self, links: Dict[Tuple[str, str, str], str]):
+        """Cache newly created short URLs in memory and persist them to engine.db"""
+        for key, short_url in links.items():
+            self._remember_link(key, short_url)
+        if not self.db or not links:
+            return
+        try:
+            self.db.cursor().executemany(
+                'INSERT OR REPLACE INTO affiliate_links (campaign_id, destination_url, user_id, short_url) VALUES (?, ?, ?, ?)',
+                [(*key, short_url) for key, short_url in links.items()]
+            )
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not persist affiliate links: {e}")
     
     def create_campaign(self, name: str, product_url: str, commission_rate: float = 0.30) -> str:
-        """Create a real affiliate campaign via Marketing Agent API"""
+        """Create a real affiliate campaign via Marketing Agent API
+        
+        Campaigns are unique per product URL: an existing campaign is returned
+        as-is, and a local-only campaign is registered with the Marketing Agent
+        when it becomes reachable instead of being duplicated.
+        """
+        existing = self._campaigns_by_url.get(product_url)
+        if existing and existing.get("marketing_agent_id"):
+            return existing["id"]
+        marketing_agent_id = self._register_remote_campaign(name, product_url)
+        if existing:
+            if marketing_agent_id is not None:
+                existing["marketing_agent_id"] = marketing_agent_id
+                self._save_campaign(existing)
+                logger.info(f"Registered affiliate campaign with Marketing Agent: {existing['name']} (ID: {existing['id']})")
+            return existing["id"]
+        
+        campaign_id = str(marketing_agent_id) if marketing_agent_id is not None else uuid.uuid4().hex[:16]
+        campaign = {
+            "id": campaign_id,
+            "name": name,
+            "product_url": product_url,
+            "commission_rate": commission_rate,
+            "created": datetime.now(),
+            "marketing_agent_id": marketing_agent_id
+        }
+        self._index_campaign(campaign)
+        self._save_campaign(campaign)
+        if marketing_agent_id is not None:
+            logger.info(f"Created affiliate campaign: {name} (ID: {campaign_id})")
+        return campaign_id
+    
+    def _register_remote_campaign(self, name: str, product_url: str) -> Optional[int]:
+        """Create the campaign in the Marketing Agent, returning its ID (None if unavailable)"""
         try:
             # Debug: Log the URL being used
             logger.debug(f"Creating campaign via Marketing Agent at: {self.marketing_agent_url}/api/campaigns")
@@ -1855,82 +2960,178 @@ class AffiliateManager:
                 timeout=10
             )
             if response.status_code == 200:
-                campaign_data = response.json()
-                campaign_id = str(campaign_data.get("id", uuid.uuid4().hex[:16]))
-                self.campaigns.append({
-                    "id": campaign_id,
-                    "name": name,
-                    "product_url": product_url,
-                    "commission_rate": commission_rate,
-                    "created": datetime.now(),
-                    "marketing_agent_id": campaign_data.get("id")
-                })
-                logger.info(f"Created affiliate campaign: {name} (ID: {campaign_id})")
-                return campaign_id
-            else:
-                campaign_id = uuid.uuid4().hex[:16]
-                self.campaigns.append({
-                    "id": campaign_id, "name": name, "product_url": product_url,
-                    "commission_rate": commission_rate, "created": datetime.now()
-                })
-                return campaign_id
+                return response.json().get("id")
+            return None
         except Exception as e:
             logger.warning(f"Marketing Agent unavailable at {self.marketing_agent_url}, creating local campaign: {e}")
-            campaign_id = uuid.uuid4().hex[:16]
-            self.campaigns.append({
-                "id": campaign_id, "name": name, "product_url": product_url,
-                "commission_rate": commission_rate, "created": datetime.now()
+            return None
+    
+    def get_campaign(self, campaign_id: str) -> Optional[Dict[str, Any]]:
+        """Look up a campaign by ID"""
+        return self._campaigns_by_id.get(campaign_id)
+    
+    def get_campaign_by_product_url(self, product_url: str) -> Optional[Dict[str, Any]]:
+        """Look up a campaign by product URL"""
+        return self._campaigns_by_url.get(product_url)
+    
+    def _index_campaign(self, campaign: Dict[str, Any]):
+        """Add a campaign to the in-memory list and indexes"""
+        self.campaigns.append(campaign)
+        self._campaigns_by_id[campaign["id"]] = campaign
+        self._campaigns_by_url.setdefault(campaign["product_url"], campaign)
+    
+    def _load_campaigns(self):
+        """Load persisted campaigns and their performance counters"""
+        rows = self.db.cursor().execute('''
+            SELECT id, name, product_url, commission_rate, marketing_agent_id, created,
+                   clicks, conversions, revenue, commissions
+            FROM affiliate_campaigns ORDER BY created
+        ''').fetchall()
+        for (campaign_id, name, product_url, commission_rate, marketing_agent_id, created,
+             clicks, conversions, revenue, commissions) in rows:
+            try:
+                created_at = datetime.fromisoformat(created) if created else datetime.now()
+            except ValueError:
+                created_at = datetime.now()
+            self._index_campaign({
+                "id": campaign_id,
+                "name": name,
+                "product_url": product_url,
+                "commission_rate": commission_rate,
+                "created": created_at,
+                "marketing_agent_id": marketing_agent_id
             })
-            return campaign_id
+            if clicks or conversions:
+                self.performance[campaign_id] = {
+                    "clicks": clicks, "conversions": conversions,
+                    "revenue": revenue, "commissions": commissions
+                }
+        if rows:
+            logger.info(f"Loaded {len(rows)} affiliate campaigns from database")
+    
+    def _save_campaign(self, campaign: Dict[str, Any]):
+        """Persist a campaign (without touching its performance counters)"""
+        if not self.db:
+            return
+        try:
+            self.db.cursor().execute('''
+                INSERT INTO affiliate_campaigns (id, name, product_url, commission_rate, marketing_agent_id, created)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    name = excluded.name,
+                    commission_rate = excluded.commission_rate,
+                    marketing_agent_id = excluded.marketing_agent_id
+            ''', (campaign["id"], campaign["name"], campaign["product_url"], campaign["commission_rate"],
+                  campaign.get("marketing_agent_id"), campaign["created"].isoformat()))
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not persist affiliate campaign {campaign['id']}: {e}")
+    
+    def _save_performance(self, campaign_id: str):
+        """Persist a campaign's performance counters"""
+        if not self.db:
+            return
+        perf = self.performance[campaign_id]
+        try:
+            self.db.cursor().execute('''
+                UPDATE affiliate_campaigns
+                SET clicks = ?, conversions = ?, revenue = ?, commissions = ?
+                WHERE id = ?
+            ''', (perf["clicks"], perf["conversions"], perf["revenue"], perf["commissions"], campaign_id))
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not persist performance for campaign {campaign_id}: {e}")
     
     def generate_affiliate_link(self, campaign_id: str, destination_url: str, user_id: str = "") -> Optional[str]:
         """Generate tracking link via Marketing Agent"""
-        campaign = next((c for c in self.campaigns if c["id"] == campaign_id), None)
-        if not campaign:
-            return None
-        try:
+        key = (campaign_id, destination_url, user_id)
+        cached = self._get_cached_link(key)
+        if cached:
+            return cached
+        return self.generate_affiliate_links([key]).get(key)
+    
+    def generate_affiliate_links(self, link_requests: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], Optional[str]]:
+        """Generate tracking links for many (campaign_id, destination_url, user_id) tuples in one round-trip.
+        
+        Links already generated are served from the persistent link cache; the
+        rest go to the Marketing Agent's idempotent POST /api/links/bulk endpoint.
+        """
+        results = {}
+        pending = []  # (key, payload)
+        for key in dict.fromkeys(link_requests):
+            cached = self._get_cached_link(key)
+            if cached:
+                results[key] = cached
+                continue
+            campaign_id, destination_url, user_id = key
+            campaign = self._campaigns_by_id.get(campaign_id)
+            if not campaign:
+                results[key] = None
+                continue
             marketing_agent_id = campaign.get("marketing_agent_id")
-            if marketing_agent_id:
+            try:
                 # Marketing Agent expects campaign_id as int and utm_json (not utm_params)
-                try:
-                    campaign_id_int = int(marketing_agent_id) if isinstance(marketing_agent_id, str) else marketing_agent_id
-                    response = requests.post(
-                        f"{self.marketing_agent_url}/api/links",
-                        json={
-                            "campaign_id": campaign_id_int,
-                            "channel": "affiliate",
-                            "long_url": destination_url,
-                            "utm_json": {
-                                "utm_source": "affiliate", "utm_medium": "cash_engine",
-                                "utm_campaign": campaign["name"], "affiliate_id": user_id
-                            }
-                        },
-                        timeout=10
-                    )
-                    if response.status_code == 200:
-                        link_data = response.json()
-                        # Marketing Agent returns short_slug, construct full URL
-                        slug = link_data.get("short_slug")
-                        if slug:
-                            return f"{self.marketing_agent_url}/r/{slug}"
-                        return link_data.get("short_url") or link_data.get("url") or destination_url
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Invalid campaign ID format: {marketing_agent_id}, {e}")
-            tracking_id = hashlib.md5(f"{campaign_id}{destination_url}{user_id}".encode()).hexdigest()[:16]
-            return f"https://track.example.com/{tracking_id}"
+                campaign_id_int = int(marketing_agent_id) if marketing_agent_id else None
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Invalid campaign ID format: {marketing_agent_id}, {e}")
+                campaign_id_int = None
+            if campaign_id_int is None:
+                results[key] = self._fallback_tracking_link(*key)
+                continue
+            pending.append((key, {
+                "campaign_id": campaign_id_int,
+                "channel": "affiliate",
+                "long_url": destination_url,
+                "utm_json": {
+                    "utm_source": "affiliate", "utm_medium": "cash_engine",
+                    "utm_campaign": campaign["name"], "affiliate_id": user_id
+                }
+            }))
+        
+        if not pending:
+            return results
+        
+        try:
+            response = requests.post(
+                f"{self.marketing_agent_url}/api/links/bulk",
+                json={"links": [payload for _, payload in pending]},
+                timeout=10
+            )
+            if response.status_code == 200:
+                created = {}
+                for (key, payload), link_data in zip(pending, response.json()):
+                    # Marketing Agent returns short_slug, construct full URL
+                    slug = link_data.get("short_slug")
+                    if slug:
+                        created[key] = f"{self.marketing_agent_url}/r/{slug}"
+                    results[key] = created.get(key, payload["long_url"])
+                self._store_links(created)
+            else:
+                logger.warning(f"Bulk link creation failed ({response.status_code}), using fallback tracking links")
+                for key, _ in pending:
+                    results[key] = self._fallback_tracking_link(*key)
         except Exception as e:
-            logger.error(f"Error generating affiliate link: {e}")
-            return destination_url
+            logger.error(f"Error generating affiliate links: {e}")
+            for key, payload in pending:
+                results[key] = payload["long_url"]
+        return results
+    
+    @staticmethod
+    def _fallback_tracking_link(campaign_id: str, destination_url: str, user_id: str) -> str:
+        """Deterministic tracking link used when the Marketing Agent has no matching campaign"""
+        tracking_id = hashlib.md5(f"{campaign_id}{destination_url}{user_id}".encode()).hexdigest()[:16]
+        return f"https://track.example.com/{tracking_id}"
     
     def track_click(self, campaign_id: str):
         """Track a campaign click"""
         if campaign_id not in self.performance:
-            self.performance[campaign_id] = {"clicks": 0, "conversions": 0}
+            self.performance[campaign_id] = {"clicks": 0, "conversions": 0, "revenue": 0.0, "commissions": 0.0}
         self.performance[campaign_id]["clicks"] += 1
+        self._save_performance(campaign_id)
     
     def track_conversion(self, campaign_id: str, amount: float, commission_rate: Optional[float] = None):
         """Track conversion and calculate commission revenue (REVENUE GENERATION)"""
-        campaign = next((c for c in self.campaigns if c["id"] == campaign_id), None)
+        campaign = self._campaigns_by_id.get(campaign_id)
         if not campaign:
             return 0
         rate = commission_rate or campaign.get("commission_rate", 0.30)
@@ -1942,14 +3143,18 @@ class AffiliateManager:
         self.performance[campaign_id]["commissions"] += commission
         logger.info(f"Affiliate conversion: ${amount:.2f} sale, ${commission:.2f} commission")
         
-        # Track campaign performance in database (if db connection available)
-        # Note: AffiliateManager doesn't have db access, tracking happens in CashEngine
+        # Persist counters so campaign performance survives restarts
+        self._save_performance(campaign_id)
         return commission
 
 
 # ============================================
 # SHOPIFY MANAGER
 # ============================================
+class ShopifyAPIError(Exception):
+    """Non-success response from the Shopify Admin API"""
+
+
 class ShopifyManager:
     """Manages Shopify store integration - products, orders, and revenue tracking"""
     
@@ -1963,21 +3168,95 @@ class ShopifyManager:
         
         self.db = db_conn
         self.products_cache = {}  # Cache product catalog
+        self.product_index = ProductKeywordIndex()  # Token index over products_cache
+        self._catalog_fingerprint = None  # (product_index.version, fingerprint)
+        self._last_fetch_attempt = None
         self.last_sync_time = None
         self.api_version = '2024-01'  # Shopify API version
+        # REST Admin API leaky bucket drains 2 calls/second on standard plans (4 on Plus)
+        self.rate_limit_leak_per_second = float(os.getenv('SHOPIFY_API_LEAK_RATE', '2'))
         self.logger = logging.getLogger('CashEngine.ShopifyManager')
         
         if self.db:
             self._ensure_order_id_column()
+            self._ensure_sync_schema()
     
     def _ensure_order_id_column(self):
-        """Add order_id column to revenue table if it doesn't exist"""
+        """Add order_id column and its unique index to revenue table if they don't exist"""
+        cursor = self.db.cursor()
         try:
-            self.db.cursor().execute('ALTER TABLE revenue ADD COLUMN order_id TEXT')
+            cursor.execute('ALTER TABLE revenue ADD COLUMN order_id TEXT')
             self.db.commit()
         except sqlite3.OperationalError:
             # Column already exists, ignore
             pass
+        try:
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_revenue_order_id ON revenue (order_id)')
+        except sqlite3.IntegrityError:
+            # Duplicate webhook deliveries double-counted these orders; keep the first row of each
+            # and move the rest to revenue_duplicates, so nothing is lost if one was genuine
+            duplicate_ids = [row[0] for row in cursor.execute('''
+                SELECT id FROM revenue
+                WHERE order_id IS NOT NULL
+                  AND id NOT IN (SELECT MIN(id) FROM revenue WHERE order_id IS NOT NULL GROUP BY order_id)
+                ORDER BY id
+            ''').fetchall()]
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS revenue_duplicates (
+                    id INTEGER PRIMARY KEY,
+                    timestamp DATETIME,
+                    source TEXT,
+                    amount REAL,
+                    currency TEXT,
+                    description TEXT,
+                    status TEXT,
+                    order_id TEXT,
+                    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            for i in range(0, len(duplicate_ids), 500):
+                chunk = duplicate_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f'''
+                    INSERT OR REPLACE INTO revenue_duplicates (id, timestamp, source, amount, currency, description, status, order_id)
+                    SELECT id, timestamp, source, amount, currency, description, status, order_id
+                    FROM revenue WHERE id IN ({placeholders})
+                ''', chunk)
+                cursor.execute(f'DELETE FROM revenue WHERE id IN ({placeholders})', chunk)
+            self.logger.warning(
+                f"Moved {len(duplicate_ids)} duplicate Shopify order rows from revenue to revenue_duplicates "
+                f"(revenue ids: {', '.join(map(str, duplicate_ids))})"
+            )
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_revenue_order_id ON revenue (order_id)')
+        self.db.commit()
+    
+    def _ensure_sync_schema(self):
+        """Add the Shopify product key and the sync cursor table if they don't exist"""
+        cursor = self.db.cursor()
+        try:
+            cursor.execute('ALTER TABLE products ADD COLUMN shopify_id TEXT')
+        except sqlite3.OperationalError:
+            # Column already exists, ignore
+            pass
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_products_shopify_id ON products (shopify_id)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_cursors (
+                name TEXT PRIMARY KEY,
+                cursor TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.db.commit()
+    
+    def _get_sync_cursor(self, name: str) -> Optional[str]:
+        row = self.db.cursor().execute('SELECT cursor FROM sync_cursors WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+    
+    def _set_sync_cursor(self, name: str, value: str):
+        self.db.cursor().execute('''
+            INSERT INTO sync_cursors (name, cursor, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET cursor = excluded.cursor, updated_at = excluded.updated_at
+        ''', (name, value, datetime.now()))
     
     def _get_api_url(self, endpoint: str) -> str:
         """Build Shopify Admin API URL"""
@@ -1994,63 +3273,91 @@ class ShopifyManager:
             "Content-Type": "application/json"
         }
     
-    def fetch_products(self) -> List[Dict[str, Any]]:
-        """Fetch all products from Shopify store"""
+    def _paced_get(self, url: str, params: Dict[str, Any], max_retries: int = 5) -> requests.Response:
+        """GET against the Admin API, pacing by the leaky-bucket rate-limit headers
+        
+        Shopify reports bucket usage in X-Shopify-Shop-Api-Call-Limit ("used/size")
+        and leaks about 2 calls per second. Once the bucket is more than half full we
+        sleep just long enough for it to drain back to half, and on 429 we honour
+        Retry-After instead of a fixed delay.
+        """
+        for _ in range(max_retries):
+            resp = requests.get(url, headers=self._get_headers(), params=params, timeout=15)
+            if resp.status_code == 429:
+                wait = float(resp.headers.get("Retry-After", 2.0))
+                self.logger.warning(f"Shopify API rate limit - waiting {wait:.1f} seconds")
+                time.sleep(wait)
+                continue
+            call_limit = resp.headers.get("X-Shopify-Shop-Api-Call-Limit", "")
+            try:
+                used, size = (int(x) for x in call_limit.split("/"))
+            except ValueError:
+                return resp
+            if used > size / 2:
+                time.sleep((used - size / 2) / self.rate_limit_leak_per_second)
+            return resp
+        return resp
+    
+    def fetch_products(self, updated_since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Fetch products from Shopify store
+        
+        With updated_since (ISO timestamp), only products updated at or after it are
+        fetched and merged into the cache; otherwise the whole catalog is fetched and
+        replaces it.
+        """
         if not self.enabled or not self.access_token:
             self.logger.warning("Shopify not enabled or access token missing")
             return []
         
+        self._last_fetch_attempt = datetime.now()
         try:
-            url = self._get_api_url("/products.json")
-            headers = self._get_headers()
-            
-            products = []
-            page_info = None
-            
-            # Handle pagination
-            while True:
-                params = {"limit": 250}  # Max products per page
-                if page_info:
-                    params["page_info"] = page_info
-                
-                resp = requests.get(url, headers=headers, params=params, timeout=15)
-                
-                if resp.status_code == 200:
-                    data = resp.json()
-                    page_products = data.get("products", [])
-                    products.extend(page_products)
-                    
-                    # Check for next page
-                    link_header = resp.headers.get("Link", "")
-                    if 'rel="next"' not in link_header:
-                        break
-                    
-                    # Extract page_info from Link header
-                    next_match = re.search(r'page_info=([^&>]+)', link_header)
-                    if next_match:
-                        page_info = next_match.group(1)
-                    else:
-                        break
-                elif resp.status_code == 401:
-                    self.logger.error(f"Shopify API authentication failed (401)")
-                    break
-                elif resp.status_code == 429:
-                    self.logger.warning("Shopify API rate limit - waiting 2 seconds")
-                    time.sleep(2)
-                    continue
-                else:
-                    self.logger.error(f"Shopify API error: HTTP {resp.status_code} - {resp.text[:200]}")
-                    break
-            
-            self.products_cache = {p["id"]: p for p in products}
+            params = {"limit": 250}  # Max products per page
+            if updated_since:
+                params["updated_at_min"] = updated_since
+            products = list(self._paginate("/products.json", "products", params))
+            
+            if updated_since:
+                for product in products:
+                    self.products_cache[product["id"]] = product
+                    self.product_index.add(product)
+            else:
+                self.products_cache = {p["id"]: p for p in products}
+                self.product_index.rebuild(products)
             self.last_sync_time = datetime.now()
-            self.logger.info(f"Fetched {len(products)} products from Shopify")
+            self.logger.info(f"Fetched {len(products)} {'updated ' if updated_since else ''}products from Shopify")
             return products
             
+        except ShopifyAPIError as e:
+            self.logger.error(str(e))
+            return []
         except Exception as e:
             self.logger.error(f"Error fetching Shopify products: {e}")
             return []
     
+    def _paginate(self, endpoint: str, key: str, params: Dict[str, Any]):
+        """Yield every item of a paginated Admin API list endpoint
+        
+        Follows the cursor in the Link header's rel="next" entry; after the first
+        page only limit and page_info may be sent, since page_info carries the
+        original filters. Raises ShopifyAPIError on a non-200 response so callers
+        never mistake a partial listing for a complete one.
+        """
+        url = self._get_api_url(endpoint)
+        page_params = dict(params)
+        while True:
+            resp = self._paced_get(url, page_params)
+            if resp.status_code == 401:
+                raise ShopifyAPIError("Shopify API authentication failed (401)")
+            if resp.status_code != 200:
+                raise ShopifyAPIError(f"Shopify API error: HTTP {resp.status_code} - {resp.text[:200]}")
+            yield from resp.json().get(key, [])
+            
+            # The header also carries rel="previous" after the first page
+            next_match = re.search(r'page_info=([^&>]+)>; rel="next"', resp.headers.get("Link", ""))
+            if not next_match:
+                return
+            page_params = {"limit": params.get("limit", 250), "page_info": next_match.group(1)}
+    
     def get_product(self, product_id: int) -> Optional[Dict[str, Any]]:
         """Get single product by ID"""
         if product_id in self.products_cache:
@@ -2065,6 +3372,8 @@ class ShopifyManager:
                 data = resp.json()
                 product = data.get("product", {})
                 self.products_cache[product_id] = product
+                if product:
+                    self.product_index.add(product)
                 return product
             else:
                 self.logger.error(f"Shopify product fetch error: HTTP {resp.status_code}")
@@ -2085,91 +3394,156 @@ class ShopifyManager:
         return base_url + utm_params
     
     def sync_products_to_db(self) -> int:
-        """Sync Shopify products to database"""
+        """Sync Shopify products to database
+        
+        Only products updated since the stored cursor are written, with one
+        executemany upsert keyed on the Shopify product ID. While the in-memory
+        catalog is warm only those products are fetched; after a restart the full
+        catalog is fetched once to rebuild the matching index.
+        """
         if not self.db:
             self.logger.warning("Database connection not available for product sync")
             return 0
         
-        products = self.fetch_products()
+        since = self._get_sync_cursor("shopify_products")
+        if since and self.products_cache:
+            products = self.fetch_products(updated_since=since)
+        else:
+            products = self.fetch_products()
+            if since:
+                since_dt = self._parse_shopify_time(since)
+                products = [p for p in products if self._parse_shopify_time(p.get("updated_at")) >= since_dt]
         if not products:
             return 0
         
-        cursor = self.db.cursor()
-        synced = 0
-        
+        rows = []
         for product in products:
             try:
-                product_id = product.get("id")
-                title = product.get("title", "")
-                handle = product.get("handle", "")
                 variants = product.get("variants", [])
-                price = float(variants[0].get("price", 0)) if variants else 0.0
-                description = product.get("body_html", "")[:500] if product.get("body_html") else ""
-                
-                # Check if product exists
-                cursor.execute('SELECT id FROM products WHERE name = ? AND type = ?', 
-                             (title, "shopify"))
-                
-                if cursor.fetchone():
-                    # Update existing
-                    cursor.execute('''
-                        UPDATE products 
-                        SET price = ?, description = ?
-                        WHERE name = ? AND type = ?
-                    ''', (price, description, title, "shopify"))
-                else:
-                    # Insert new
-                    cursor.execute('''
-                        INSERT INTO products (name, price, type, description, created_date)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (title, price, "shopify", description, datetime.now()))
-                
-                synced += 1
+                rows.append((
+                    str(product["id"]),
+                    product.get("title", ""),
+                    float(variants[0].get("price", 0)) if variants else 0.0,
+                    product.get("body_html", "")[:500] if product.get("body_html") else "",
+                ))
             except Exception as e:
                 self.logger.error(f"Error syncing product {product.get('title', 'unknown')}: {e}")
         
-        self.db.commit()
-        self.logger.info(f"Synced {synced} Shopify products to database")
-        return synced
+        cursor = self.db.cursor()
+        try:
+            # Rows synced before products were keyed by Shopify ID are claimed by name once
+            cursor.execute("SELECT 1 FROM products WHERE type = 'shopify' AND shopify_id IS NULL LIMIT 1")
+            if cursor.fetchone():
+                cursor.executemany('''
+                    UPDATE products SET shopify_id = ?
+                    WHERE id = (SELECT id FROM products WHERE type = 'shopify' AND shopify_id IS NULL AND name = ? LIMIT 1)
+                      AND NOT EXISTS (SELECT 1 FROM products WHERE shopify_id = ?)
+                ''', [(shopify_id, title, shopify_id) for shopify_id, title, _, _ in rows])
+            
+            cursor.executemany('''
+                INSERT INTO products (shopify_id, name, price, type, description, created_date)
+                VALUES (?, ?, ?, 'shopify', ?, ?)
+                ON CONFLICT(shopify_id) DO UPDATE SET
+                    name = excluded.name,
+                    price = excluded.price,
+                    description = excluded.description
+            ''', [(shopify_id, title, price, description, datetime.now()) for shopify_id, title, price, description in rows])
+            
+            newest = max((p.get("updated_at") for p in products if p.get("updated_at")), key=self._parse_shopify_time, default=None)
+            if newest:
+                self._set_sync_cursor("shopify_products", newest)
+            self.db.commit()
+        except sqlite3.Error as e:
+            self.db.rollback()
+            self.logger.error(f"Error writing Shopify products to database: {e}")
+            return 0
+        
+        self.logger.info(f"Synced {len(rows)} Shopify products to database")
+        return len(rows)
+    
+    @staticmethod
+    def _parse_shopify_time(value: Optional[str]) -> datetime:
+        """Parse a Shopify ISO-8601 timestamp (with offset) to an aware UTC datetime"""
+        if not value:
+            return datetime.min.replace(tzinfo=timezone.utc)
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc)
+    
+    def _catalog_fetch_due(self) -> bool:
+        """Whether an empty catalog should be fetched again (throttled so a failing or empty store isn't re-fetched on every match)"""
+        if self._last_fetch_attempt is None:
+            return True
+        retry_after = int(os.getenv('SHOPIFY_CATALOG_RETRY_SECONDS', '300'))
+        return (datetime.now() - self._last_fetch_attempt).total_seconds() >= retry_after
+    
+    def _ensure_catalog(self):
+        """Fetch the catalog if it hasn't been loaded yet"""
+        if not self.products_cache and self._catalog_fetch_due():
+            self.fetch_products()
+    
+    def catalog_fingerprint(self) -> str:
+        """Hash of the loaded catalog's (product id, updated_at) pairs
+        
+        Unlike product_index.version this is the same across restarts for the
+        same catalog, so it can be persisted. The catalog is fetched first if it
+        hasn't been loaded, so the value matches what find_matching_product sees.
+        """
+        self._ensure_catalog()
+        version = self.product_index.version
+        if self._catalog_fingerprint and self._catalog_fingerprint[0] == version:
+            return self._catalog_fingerprint[1]
+        pairs = sorted((str(product_id), product.get("updated_at") or "")
+                       for product_id, product in self.products_cache.items())
+        fingerprint = hashlib.sha256(
+            "\n".join(f"{product_id}:{updated_at}" for product_id, updated_at in pairs).encode('utf-8')
+        ).hexdigest()[:16]
+        self._catalog_fingerprint = (version, fingerprint)
+        return fingerprint
     
     def find_matching_product(self, content: str) -> Optional[Dict[str, Any]]:
         """Find best matching Shopify product for content based on keywords"""
-        if not self.products_cache:
-            self.fetch_products()
+        self._ensure_catalog()
         
         if not self.products_cache:
             return None
         
-        content_lower = content.lower()
-        best_match = None
-        best_score = 0
-        
-        for product in self.products_cache.values():
-            title = product.get("title", "").lower()
-            handle = product.get("handle", "").lower()
-            tags = [t.lower() for t in product.get("tags", "").split(",") if t.strip()]
-            
-            # Simple keyword matching score
-            score = 0
-            if title in content_lower:
-                score += 10
-            if handle in content_lower:
-                score += 8
-            for tag in tags:
-                if tag.strip() in content_lower:
-                    score += 5
-            
-            # Boost score for product type keywords
-            product_type = product.get("product_type", "").lower()
-            if product_type and product_type in content_lower:
-                score += 7
-            
-            if score > best_score:
-                best_score = score
-                best_match = product
-        
-        # Only return if score is above threshold
-        return best_match if best_score >= 5 else None
+        product_id, score = self.product_index.search(content)
+        
+        # search only returns products with a whole title, handle, type or tag in the content;
+        # the threshold keeps the baseline's "at least one tag-level hit"
+        return self.products_cache.get(product_id) if score >= 5 else None
+    
+    @staticmethod
+    def _order_revenue_row(order_data: Dict[str, Any]) -> Tuple:
+        """Map a Shopify order to a revenue row: (amount, currency, description, status, order_id, timestamp)"""
+        # current_total_price reflects edits and refunds; older payloads only carry total_price
+        total_price = float(order_data.get("current_total_price") or order_data.get("total_price") or 0)
+        order_number = order_data.get("order_number", "")
+        
+        # Extract product names from line items
+        line_items = order_data.get("line_items", [])
+        product_names = [item.get("title", "") for item in line_items]
+        description = f"Shopify Order #{order_number}: {', '.join(product_names[:3])}"
+        if len(product_names) > 3:
+            description += f" and {len(product_names) - 3} more"
+        
+        if order_data.get("cancelled_at"):
+            status = "cancelled"
+        elif order_data.get("financial_status") == "refunded":
+            status = "refunded"
+        else:
+            status = "completed"
+        
+        return (
+            total_price,
+            order_data.get("currency", "USD"),
+            description,
+            status,
+            str(order_data.get("id", "")),
+            order_data.get("created_at", datetime.now().isoformat()),
+        )
     
     def record_order_revenue(self, order_data: Dict[str, Any]) -> bool:
         """Record Shopify order as revenue in database"""
@@ -2178,23 +3552,13 @@ class ShopifyManager:
             return False
         
         try:
-            total_price = float(order_data.get("total_price", 0))
+            total_price, currency, description, status, order_id, created_at = self._order_revenue_row(order_data)
             order_number = order_data.get("order_number", "")
-            order_id = order_data.get("id", "")
-            created_at = order_data.get("created_at", datetime.now().isoformat())
-            currency = order_data.get("currency", "USD")
-            
-            # Extract product names from line items
-            line_items = order_data.get("line_items", [])
-            product_names = [item.get("title", "") for item in line_items]
-            description = f"Shopify Order #{order_number}: {', '.join(product_names[:3])}"
-            if len(product_names) > 3:
-                description += f" and {len(product_names) - 3} more"
             
             cursor = self.db.cursor()
             
             # Check if order already recorded
-            cursor.execute('SELECT id FROM revenue WHERE order_id = ?', (str(order_id),))
+            cursor.execute('SELECT id FROM revenue WHERE order_id = ?', (order_id,))
             if cursor.fetchone():
                 self.logger.debug(f"Shopify order {order_number} already recorded")
                 return True
@@ -2203,7 +3567,7 @@ class ShopifyManager:
             cursor.execute('''
                 INSERT INTO revenue (source, amount, currency, description, status, order_id, timestamp)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', ("shopify", total_price, currency, description, "completed", str(order_id), created_at))
+            ''', ("shopify", total_price, currency, description, status, order_id, created_at))
             
             self.db.commit()
             self.logger.info(f"Recorded Shopify order #{order_number}: ${total_price} {currency}")
@@ -2212,26 +3576,626 @@ class ShopifyManager:
         except Exception as e:
             self.logger.error(f"Error recording Shopify order revenue: {e}")
             return False
+    
+    def upsert_orders(self, orders: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Bulk-upsert orders into revenue through the order_id unique key
+        
+        Returns counts of inserted rows and of existing rows whose amount,
+        currency, description or status changed.
+        """
+        rows = [self._order_revenue_row(order) for order in orders]
+        if not rows or not self.db:
+            return {"inserted": 0, "updated": 0}
+        cursor = self.db.cursor()
+        
+        order_ids = [row[4] for row in rows]
+        existing = set()
+        for i in range(0, len(order_ids), 500):
+            chunk = order_ids[i:i + 500]
+            cursor.execute(
+                f'SELECT order_id FROM revenue WHERE order_id IN ({",".join("?" * len(chunk))})', chunk
+            )
+            existing.update(row[0] for row in cursor.fetchall())
+        
+        changes_before = self.db.total_changes
+        cursor.executemany('''
+            INSERT INTO revenue (source, amount, currency, description, status, order_id, timestamp)
+            VALUES ('shopify', ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(order_id) DO UPDATE SET
+                amount = excluded.amount,
+                currency = excluded.currency,
+                description = excluded.description,
+                status = excluded.status
+            WHERE revenue.amount IS NOT excluded.amount
+               OR revenue.currency IS NOT excluded.currency
+               OR revenue.description IS NOT excluded.description
+               OR revenue.status IS NOT excluded.status
+        ''', rows)
+        self.db.commit()
+        
+        inserted = len(set(order_ids) - existing)
+        return {"inserted": inserted, "updated": self.db.total_changes - changes_before - inserted}
+    
+    def _fetch_orders(self, **filters) -> List[Dict[str, Any]]:
+        """Fetch all orders (any status) matching created_at/updated_at filters"""
+        params = {
+            "limit": 250,
+            "status": "any",
+            "fields": "id,order_number,total_price,current_total_price,currency,created_at,updated_at,"
+                      "cancelled_at,financial_status,line_items",
+        }
+        params.update(filters)
+        return list(self._paginate("/orders.json", "orders", params))
+    
+    def backfill_orders(self, start: datetime, end: Optional[datetime] = None, workers: Optional[int] = None) -> Dict[str, int]:
+        """Load every order created in [start, end) into revenue
+        
+        The range is cut into time slices fetched in parallel; each worker paces
+        itself from the shared rate-limit bucket reported in the response
+        headers. Slices are written as they arrive, on the calling thread.
+        """
+        if not self.enabled or not self.access_token or not self.db:
+            self.logger.warning("Shopify not enabled, access token missing or no database for order backfill")
+            return {"fetched": 0, "inserted": 0, "updated": 0, "failed_slices": 0}
+        
+        end = end or datetime.now(timezone.utc)
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        start, end = start.replace(microsecond=0), end.replace(microsecond=0)
+        workers = workers or int(os.getenv('SHOPIFY_BACKFILL_WORKERS', '4'))
+        
+        # Several slices per worker so one busy period doesn't hold up the rest
+        slice_count = max(1, min(workers * 4, (end - start).days + 1))
+        # Whole-second boundaries, since Shopify timestamps have second resolution
+        step = timedelta(seconds=math.ceil((end - start).total_seconds() / slice_count))
+        slices = [(start + step * i, min(start + step * (i + 1), end)) for i in range(slice_count)]
+        slices = [(lo, hi) for lo, hi in slices if lo < hi]
+        slice_count = len(slices)
+        
+        totals = {"fetched": 0, "inserted": 0, "updated": 0, "failed_slices": 0}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(
+                    self._fetch_orders,
+                    created_at_min=lo.isoformat(),
+                    # created_at_max is inclusive; stop just short of the next slice
+                    created_at_max=(hi - timedelta(seconds=1)).isoformat() if i < slice_count - 1 else hi.isoformat()
+                ): (lo, hi)
+                for i, (lo, hi) in enumerate(slices)
+            }
+            for future in as_completed(futures):
+                lo, hi = futures[future]
+                try:
+                    orders = future.result()
+                except Exception as e:
+                    totals["failed_slices"] += 1
+                    self.logger.error(f"Order backfill slice {lo:%Y-%m-%d %H:%M} - {hi:%Y-%m-%d %H:%M} failed: {e}")
+                    continue
+                result = self.upsert_orders(orders)
+                totals["fetched"] += len(orders)
+                totals["inserted"] += result["inserted"]
+                totals["updated"] += result["updated"]
+        
+        self.logger.info(
+            f"Shopify order backfill: {totals['fetched']} fetched, {totals['inserted']} new, "
+            f"{totals['updated']} updated, {totals['failed_slices']} failed slices"
+        )
+        return totals
+    
+    def reconcile_orders(self) -> Dict[str, int]:
+        """Pull orders updated since the last reconcile and upsert only what changed
+        
+        The first run looks back SHOPIFY_RECONCILE_LOOKBACK_DAYS (default 7); the
+        cursor only advances when every page was fetched.
+        """
+        if not self.enabled or not self.access_token or not self.db:
+            return {"fetched": 0, "inserted": 0, "updated": 0}
+        
+        since = self._get_sync_cursor("shopify_orders")
+        if not since:
+            lookback = int(os.getenv('SHOPIFY_RECONCILE_LOOKBACK_DAYS', '7'))
+            since = (datetime.now(timezone.utc) - timedelta(days=lookback)).isoformat()
+        
+        try:
+            orders = self._fetch_orders(updated_at_min=since)
+        except Exception as e:
+            self.logger.error(f"Shopify order reconcile failed: {e}")
+            return {"fetched": 0, "inserted": 0, "updated": 0}
+        
+        result = self.upsert_orders(orders)
+        newest = max((o.get("updated_at") for o in orders if o.get("updated_at")), key=self._parse_shopify_time, default=None)
+        if newest:
+            self._set_sync_cursor("shopify_orders", newest)
+            self.db.commit()
+        
+        result["fetched"] = len(orders)
+        self.logger.info(
+            f"Shopify order reconcile: {len(orders)} changed orders, {result['inserted']} new, {result['updated']} updated"
+        )
+        return result
+
+
+def open_own_connection(db_conn=None, timeout: float = 30.0) -> sqlite3.Connection:
+    """A separate connection to db_conn's database file, for components that commit from worker threads
+    
+    A sqlite3 transaction belongs to its connection, so a worker thread that
+    commits or rolls back on the engine's shared connection also commits or
+    discards whatever another thread has half-written on it. Writers on their
+    own connection wait up to timeout seconds for the file lock instead. An
+    in-memory database can't be opened twice, so it keeps using db_conn.
+    """
+    if db_conn is None:
+        return sqlite3.connect(":memory:", check_same_thread=False)
+    path = next((row[2] for row in db_conn.execute('PRAGMA database_list') if row[1] == "main"), "")
+    if not path:
+        return db_conn
+    return sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+
+
+class PostingLedger:
+    """Shared record of social posts in engine.db, one row per (platform, content file, window).
+    
+    A post is claimed with a single upsert on the primary key before it is sent,
+    so dedup is one indexed lookup and two processes can never both claim the
+    same file for the same window. Failed or abandoned claims can be retaken.
+    """
+    CLAIM_TIMEOUT_SECONDS = 900  # a pending claim older than this is treated as abandoned
+    
+    def __init__(self, db_conn=None):
+        # Claims are settled from post-queue worker threads, so the ledger commits on its own connection
+        self.db = open_own_connection(db_conn)
+        self._lock = threading.Lock()
+        self.window_hours = float(os.getenv("POSTING_DEDUP_WINDOW_HOURS", "24"))
+        self._ensure_tables()
+    
+    def _ensure_tables(self):
+        """Create the posting ledger tables if they don't exist"""
+        cursor = self.db.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS posting_ledger (
+                platform TEXT NOT NULL,
+                content_file TEXT NOT NULL,
+                window_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                claimed_at REAL NOT NULL,
+                posted_at REAL,
+                PRIMARY KEY (platform, content_file, window_key)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS posting_live_windows (
+                platform TEXT PRIMARY KEY,
+                start_ts REAL NOT NULL
+            )
+        ''')
+        self.db.commit()
+    
+    def window_key(self, platform: str, now_ts: Optional[float] = None) -> str:
+        """Dedup window for platforms without a live window: fixed POSTING_DEDUP_WINDOW_HOURS buckets"""
+        now_ts = now_ts if now_ts is not None else time.time()
+        return f"w{int(now_ts // (self.window_hours * 3600))}"
+    
+    def current_window_key(self, platform: str) -> str:
+        """Window a post to platform would be recorded under right now"""
+        if platform == "twitter":
+            start_ts = self.live_window_start(platform)
+            # Nothing is claimed before the live window opens, so "live-pending" never has rows
+            return f"live-{int(start_ts)}" if start_ts else "live-pending"
+        return self.window_key(platform)
+    
+    def already_posted(self, platform: str, content_file: str) -> bool:
+        """Whether content_file already went out to platform in the current window"""
+        window_key = self.current_window_key(platform)
+        with self._lock:
+            row = self.db.execute(
+                'SELECT status FROM posting_ledger WHERE platform = ? AND content_file = ? AND window_key = ?',
+                (platform, content_file, window_key)
+            ).fetchone()
+        return bool(row and row[0] == "posted")
+    
+    def live_window_start(self, platform: str) -> Optional[float]:
+        """Start of a platform's live posting window, if one has begun"""
+        with self._lock:
+            row = self.db.execute('SELECT start_ts FROM posting_live_windows WHERE platform = ?', (platform,)).fetchone()
+        return row[0] if row else None
+    
+    def start_live_window(self, platform: str, start_ts: float) -> float:
+        """Begin a platform's live window unless another process already did; returns the effective start"""
+        with self._lock:
+            self.db.execute(
+                'INSERT OR IGNORE INTO posting_live_windows (platform, start_ts) VALUES (?, ?)', (platform, start_ts)
+            )
+            self.db.commit()
+            return self.db.execute('SELECT start_ts FROM posting_live_windows WHERE platform = ?', (platform,)).fetchone()[0]
+    
+    def claim(self, platform: str, content_file: str, window_key: str) -> bool:
+        """Reserve a post; False if it was already posted (or is being posted) in this window"""
+        now_ts = time.time()
+        with self._lock:
+            cursor = self.db.execute('''
+                INSERT INTO posting_ledger (platform, content_file, window_key, status, claimed_at)
+                VALUES (?, ?, ?, 'pending', ?)
+                ON CONFLICT(platform, content_file, window_key) DO UPDATE SET
+                    status = 'pending', claimed_at = excluded.claimed_at
+                WHERE posting_ledger.status = 'failed'
+                   OR (posting_ledger.status = 'pending' AND posting_ledger.claimed_at < ?)
+            ''', (platform, content_file, window_key, now_ts, now_ts - self.CLAIM_TIMEOUT_SECONDS))
+            self.db.commit()
+            return cursor.rowcount == 1
+    
+    def finish(self, platform: str, content_file: str, window_key: str, posted: bool):
+        """Settle a claim as posted or failed"""
+        with self._lock:
+            self.db.execute('''
+                UPDATE posting_ledger SET status = ?, posted_at = ?
+                WHERE platform = ? AND content_file = ? AND window_key = ?
+            ''', ("posted" if posted else "failed", time.time() if posted else None,
+                  platform, content_file, window_key))
+            self.db.commit()
+    
+    def import_twitter_state(self, state_path: Path):
+        """One-off import of the legacy twitter_post_state.json into the ledger"""
+        if not state_path.exists() or self.live_window_start("twitter") is not None:
+            return
+        try:
+            raw = state_path.read_text(encoding="utf-8").strip()
+            state = json.loads(raw) if raw else {}
+            start_ts = float(state.get("start_ts", 0) or 0)
+            if start_ts <= 0:
+                return
+            window_key = f"live-{int(start_ts)}"
+            posted = state.get("posted_files", {}) or {}
+            with self._lock:
+                self.db.execute(
+                    'INSERT OR IGNORE INTO posting_live_windows (platform, start_ts) VALUES (?, ?)', ("twitter", start_ts)
+                )
+                self.db.executemany('''
+                    INSERT OR IGNORE INTO posting_ledger (platform, content_file, window_key, status, claimed_at, posted_at)
+                    VALUES ('twitter', ?, ?, 'posted', ?, ?)
+                ''', [(name, window_key, float(ts), float(ts)) for name, ts in posted.items() if float(ts or 0) >= start_ts])
+                self.db.commit()
+            logger.info(f"Imported {len(posted)} Twitter posts from {state_path} into the posting ledger")
+        except Exception as e:
+            logger.warning(f"Could not import Twitter post state from {state_path}: {e}")
+
+
+class PostQueue:
+    """Persistent outbound post queue in engine.db with a worker pool and rate budget per platform.
+    
+    Posts are claimed with one conditional UPDATE, so workers (even in other
+    processes) never send the same row twice. A platform's workers only ever
+    wait on that platform's budget or backoff, so a slow or failing platform
+    never holds up the others. Failed posts are retried with exponential
+    backoff until POST_QUEUE_MAX_ATTEMPTS, then left as 'failed'.
+    """
+    # Posts per window; override with e.g. POST_BUDGET_FACEBOOK=50/day
+    DEFAULT_BUDGETS = {"twitter": "17/day", "facebook": "25/15m", "linkedin": "25/day", "instagram": "25/day"}
+    BUDGET_WINDOWS = {"15m": 900, "hour": 3600, "day": 86400}
+    CLAIM_TIMEOUT_SECONDS = 900  # a row left 'sending' this long (crashed worker) is requeued on start
+    
+    def __init__(self, db_conn=None, sender=None):
+        # Workers commit from their own threads, so the queue never shares the engine's connection
+        self.db = open_own_connection(db_conn)
+        self.sender = sender  # callable(platform, content_file, content) -> 'sent' | 'skipped' | 'deferred' | 'failed'
+        self._lock = threading.Lock()
+        self.max_attempts = int(os.getenv("POST_QUEUE_MAX_ATTEMPTS", "5"))
+        self.backoff_seconds = float(os.getenv("POST_QUEUE_BACKOFF_SECONDS", "60"))
+        self.poll_seconds = float(os.getenv("POST_QUEUE_POLL_SECONDS", "5"))
+        self._workers = {}  # platform -> worker threads
+        self._wakeups = {}  # platform -> Event set when new posts are queued
+        self._stopping = threading.Event()
+        self._ensure_table()
+    
+    def _ensure_table(self):
+        """Create the post queue table if it doesn't exist"""
+        cursor = self.db.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS post_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                platform TEXT NOT NULL,
+                content_file TEXT NOT NULL,
+                content TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                claimed_at REAL,
+                sent_at REAL,
+                last_error TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_post_queue_due ON post_queue (platform, status, priority DESC, next_attempt_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_post_queue_sent ON post_queue (platform, sent_at)')
+        # At most one outstanding post per platform and file
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_post_queue_outstanding ON post_queue (platform, content_file)
+            WHERE status IN ('queued', 'sending')
+        ''')
+        self.db.commit()
+    
+    def budget(self, platform: str) -> Tuple[int, int]:
+        """(posts, window seconds) allowed for platform"""
+        spec = os.getenv(f"POST_BUDGET_{platform.upper()}", self.DEFAULT_BUDGETS.get(platform, "25/day"))
+        count, _, window = spec.partition("/")
+        return int(count), self.BUDGET_WINDOWS.get(window.strip().lower(), 86400)
+    
+    def enqueue(self, platform: str, content_file: str, content: str, priority: int = 0) -> bool:
+        """Queue a post; True if it is new. A post already waiting for the same file gets the newer content and higher priority"""
+        now_ts = time.time()
+        with self._lock:
+            row = self.db.execute('''
+                INSERT INTO post_queue (platform, content_file, content, priority, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(platform, content_file) WHERE status IN ('queued', 'sending') DO UPDATE SET
+                    content = excluded.content,
+                    priority = MAX(post_queue.priority, excluded.priority)
+                WHERE post_queue.status = 'queued'
+                RETURNING created_at
+            ''', (platform, content_file, content, priority, now_ts, now_ts)).fetchone()
+            self.db.commit()
+            queued = bool(row) and row[0] == now_ts
+        if queued and platform in self._wakeups:
+            self._wakeups[platform].set()
+        return queued
+    
+    def start(self, platforms: List[str]):
+        """Start a worker pool per platform (POST_WORKERS_<PLATFORM>, default 1)"""
+        self._stopping.clear()
+        with self._lock:
+            # Requeue posts whose worker died mid-send
+            self.db.execute(
+                "UPDATE post_queue SET status = 'queued' WHERE status = 'sending' AND claimed_at < ?",
+                (time.time() - self.CLAIM_TIMEOUT_SECONDS,)
+            )
+            self.db.commit()
+        for platform in platforms:
+            if self._workers.get(platform):
+                continue
+            self._wakeups[platform] = threading.Event()
+            worker_count = int(os.getenv(f"POST_WORKERS_{platform.upper()}", "1"))
+            self._workers[platform] = [
+                threading.Thread(target=self._run_worker, args=(platform,), name=f"post-queue-{platform}-{i}", daemon=True)
+                for i in range(worker_count)
+            ]
+            for worker in self._workers[platform]:
+                worker.start()
+            logger.info(f"Post queue: {worker_count} worker(s) for {platform}, budget {self.budget(platform)[0]} per {self.budget(platform)[1] // 60} min")
+    
+    def stop(self, timeout: float = 10.0):
+        """Stop all workers; posts still queued stay in engine.db for the next start"""
+        self._stopping.set()
+        for wakeup in self._wakeups.values():
+            wakeup.set()
+        for workers in self._workers.values():
+            for worker in workers:
+                worker.join(timeout)
+        self._workers.clear()
+        self._wakeups.clear()
+    
+    def _run_worker(self, platform: str):
+        wakeup = self._wakeups[platform]
+        while not self._stopping.is_set():
+            job, wait = self._claim_next(platform)
+            if job is None:
+                wakeup.wait(min(wait, self.poll_seconds * 12) if wait else self.poll_seconds)
+                wakeup.clear()
+                continue
+            post_id, content_file, content, attempts = job
+            try:
+                outcome = self.sender(platform, content_file, content)
+                error = None if outcome != "failed" else "post was not accepted"
+            except Exception as e:
+                outcome, error = "failed", str(e)
+            self._complete(post_id, attempts, outcome, error)
+    
+    def _claim_next(self, platform: str) -> Tuple[Optional[Tuple[int, str, str, int]], float]:
+        """Claim the highest-priority due post within budget; otherwise (None, seconds until budget frees up)"""
+        limit, window = self.budget(platform)
+        now_ts = time.time()
+        with self._lock:
+            used, oldest = self.db.execute('''
+                SELECT COUNT(*), MIN(COALESCE(sent_at, claimed_at)) FROM post_queue
+                WHERE platform = ? AND (sent_at > ? OR status = 'sending')
+            ''', (platform, now_ts - window)).fetchone()
+            if used >= limit:
+                return None, max(1.0, (oldest or now_ts) + window - now_ts)
+            row = self.db.execute('''
+                UPDATE post_queue SET status = 'sending', attempts = attempts + 1, claimed_at = ?
+                WHERE id = (
+                    SELECT id FROM post_queue
+                    WHERE platform = ? AND status = 'queued' AND next_attempt_at <= ?
+                    ORDER BY priority DESC, next_attempt_at, id LIMIT 1
+                ) AND status = 'queued'
+                RETURNING id, content_file, content, attempts
+            ''', (now_ts, platform, now_ts)).fetchone()
+            self.db.commit()
+        return (tuple(row) if row else None), 0.0
+    
+    def _complete(self, post_id: int, attempts: int, outcome: str, error: Optional[str]):
+        now_ts = time.time()
+        with self._lock:
+            if outcome == "sent":
+                self.db.execute("UPDATE post_queue SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?", (now_ts, post_id))
+            elif outcome == "skipped":
+                self.db.execute("UPDATE post_queue SET status = 'skipped' WHERE id = ?", (post_id,))
+            elif outcome == "deferred":
+                # Platform is muted; try again later without spending an attempt
+                self.db.execute(
+                    "UPDATE post_queue SET status = 'queued', attempts = attempts - 1, next_attempt_at = ? WHERE id = ?",
+                    (now_ts + self.backoff_seconds * 5, post_id)
+                )
+            elif attempts >= self.max_attempts:
+                self.db.execute("UPDATE post_queue SET status = 'failed', last_error = ? WHERE id = ?", (error, post_id))
+                logger.warning(f"Post {post_id} failed after {attempts} attempts: {error}")
+            else:
+                delay = self.backoff_seconds * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+                self.db.execute(
+                    "UPDATE post_queue SET status = 'queued', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (now_ts + delay, error, post_id)
+                )
+            self.db.commit()
+    
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Queue depth, in-flight posts, drain rate and remaining budget per platform"""
+        now_ts = time.time()
+        with self._lock:
+            rows = self.db.execute('''
+                SELECT platform,
+                       SUM(status = 'queued'),
+                       SUM(status = 'sending'),
+                       SUM(status = 'failed'),
+                       MIN(CASE WHEN status = 'queued' THEN created_at END),
+                       SUM(sent_at > ?)
+                FROM post_queue
+                WHERE status IN ('queued', 'sending', 'failed') OR sent_at > ?
+                GROUP BY platform
+            ''', (now_ts - 3600, now_ts - 86400)).fetchall()
+        metrics = {}
+        for platform, queued, sending, failed, oldest, sent_last_hour in rows:
+            limit, window = self.budget(platform)
+            metrics[platform] = {
+                "depth": queued or 0,
+                "in_flight": sending or 0,
+                "failed": failed or 0,
+                "oldest_queued_seconds": round(now_ts - oldest) if oldest else 0,
+                "drain_rate_per_hour": sent_last_hour or 0,
+                "budget": f"{limit}/{window // 60}min",
+                "workers": len(self._workers.get(platform, [])),
+            }
+        return metrics
 
 
 class ContentSyndicator:
     """REAL content syndication - distributes content with affiliate links"""
-    def __init__(self, affiliate_manager, products_dir: Path = Path("./products"), viral_template_manager=None, shopify_manager=None):
+    PLATFORM_LIMITS = {"twitter": 280, "facebook": 5000, "linkedin": 3000, "instagram": 2200}
+    
+    def __init__(self, affiliate_manager, products_dir: Path = Path("./products"), viral_template_manager=None, shopify_manager=None, db_conn=None,
+                 documents: Optional[DocumentIngestor] = None):
         self.affiliate_manager = affiliate_manager
         self.products_dir = products_dir
         self.syndicated_count = 0
         self.viral_template_manager = viral_template_manager
         self.shopify_manager = shopify_manager
-        self._twitter_state_path = Path("./data/twitter_post_state.json")
-        self._twitter_state_lock = threading.Lock()
         self._platform_status = {}  # Track platform health
+        self._campaign_matcher = None  # (campaign count, KeywordAutomaton, keyword -> [(position, campaign, product name)])
+        # Social renders: (content hash, catalog version) -> parsed content, and
+        # (content hash, catalog version, platform, max length) -> rendered text
+        self._parsed_cache = OrderedDict()
+        self._render_cache = OrderedDict()
+        self._render_cache_size = int(os.getenv('SOCIAL_RENDER_CACHE_SIZE', '1024'))
+        self._render_cache_lock = threading.Lock()
+        self.db = db_conn
+        self.posting_ledger = PostingLedger(db_conn)
+        self.posting_ledger.import_twitter_state(Path("./data/twitter_post_state.json"))
+        self.post_queue = PostQueue(db_conn, sender=self._send_queued_post)
+        self.documents = documents or DocumentIngestor(db_conn)
+        self._manifest = {}  # content file name -> last syndicated state
+        if self.db:
+            self._ensure_manifest_table()
+            self._load_manifest()
+    
+    def _ensure_manifest_table(self):
+        """Create the syndication manifest table if it doesn't exist"""
+        self.db.cursor().execute('''
+            CREATE TABLE IF NOT EXISTS syndication_manifest (
+                content_file TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                catalog_version TEXT,
+                link_signature TEXT,
+                syndicated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.db.commit()
+    
+    def _load_manifest(self):
+        """Load the syndication manifest from engine.db"""
+        rows = self.db.cursor().execute(
+            'SELECT content_file, content_hash, mtime, size, catalog_version, link_signature FROM syndication_manifest'
+        ).fetchall()
+        for content_file, content_hash, mtime, size, catalog_version, link_signature in rows:
+            self._manifest[content_file] = {
+                "content_hash": content_hash, "mtime": mtime, "size": size,
+                "catalog_version": catalog_version, "link_signature": link_signature,
+            }
+    
+    def _save_manifest_entry(self, content_file: str, entry: Dict[str, Any], syndicated: bool):
+        """Record a file's state; syndicated_at only moves when the file was actually re-syndicated"""
+        self._manifest[content_file] = entry
+        if not self.db:
+            return
+        try:
+            self.db.cursor().execute('''
+                INSERT INTO syndication_manifest (content_file, content_hash, mtime, size, catalog_version, link_signature)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(content_file) DO UPDATE SET
+                    content_hash = excluded.content_hash,
+                    mtime = excluded.mtime,
+                    size = excluded.size,
+                    catalog_version = excluded.catalog_version,
+                    link_signature = excluded.link_signature,
+                    syndicated_at = CASE WHEN ? THEN CURRENT_TIMESTAMP ELSE syndicated_at END
+            ''', (content_file, entry["content_hash"], entry["mtime"], entry["size"],
+                  entry["catalog_version"], entry["link_signature"], int(syndicated)))
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not update syndication manifest for {content_file}: {e}")
+    
+    def _forget_manifest_entries(self, content_files):
+        """Drop manifest entries for content files that no longer exist"""
+        for content_file in content_files:
+            self._manifest.pop(content_file, None)
+        if self.db and content_files:
+            self.db.cursor().executemany(
+                'DELETE FROM syndication_manifest WHERE content_file = ?', [(f,) for f in content_files]
+            )
+            self.db.commit()
+    
+    def _catalog_version(self) -> str:
+        """Cheap fingerprint of everything links are embedded from (campaigns and the Shopify catalog)"""
+        campaigns = self.affiliate_manager.campaigns
+        # Local-only campaigns get real tracking links once registered with the marketing agent
+        registered = sum(1 for c in campaigns if c.get("marketing_agent_id"))
+        shopify_version = ""
+        if self.shopify_manager and self.shopify_manager.enabled:
+            shopify_version = self.shopify_manager.catalog_fingerprint()
+        return f"{len(campaigns)}:{registered}:{shopify_version}"
+    
+    def _link_signature(self, content: str) -> str:
+        """Hash of the campaigns and Shopify product that would be linked from content"""
+        parts = sorted(
+            f"{campaign['id']}:{campaign.get('product_url', '')}:{campaign.get('marketing_agent_id') or ''}:{product_name}"
+            for campaign, product_name in self._matching_gumroad_campaigns(content)
+        )
+        if self.shopify_manager and self.shopify_manager.enabled:
+            product = self.shopify_manager.find_matching_product(content)
+            if product:
+                parts.append(f"shopify:{product.get('id')}:{product.get('handle', '')}:{product.get('title', '')}")
+        return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()
+    
+    def content_files(self) -> List[Path]:
+        """Files in products/ that can be syndicated: Markdown content and PDF products"""
+        if not self.products_dir.exists():
+            return []
+        return sorted(list(self.products_dir.glob("*.md")) + list(self.products_dir.glob("*.pdf")))
     
-    def syndicate_content(self, content_file: Path, platforms: List[str] = None) -> int:
+    def read_content(self, content_file: Path) -> str:
+        """Text of a content file; PDFs are served from their cached extraction"""
+        if self.documents.handles(content_file):
+            return self.documents.text(content_file)
+        return content_file.read_text(encoding='utf-8') if content_file.exists() else ""
+    
+    def syndicate_content(self, content_file: Path, platforms: List[str] = None, content: Optional[str] = None) -> int:
         """Syndicate content to multiple platforms with affiliate links"""
         if not content_file.exists():
             return 0
         platforms = platforms or ["instagram", "twitter"]
-        content = content_file.read_text(encoding='utf-8')
+        if content is None:
+            content = self.read_content(content_file)
         # Embed affiliate links with default platform (first in list)
         default_platform = platforms[0] if platforms else "social"
         enhanced_content = self._embed_affiliate_links(content, platform=default_platform)
@@ -2245,62 +4209,181 @@ class ContentSyndicator:
     
     def _embed_affiliate_links(self, content: str, platform: str = "social") -> str:
         """Embed affiliate links in content - supports both Gumroad and Shopify products"""
-        enhanced = content
-        
-        # 1. Check Gumroad affiliate campaigns
-        gumroad_token = os.getenv('GUMROAD_TOKEN')
-        if gumroad_token and self.affiliate_manager.campaigns:
-            for campaign in self.affiliate_manager.campaigns:
-                campaign_name = campaign.get("name", "")
-                # Remove "Affiliate - " prefix for matching
-                product_name = campaign_name.replace("Affiliate - ", "").strip()
-                # Try matching with and without prefix
-                if product_name and (product_name.lower() in content.lower() or campaign_name.lower() in content.lower()):
-                    link = self.affiliate_manager.generate_affiliate_link(campaign["id"], campaign.get("product_url", ""))
-                    if link and link != campaign.get("product_url", ""):  # Only replace if link was actually generated
-                        # Replace the actual product name found in content (not the campaign name)
-                        enhanced = enhanced.replace(product_name, f"{product_name} [Get it here: {link}]")
-                        logger.debug(f"Embedded Gumroad affiliate link for {product_name}: {link}")
+        replacements, shopify_product = self._resolve_affiliate_links(content)
+        return self._apply_affiliate_links(content, replacements, shopify_product, platform)
+    
+    def _resolve_affiliate_links(self, content: str) -> Tuple[Dict[str, str], Optional[Dict[str, Any]]]:
+        """Work out which links content should carry: Gumroad product name -> replacement text, and the matching Shopify product"""
+        replacements = {}
+        
+        # 1. Check Gumroad affiliate campaigns (all matches resolved in one batch)
+        matches = self._matching_gumroad_campaigns(content)
+        if matches:
+            links = self.affiliate_manager.generate_affiliate_links(
+                [(campaign["id"], campaign.get("product_url", ""), "") for campaign, _ in matches]
+            )
+            for campaign, product_name in matches:
+                link = links.get((campaign["id"], campaign.get("product_url", ""), ""))
+                if link and link != campaign.get("product_url", ""):  # Only replace if link was actually generated
+                    replacements.setdefault(product_name, f"{product_name} [Get it here: {link}]")
+                    logger.debug(f"Embedded Gumroad affiliate link for {product_name}: {link}")
         
         # 2. Check Shopify products
+        shopify_product = None
         if self.shopify_manager and self.shopify_manager.enabled:
             shopify_product = self.shopify_manager.find_matching_product(content)
-            if shopify_product:
-                product_title = shopify_product.get("title", "")
-                product_handle = shopify_product.get("handle", "")
-                
-                # Generate Shopify product URL with UTM tracking
-                shopify_url = self.shopify_manager.get_product_url(
-                    product_handle,
-                    utm_source="cash_engine",
-                    utm_medium="social",
-                    utm_campaign=platform
-                )
-                
-                if shopify_url and product_title:
-                    # Only add link if not already present in content
-                    if shopify_url not in enhanced and product_handle not in enhanced:
-                        # Insert after first mention of product title
-                        if product_title.lower() in enhanced.lower():
-                            # Find first occurrence (case-insensitive)
-                            pattern = re.compile(re.escape(product_title), re.IGNORECASE)
-                            enhanced = pattern.sub(f"{product_title} [Get it here: {shopify_url}]", enhanced, count=1)
-                            logger.debug(f"Embedded Shopify product link for {product_title}: {shopify_url}")
-                        else:
-                            # Product matched by keywords but title not in content - append link
-                            enhanced = f"{enhanced}\n\n🔗 Check out: {shopify_url}"
-                            logger.debug(f"Appended Shopify product link for {product_title}: {shopify_url}")
+        return replacements, shopify_product
+    
+    def _apply_affiliate_links(self, content: str, replacements: Dict[str, str],
+                               shopify_product: Optional[Dict[str, Any]], platform: str) -> str:
+        """Insert resolved affiliate links into content, with platform-specific Shopify tracking"""
+        enhanced = content
+        present = {name: text for name, text in replacements.items() if name in enhanced}
+        if present:
+            # Replace the actual product names found in content (not the campaign names) in one pass
+            pattern = re.compile("|".join(re.escape(name) for name in sorted(present, key=len, reverse=True)))
+            enhanced = pattern.sub(lambda m: present[m.group(0)], enhanced)
+        
+        if shopify_product:
+            product_title = shopify_product.get("title", "")
+            product_handle = shopify_product.get("handle", "")
+            
+            # Generate Shopify product URL with UTM tracking
+            shopify_url = self.shopify_manager.get_product_url(
+                product_handle,
+                utm_source="cash_engine",
+                utm_medium="social",
+                utm_campaign=platform
+            )
+            
+            if shopify_url and product_title:
+                # Only add link if not already present in content
+                if shopify_url not in enhanced and product_handle not in enhanced:
+                    # Insert after first mention of product title
+                    if product_title.lower() in enhanced.lower():
+                        # Find first occurrence (case-insensitive)
+                        pattern = re.compile(re.escape(product_title), re.IGNORECASE)
+                        enhanced = pattern.sub(f"{product_title} [Get it here: {shopify_url}]", enhanced, count=1)
+                        logger.debug(f"Embedded Shopify product link for {product_title}: {shopify_url}")
+                    else:
+                        # Product matched by keywords but title not in content - append link
+                        enhanced = f"{enhanced}\n\n🔗 Check out: {shopify_url}"
+                        logger.debug(f"Appended Shopify product link for {product_title}: {shopify_url}")
         
         return enhanced
     
+    def _matching_gumroad_campaigns(self, content: str) -> List[Tuple[Dict[str, Any], str]]:
+        """Gumroad affiliate campaigns mentioned in content, with the product name to link"""
+        if not os.getenv('GUMROAD_TOKEN') or not self.affiliate_manager.campaigns:
+            return []
+        campaigns = self.affiliate_manager.campaigns
+        # Campaigns are only ever appended, so the count tells us when to rebuild
+        if self._campaign_matcher is None or self._campaign_matcher[0] != len(campaigns):
+            by_name = defaultdict(list)
+            for position, campaign in enumerate(campaigns):
+                # Remove "Affiliate - " prefix for matching; a mention of the full
+                # campaign name always contains the product name as well
+                product_name = campaign.get("name", "").replace("Affiliate - ", "").strip()
+                if product_name:
+                    by_name[product_name.lower()].append((position, campaign, product_name))
+            self._campaign_matcher = (len(campaigns), KeywordAutomaton(by_name.keys()), by_name)
+        _, automaton, by_name = self._campaign_matcher
+        # Keep campaign creation order
+        hits = sorted(hit for keyword in automaton.find_all(content) for hit in by_name[keyword])
+        return [(campaign, product_name) for _, campaign, product_name in hits]
+    
+    @staticmethod
+    def _detect_topic(content: str) -> Optional[str]:
+        """Detect the viral-template topic of content (simple keyword matching)"""
+        topic_keywords = {
+            "entrepreneur": ["entrepreneur", "startup", "business"],
+            "passiveincome": ["passive", "income", "wealth", "money"],
+            "business": ["business", "revenue", "profit", "growth"]
+        }
+        content_lower = content.lower()
+        for topic, keywords in topic_keywords.items():
+            if any(keyword in content_lower for keyword in keywords):
+                return topic
+        return None
+    
+    def _topic_campaign(self, content: str) -> Optional[Dict[str, Any]]:
+        """Affiliate campaign for the viral-template topic detected in content"""
+        topic = self._detect_topic(content)
+        if not topic:
+            return None
+        return next((c for c in self.affiliate_manager.campaigns if topic in c.get("name", "").lower()), None)
+    
+    def prefetch_affiliate_links(self, contents: List[str]) -> int:
+        """Resolve every affiliate link a syndication run will need in a single batch request"""
+        link_requests = []
+        for content in contents:
+            for campaign, _ in self._matching_gumroad_campaigns(content):
+                link_requests.append((campaign["id"], campaign.get("product_url", ""), ""))
+            if getattr(self, 'viral_template_manager', None) and self.affiliate_manager.campaigns:
+                campaign = self._topic_campaign(content)
+                if campaign:
+                    link_requests.append((campaign["id"], campaign.get("product_url", ""), ""))
+        if not link_requests:
+            return 0
+        return len(self.affiliate_manager.generate_affiliate_links(link_requests))
+    
     def auto_syndicate_from_folder(self) -> int:
         """Automatically syndicate all content from products folder (REVENUE GENERATION)"""
+        return len(self.syndicate_changed_files())
+    
+    def syndicate_changed_files(self) -> List[Path]:
+        """Syndicate content files that changed, or whose matching campaigns changed, since the last run.
+        
+        A file whose mtime and size match the manifest is skipped without being
+        read while the campaign/catalog fingerprint is unchanged. Otherwise it is
+        hashed, and only re-syndicated if its content or the links it would get
+        actually differ.
+        """
         if not self.products_dir.exists():
-            return 0
-        syndicated = 0
-        for content_file in self.products_dir.glob("*.md"):
-            if self.syndicate_content(content_file):
-                syndicated += 1
+            return []
+        catalog_version = self._catalog_version()
+        candidates = []  # (content file, stat, manifest entry)
+        seen = set()
+        for content_file in self.content_files():
+            seen.add(content_file.name)
+            stat = content_file.stat()
+            entry = self._manifest.get(content_file.name)
+            if (entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size
+                    and entry["catalog_version"] == catalog_version):
+                continue
+            candidates.append((content_file, stat, entry))
+        
+        # Extract any new PDFs in one batch (in parallel) before reading them below
+        self.documents.ingest([f for f, _, _ in candidates if self.documents.handles(f)])
+        pending = []  # (content file, manifest entry, content)
+        for content_file, stat, entry in candidates:
+            content = self.read_content(content_file)
+            if not content:
+                continue
+            new_entry = {
+                "content_hash": hashlib.sha256(content.encode('utf-8')).hexdigest(),
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "catalog_version": catalog_version,
+                "link_signature": self._link_signature(content),
+            }
+            if (entry and entry["content_hash"] == new_entry["content_hash"]
+                    and entry["link_signature"] == new_entry["link_signature"]):
+                # Touched, or the catalog moved on without affecting this file
+                self._save_manifest_entry(content_file.name, new_entry, syndicated=False)
+                continue
+            pending.append((content_file, new_entry, content))
+        
+        self._forget_manifest_entries([name for name in self._manifest if name not in seen])
+        if not pending:
+            return []
+        
+        self.prefetch_affiliate_links([content for _, _, content in pending])
+        syndicated = []
+        for content_file, entry, content in pending:
+            if self.syndicate_content(content_file, content=content):
+                self._save_manifest_entry(content_file.name, entry, syndicated=True)
+                syndicated.append(content_file)
         return syndicated
     
     def auto_distribute_to_platforms(self, content_file: Path, platforms: List[str] = None) -> Dict[str, bool]:
@@ -2316,39 +4399,16 @@ class ContentSyndicator:
         
         try:
             # Read syndicated content
-            content = content_file.read_text(encoding='utf-8') if content_file.exists() else ""
+            content = self.read_content(content_file)
             if not content:
                 return results
             
-            # Extract key content for social media (first 280 chars for Twitter, etc.)
-            # Pass platform to enable viral template generation
-            platform_map = {
-                "twitter": "twitter",
-                "x": "twitter",
-                "instagram": "instagram",
-                "linkedin": "linkedin",
-                "facebook": "facebook"
-            }
-            current_platform = platform_map.get(platforms[0].lower() if platforms else "twitter", "twitter")
-            social_content = self._format_for_social(content, platform=current_platform)
-            
             # Distribute to each platform (with platform-specific formatting)
             for platform in platforms:
                 try:
                     # Format content for this specific platform
                     platform_content = self._format_for_social(content, platform=platform.lower())
-                    
-                    if platform.lower() == "twitter" or platform.lower() == "x":
-                        results[platform] = self._post_to_twitter(platform_content, content_file)
-                    elif platform.lower() == "instagram":
-                        results[platform] = self._post_to_instagram(platform_content, content_file)
-                    elif platform.lower() == "linkedin":
-                        results[platform] = self._post_to_linkedin(platform_content, content_file)
-                    elif platform.lower() == "facebook":
-                        results[platform] = self._post_to_facebook(platform_content, content_file)
-                    else:
-                        logger.warning(f"Platform {platform} not yet supported for auto-distribution")
-                        results[platform] = False
+                    results[platform] = self._send_to_platform(platform.lower(), platform_content, content_file)
                 except Exception as e:
                     logger.error(f"Error posting to {platform}: {e}")
                     results[platform] = False
@@ -2359,123 +4419,160 @@ class ContentSyndicator:
             logger.error(f"Error in auto_distribute_to_platforms: {e}")
             return results
     
+    def _send_to_platform(self, platform: str, content: str, content_file: Path, max_attempts: int = 3) -> bool:
+        """Post already-formatted content to one platform"""
+        if platform in ("twitter", "x"):
+            return self._post_to_twitter(content, content_file)
+        elif platform == "instagram":
+            return self._post_to_instagram(content, content_file, max_attempts=max_attempts)
+        elif platform == "linkedin":
+            return self._post_to_linkedin(content, content_file, max_attempts=max_attempts)
+        elif platform == "facebook":
+            return self._post_to_facebook(content, content_file, max_attempts=max_attempts)
+        logger.warning(f"Platform {platform} not yet supported for auto-distribution")
+        return False
+    
+    def enqueue_distribution(self, content_file: Path, platforms: List[str], priority: int = 0) -> int:
+        """Render content for each platform and add it to the outbound post queue"""
+        content = self.read_content(content_file)
+        if not content:
+            return 0
+        status = self.get_platform_status()
+        twitter_live = os.getenv("TWITTER_LIVE_POSTING", "false").lower() in ("1", "true", "yes", "on")
+        queued = 0
+        for platform in platforms:
+            platform = "twitter" if platform.lower() == "x" else platform.lower()
+            if not status.get(platform, {}).get("configured") or (platform == "twitter" and not twitter_live):
+                logger.debug(f"{platform} not configured for posting - not queuing {content_file.name}")
+                continue
+            if self.posting_ledger.already_posted(platform, content_file.name):
+                continue
+            platform_content = self._format_for_social(content, platform=platform)
+            if platform_content and self.post_queue.enqueue(platform, content_file.name, platform_content, priority):
+                queued += 1
+        return queued
+    
+    def _send_queued_post(self, platform: str, content_file: str, content: str) -> str:
+        """Post-queue sender: one attempt per call, retries are scheduled by the queue"""
+        if self.posting_ledger.already_posted(platform, content_file):
+            return "skipped"
+        if not self._check_platform_status(platform):
+            return "deferred"
+        posted = self._send_to_platform(platform, content, self.products_dir / content_file, max_attempts=1)
+        return "sent" if posted else "failed"
+    
     def _format_for_social(self, content: str, max_length: int = 280, platform: str = "twitter") -> str:
-        """Format content for social media platforms with platform-specific rules"""
-        # Platform-specific limits
-        platform_limits = {
-            "twitter": 280,
-            "facebook": 5000,
-            "linkedin": 3000,
-            "instagram": 2200
-        }
-        max_length = platform_limits.get(platform.lower(), max_length)
-        
-        # Check if viral templates are enabled and manager is available
-        viral_manager = getattr(self, 'viral_template_manager', None)
-        if viral_manager and self.affiliate_manager.campaigns:
-            # Try to generate viral content based on content topic
-            # Extract topic from content (simple keyword matching)
-            topic_keywords = {
-                "entrepreneur": ["entrepreneur", "startup", "business"],
-                "passiveincome": ["passive", "income", "wealth", "money"],
-                "business": ["business", "revenue", "profit", "growth"]
-            }
-            
-            detected_topic = None
-            content_lower = content.lower()
-            for topic, keywords in topic_keywords.items():
-                if any(keyword in content_lower for keyword in keywords):
-                    detected_topic = topic
-                    break
-            
-            if detected_topic:
-                # Get affiliate link if available
-                affiliate_link = None
-                for campaign in self.affiliate_manager.campaigns:
-                    if detected_topic.lower() in campaign.get("name", "").lower():
-                        affiliate_link = self.affiliate_manager.generate_affiliate_link(
-                            campaign["id"], 
-                            campaign.get("product_url", "")
-                        )
-                        break
-                
-                # Generate viral content
-                viral_content = viral_manager.generate_for_topic(
-                    detected_topic, 
-                    platform, 
-                    affiliate_link
-                )
-                
-                if viral_content:
-                    import logging
-                    logging.debug(f"Generated viral content for {detected_topic} on {platform}")
-                    return viral_content[:max_length]
+        """Format content for social media platforms with platform-specific rules
+        
+        Renders are memoized per (content hash, catalog version, platform), so
+        every platform variant of a file comes from one parse and one round of
+        link resolution.
+        """
+        platform = platform.lower()
+        max_length = self.PLATFORM_LIMITS.get(platform, max_length)
+        parsed = self._parse_content(content)
+        key = (parsed["hash"], parsed["catalog_version"], platform, max_length)
+        rendered = self._cache_get(self._render_cache, key)
+        if rendered is None:
+            rendered = self._render_for_platform(parsed, platform, max_length)
+            self._cache_put(self._render_cache, key, rendered)
+        return rendered
+    
+    def _parse_content(self, content: str) -> Dict[str, Any]:
+        """Parse markdown once into the structured form every platform rendering starts from"""
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        catalog_version = self._catalog_version()
+        key = (content_hash, catalog_version)
+        parsed = self._cache_get(self._parsed_cache, key)
+        if parsed is not None:
+            return parsed
         
-        # Fallback to original formatting with platform-specific rules
         lines = content.split('\n')
         title = ""
         body = ""
-        
         for line in lines[:10]:
             if line.strip().startswith('#') and not title:
                 title = line.strip('#').strip()
             elif line.strip() and not body and not line.strip().startswith('#'):
                 body = line.strip()
                 break
+        if title and body:
+            summary = f"{title}\n\n{body}"
+        else:
+            summary = title or body or content
+        
+        # Viral templates: topic and its affiliate link are the same for every platform
+        topic = None
+        topic_link = None
+        if getattr(self, 'viral_template_manager', None) and self.affiliate_manager.campaigns:
+            topic = self._detect_topic(content)
+            campaign = self._topic_campaign(content) if topic else None
+            if campaign:
+                topic_link = self.affiliate_manager.generate_affiliate_link(campaign["id"], campaign.get("product_url", ""))
+        
+        replacements, shopify_product = self._resolve_affiliate_links(summary)
+        parsed = {
+            "hash": content_hash,
+            "catalog_version": catalog_version,
+            "content": content,
+            "title": title,
+            "body": body,
+            "summary": summary,
+            "topic": topic,
+            "topic_link": topic_link,
+            "link_replacements": replacements,
+            "shopify_product": shopify_product,
+        }
+        self._cache_put(self._parsed_cache, key, parsed)
+        return parsed
+    
+    def _render_for_platform(self, parsed: Dict[str, Any], platform: str, max_length: int) -> str:
+        """Render parsed content for one platform"""
+        # Check if viral templates are enabled and a topic was detected
+        viral_manager = getattr(self, 'viral_template_manager', None)
+        if viral_manager and parsed["topic"]:
+            viral_content = viral_manager.generate_for_topic(parsed["topic"], platform, parsed["topic_link"])
+            if viral_content:
+                logger.debug(f"Generated viral content for {parsed['topic']} on {platform}")
+                return viral_content[:max_length]
         
-        # Platform-specific formatting
-        if platform.lower() == "linkedin":
-            # LinkedIn: Professional tone, no hashtags in main text
-            if title and body:
-                social_text = f"{title}\n\n{body}"
-            elif title:
-                social_text = title
-            elif body:
-                social_text = body
-            else:
-                social_text = content
-            # Remove hashtags from main text (can add in comments later)
-            social_text = re.sub(r'#\w+', '', social_text)
-        
-        elif platform.lower() == "facebook":
-            # Facebook: Supports links, images, hashtags (max 30)
-            if title and body:
-                social_text = f"{title}\n\n{body}"
-            elif title:
-                social_text = title
-            elif body:
-                social_text = body
-            else:
-                social_text = content
-        
-        elif platform.lower() == "instagram":
-            # Instagram: Hashtags (max 30), emoji-friendly
-            if title and body:
-                social_text = f"{title}\n\n{body}"
-            elif title:
-                social_text = title
-            elif body:
-                social_text = body
-            else:
-                social_text = content
-        
+        # Fallback to original formatting with platform-specific rules
+        title, body = parsed["title"], parsed["body"]
+        if platform == "linkedin":
+            # LinkedIn: Professional tone, no hashtags in main text (can add in comments later)
+            social_text = re.sub(r'#\w+', '', parsed["summary"])
+        elif platform in ("facebook", "instagram"):
+            # Facebook: links, images, hashtags (max 30); Instagram: hashtags (max 30), emoji-friendly
+            social_text = parsed["summary"]
         else:  # Twitter or default
             # Twitter: 280 chars, concise
             if title and body:
                 social_text = f"{title}\n\n{body[:max_length - len(title) - 3]}..."
-            elif title:
-                social_text = title[:max_length]
-            elif body:
-                social_text = body[:max_length]
             else:
-                social_text = content[:max_length]
+                social_text = parsed["summary"][:max_length]
         
         # Embed affiliate links (Gumroad and Shopify) with platform-specific tracking
-        social_text = self._embed_affiliate_links(social_text, platform=platform.lower())
+        social_text = self._apply_affiliate_links(
+            social_text, parsed["link_replacements"], parsed["shopify_product"], platform
+        )
         
         # Final length check and return
         return social_text[:max_length].strip()
     
+    def _cache_get(self, cache: OrderedDict, key):
+        with self._render_cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+    
+    def _cache_put(self, cache: OrderedDict, key, value):
+        with self._render_cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self._render_cache_size:
+                cache.popitem(last=False)
+    
     def _post_to_twitter(self, content: str, content_file: Path) -> bool:
         """Post content to Twitter/X (requires API keys)"""
         twitter_api_key = os.getenv('TWITTER_API_KEY')
@@ -2492,36 +4589,28 @@ class ContentSyndicator:
             logger.info("Twitter live posting disabled (TWITTER_LIVE_POSTING=false) - skipping auto-post")
             return False
 
-        # Enforce live window (default 12h) starting at first successful tweet
+        payload = {"text": (content or "").strip()[:280]}
+        if not payload["text"]:
+            return False
+
+        # Enforce live window (default 12h) starting at the first tweet attempt
         duration_hours = float(os.getenv("TWITTER_LIVE_POSTING_DURATION_HOURS", "12"))
         now_ts = datetime.now().timestamp()
-
-        state: Dict[str, Any] = {}
-        start_ts: float = 0.0
-        try:
-            with self._twitter_state_lock:
-                self._twitter_state_path.parent.mkdir(parents=True, exist_ok=True)
-                if self._twitter_state_path.exists():
-                    raw = self._twitter_state_path.read_text(encoding="utf-8").strip()
-                    state = json.loads(raw) if raw else {}
-                start_ts = float(state.get("start_ts", 0) or 0)
-                if start_ts > 0 and (now_ts - start_ts) > (duration_hours * 3600):
-                    logger.info("Twitter live posting window expired - skipping auto-post")
-                    return False
-        except Exception as e:
-            logger.warning(f"Twitter post state read failed (continuing): {e}")
+        start_ts = self.posting_ledger.live_window_start("twitter")
+        if start_ts and (now_ts - start_ts) > (duration_hours * 3600):
+            logger.info("Twitter live posting window expired - skipping auto-post")
+            return False
+        if not start_ts:
+            # Opened before claiming, so every process claims under the same key and a claim never moves
+            start_ts = self.posting_ledger.start_live_window("twitter", now_ts)
 
         # De-dupe: don't repost same file during the current live window
-        try:
-            posted = state.get("posted_files", {}) if isinstance(state, dict) else {}
-            if isinstance(posted, dict) and start_ts > 0:
-                last_post_ts = float(posted.get(content_file.name, 0) or 0)
-                if last_post_ts >= start_ts:
-                    logger.info(f"Twitter already posted during this live window: {content_file.name} - skipping")
-                    return False
-        except Exception:
-            pass
+        window_key = f"live-{int(start_ts)}"
+        if not self.posting_ledger.claim("twitter", content_file.name, window_key):
+            logger.info(f"Twitter already posted during this live window: {content_file.name} - skipping")
+            return False
         
+        posted = False
         try:
             url = "https://api.twitter.com/2/tweets"
             auth = OAuth1(
@@ -2531,10 +4620,6 @@ class ContentSyndicator:
                 resource_owner_secret=twitter_access_secret,
             )
 
-            payload = {"text": (content or "").strip()[:280]}
-            if not payload["text"]:
-                return False
-
             resp = requests.post(url, json=payload, auth=auth, timeout=15)
             if resp.status_code not in (200, 201):
                 logger.error(f"Twitter post failed: HTTP {resp.status_code} - {resp.text[:500]}")
@@ -2543,28 +4628,28 @@ class ContentSyndicator:
             data = resp.json() if resp.content else {}
             tweet_id = (data.get("data") or {}).get("id")
             logger.info(f"✅ Posted to Twitter/X ({content_file.name}) tweet_id={tweet_id}")
-
-            # Persist live window + per-file state
-            try:
-                with self._twitter_state_lock:
-                    state = state if isinstance(state, dict) else {}
-                    if not state.get("start_ts"):
-                        state["start_ts"] = now_ts
-                    posted = state.get("posted_files", {})
-                    if not isinstance(posted, dict):
-                        posted = {}
-                    posted[content_file.name] = now_ts
-                    state["posted_files"] = posted
-                    self._twitter_state_path.write_text(json.dumps(state, indent=2), encoding="utf-8")
-            except Exception as e:
-                logger.warning(f"Twitter post state write failed: {e}")
-
+            posted = True
             return True
         except Exception as e:
             logger.error(f"Twitter post failed: {e}")
             return False
+        finally:
+            self.posting_ledger.finish("twitter", content_file.name, window_key, posted)
+    
+    def _post_once(self, platform: str, content_file: Path, send) -> bool:
+        """Send a post unless the ledger shows it already went out in the current dedup window"""
+        window_key = self.posting_ledger.current_window_key(platform)
+        if not self.posting_ledger.claim(platform, content_file.name, window_key):
+            logger.info(f"{platform.capitalize()} already posted {content_file.name} in this window - skipping")
+            return False
+        posted = False
+        try:
+            posted = bool(send())
+            return posted
+        finally:
+            self.posting_ledger.finish(platform, content_file.name, window_key, posted)
     
-    def _post_to_instagram(self, content: str, content_file: Path) -> bool:
+    def _post_to_instagram(self, content: str, content_file: Path, max_attempts: int = 3) -> bool:
         """Post content to Instagram using Facebook Graph API (requires Instagram Business Account)"""
         instagram_business_account_id = os.getenv('INSTAGRAM_BUSINESS_ACCOUNT_ID')
         facebook_access_token = os.getenv('FACEBOOK_ACCESS_TOKEN')  # Same token as Facebook
@@ -2642,7 +4727,7 @@ class ContentSyndicator:
                 return False
         
         try:
-            return self._retry_api_call(_make_instagram_post, max_attempts=3, base_delay=2)
+            return self._post_once("instagram", content_file, lambda: self._retry_api_call(_make_instagram_post, max_attempts=max_attempts, base_delay=2))
         except Exception as e:
             logger.error(f"Instagram post failed after retries: {e}")
             return False
@@ -2711,7 +4796,7 @@ class ContentSyndicator:
         
         return status
     
-    def _post_to_facebook(self, content: str, content_file: Path) -> bool:
+    def _post_to_facebook(self, content: str, content_file: Path, max_attempts: int = 3) -> bool:
         """Post content to Facebook using Graph API v18.0"""
         facebook_access_token = os.getenv('FACEBOOK_ACCESS_TOKEN')
         facebook_page_id = os.getenv('FACEBOOK_PAGE_ID')
@@ -2773,12 +4858,12 @@ class ContentSyndicator:
                 return False
         
         try:
-            return self._retry_api_call(_make_facebook_post, max_attempts=3, base_delay=2)
+            return self._post_once("facebook", content_file, lambda: self._retry_api_call(_make_facebook_post, max_attempts=max_attempts, base_delay=2))
         except Exception as e:
             logger.error(f"Facebook post failed after retries: {e}")
             return False
     
-    def _post_to_linkedin(self, content: str, content_file: Path) -> bool:
+    def _post_to_linkedin(self, content: str, content_file: Path, max_attempts: int = 3) -> bool:
         """Post content to LinkedIn using API v2 (UGC Posts)"""
         linkedin_access_token = os.getenv('LINKEDIN_ACCESS_TOKEN')
         linkedin_urn = os.getenv('LINKEDIN_URN')  # Optional: e.g., "urn:li:person:123456" or "urn:li:organization:123456"
@@ -2878,7 +4963,7 @@ class ContentSyndicator:
                 return False
         
         try:
-            return self._retry_api_call(_make_linkedin_post, max_attempts=3, base_delay=2)
+            return self._post_once("linkedin", content_file, lambda: self._retry_api_call(_make_linkedin_post, max_attempts=max_attempts, base_delay=2))
         except Exception as e:
             logger.error(f"LinkedIn post failed after retries: {e}")
             return False
@@ -3082,18 +5167,22 @@ class CashEngine:
         self.risk_manager = RiskManager()
         self.execution_engine = ExecutionEngine()
         self.market_scanner = MarketScanner()
-        self.product_factory = ProductFactory(self.conn)
-        self.template_generator = TemplateGenerator(self.conn)
+        self.document_ingestor = DocumentIngestor(self.conn)
+        self.template_corpus = TemplateCorpusIndex(self.conn, documents=self.document_ingestor)
+        self.product_factory = ProductFactory(self.conn, corpus=self.template_corpus)
+        self.template_generator = TemplateGenerator(self.conn, corpus=self.template_corpus)
         self.lead_bot = LeadBot(self.conn, os.getenv('MARKETING_AGENT_URL', 'http://localhost:9000'))
-        self.affiliate_manager = AffiliateManager(os.getenv('MARKETING_AGENT_URL', 'http://localhost:9000'))
+        self.affiliate_manager = AffiliateManager(os.getenv('MARKETING_AGENT_URL', 'http://localhost:9000'), self.conn)
         self.viral_template_manager = ViralTemplateManager() if os.getenv('VIRAL_TEMPLATES_ENABLED', 'true').lower() == 'true' else None
         self.shopify_manager = ShopifyManager(self.conn)
-        self.content_syndicator = ContentSyndicator(self.affiliate_manager, viral_template_manager=self.viral_template_manager, shopify_manager=self.shopify_manager)
+        self.content_syndicator = ContentSyndicator(self.affiliate_manager, viral_template_manager=self.viral_template_manager, shopify_manager=self.shopify_manager, db_conn=self.conn,
+                                                   documents=self.document_ingestor)
         
         # Template optimization components
         self.template_ab_testing = TemplateABTesting(self.conn)
+        self.template_bandit = TemplateBandit(self.template_ab_testing)
         self.trend_analyzer = TrendAnalyzer(self.conn)
-        self.template_optimizer = TemplateOptimizer(self.conn)
+        self.template_optimizer = TemplateOptimizer(self.conn, corpus=self.template_corpus)
         
         # AI Course Corrector (includes Smart Cleanup System)
         if COURSE_CORRECTION_AVAILABLE and os.getenv('COURSE_CORRECTION_ENABLED', 'true').lower() == 'true':
@@ -3353,6 +5442,30 @@ class CashEngine:
                 date DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # One row per test variant, which the A/B counters UPSERT into; merge rows older databases may have split
+        duplicated = self.cursor.execute('''
+            SELECT 1 FROM template_ab_results GROUP BY test_id, variant_id HAVING COUNT(*) > 1 LIMIT 1
+        ''').fetchone()
+        if duplicated:
+            self.cursor.execute('''
+                UPDATE template_ab_results SET
+                    impressions = (SELECT TOTAL(d.impressions) FROM template_ab_results d
+                                   WHERE d.test_id = template_ab_results.test_id AND d.variant_id = template_ab_results.variant_id),
+                    conversions = (SELECT TOTAL(d.conversions) FROM template_ab_results d
+                                   WHERE d.test_id = template_ab_results.test_id AND d.variant_id = template_ab_results.variant_id),
+                    revenue = (SELECT TOTAL(d.revenue) FROM template_ab_results d
+                               WHERE d.test_id = template_ab_results.test_id AND d.variant_id = template_ab_results.variant_id)
+                WHERE id IN (SELECT MAX(id) FROM template_ab_results GROUP BY test_id, variant_id HAVING COUNT(*) > 1)
+            ''')
+            self.cursor.execute('''
+                DELETE FROM template_ab_results WHERE id NOT IN (SELECT MAX(id) FROM template_ab_results GROUP BY test_id, variant_id)
+            ''')
+            self.cursor.execute('''
+                UPDATE template_ab_results
+                SET conversion_rate = CASE WHEN impressions > 0 THEN CAST(conversions AS REAL) / impressions ELSE 0 END
+            ''')
+        self.cursor.execute('DROP INDEX IF EXISTS idx_template_ab_results_test')
+        self.cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_template_ab_results_variant ON template_ab_results (test_id, variant_id)')
         
         # Trend Analysis table
         self.cursor.execute('''
@@ -3464,9 +5577,10 @@ class CashEngine:
         schedule.every(8).hours.do(self.generate_products)  # Increased from 24h to 8h for faster product creation
         schedule.every(1).days.do(self.generate_daily_report)
         
-        # Shopify product sync (every 6 hours)
+        # Shopify product sync (every 6 hours) and nightly order reconcile
         if self.shopify_manager and self.shopify_manager.enabled:
             schedule.every(6).hours.do(self.sync_shopify_products)
+            schedule.every().day.at(os.getenv('SHOPIFY_RECONCILE_TIME', '03:00')).do(self.reconcile_shopify_orders)
         
         # Template optimization tasks
         if CONFIG["template_optimization"]["trend_analysis_enabled"]:
@@ -3512,6 +5626,11 @@ class CashEngine:
         scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
         scheduler_thread.start()
         
+        # Social post queue workers (one pool per platform)
+        if self._auto_distribute_enabled():
+            platforms = ["twitter" if p == "x" else p for p in self._distribution_platforms()]
+            self.content_syndicator.post_queue.start(platforms)
+        
         # Run initial execution
         self.run_revenue_streams()
         
@@ -3526,6 +5645,8 @@ class CashEngine:
     def stop(self):
         """Stop the cash engine"""
         self.is_running = False
+        self.content_syndicator.post_queue.stop()
+        self.template_ab_testing.flush()
         logger.info("🛑 CASH ENGINE STOPPED")
     
     def run_revenue_streams(self):
@@ -3566,7 +5687,9 @@ class CashEngine:
             for product in gumroad_products[:5]:  # Top 5 products
                 product_name = product.get("name", "")
                 product_url = f"https://gumroad.com/l/{product_name.lower().replace(' ', '-')}"
-                if not any(c.get("product_url") == product_url for c in self.affiliate_manager.campaigns):
+                campaign = self.affiliate_manager.get_campaign_by_product_url(product_url)
+                # Local-only campaigns are re-registered once the Marketing Agent is reachable
+                if not campaign or not campaign.get("marketing_agent_id"):
                     campaign_id = self.affiliate_manager.create_campaign(
                         f"Affiliate - {product_name}",
                         product_url,
@@ -3662,8 +5785,8 @@ class CashEngine:
                     else:
                         variant_letter = "A" if template_id == template_a_id else "B"
                     
-                    # Record conversion
-                    self.template_ab_testing.record_conversion(test_id, variant_letter, amount or 0.0)
+                    # Record conversion (counted in memory, written to template_ab_results on the next flush)
+                    self.template_bandit.record_conversion(test_id, variant_letter, amount or 0.0)
                     logger.debug(f"Recorded A/B test conversion: Test {test_id}, Variant {variant_letter}, ${amount:.2f}")
         except Exception as e:
             logger.error(f"Error recording A/B test conversions: {e}")
@@ -3680,36 +5803,34 @@ class CashEngine:
         
         try:
             # Auto-syndicate content from products folder
-            syndicated = self.content_syndicator.auto_syndicate_from_folder()
-            if syndicated > 0:
-                logger.info(f"✅ Syndicated {syndicated} content files with affiliate links")
-                # Track content syndication performance
-                for content_file in self.content_syndicator.products_dir.glob("*.md"):
+            syndicated_files = self.content_syndicator.syndicate_changed_files()
+            if syndicated_files:
+                logger.info(f"✅ Syndicated {len(syndicated_files)} content files with affiliate links")
+                # Track content syndication performance for the files that were (re)syndicated
+                for content_file in syndicated_files:
                     self.revenue_tracker.track_content_performance(
                         content_file.name, "syndicated", clicks=0, conversions=0, revenue=0.0
                     )
+            else:
+                logger.info("No content changes to syndicate")
 
-            # Optional: auto-distribute to social platforms (phased rollout)
-            if os.getenv("AUTO_DISTRIBUTE_CONTENT", "false").lower() in ("1", "true", "yes", "on"):
-                platforms_env = os.getenv("DISTRIBUTION_PLATFORMS", "")
-                if platforms_env:
-                    platforms = [p.strip() for p in platforms_env.split(",") if p.strip()]
-                else:
-                    # Default: Facebook and LinkedIn if Twitter is disabled
-                    twitter_enabled = os.getenv("TWITTER_LIVE_POSTING", "false").lower() in ("1", "true", "yes", "on")
-                    if twitter_enabled:
-                        platforms = ["twitter", "facebook", "linkedin"]
-                    else:
-                        platforms = ["facebook", "linkedin"]
-                for content_file in self.content_syndicator.products_dir.glob("*.md"):
-                    results = self.content_syndicator.auto_distribute_to_platforms(content_file, platforms=platforms)
-                    if results:
-                        ok = [k for k, v in results.items() if v]
-                        fail = [k for k, v in results.items() if not v]
-                        if ok:
-                            logger.info(f"✅ Posted {content_file.name} to: {', '.join(ok)}")
-                        if fail:
-                            logger.info(f"⚠️ Skipped/failed posting {content_file.name} to: {', '.join(fail)}")
+            # Optional: auto-distribute to social platforms (phased rollout).
+            # Posts go through the per-platform queue; its workers pace and retry them.
+            if self._auto_distribute_enabled():
+                platforms = self._distribution_platforms()
+                fresh = {f.name for f in syndicated_files}
+                queued = 0
+                # Template tests send this round's traffic to one Thompson-sampled variant each
+                for content_file in self.template_bandit.allocate(self.content_syndicator.content_files()):
+                    # Newly (re)syndicated content goes out ahead of older backlog
+                    priority = 10 if content_file.name in fresh else 0
+                    posts = self.content_syndicator.enqueue_distribution(content_file, platforms, priority=priority)
+                    arm = self.template_bandit.arm_for_template(content_file.stem)
+                    if posts and arm:
+                        self.template_bandit.record_impression(*arm, count=posts)
+                    queued += posts
+                if queued:
+                    logger.info(f"📤 Queued {queued} social posts for: {', '.join(platforms)}")
             
             # Content syndication generates revenue through affiliate commissions
             # when users click affiliate links in syndicated content
@@ -3718,6 +5839,21 @@ class CashEngine:
         except Exception as e:
             logger.error(f"Content syndication failed: {e}")
     
+    @staticmethod
+    def _auto_distribute_enabled() -> bool:
+        return os.getenv("AUTO_DISTRIBUTE_CONTENT", "false").lower() in ("1", "true", "yes", "on")
+    
+    @staticmethod
+    def _distribution_platforms() -> List[str]:
+        """Platforms to auto-distribute to (DISTRIBUTION_PLATFORMS, else Facebook/LinkedIn plus Twitter when live)"""
+        platforms_env = os.getenv("DISTRIBUTION_PLATFORMS", "")
+        if platforms_env:
+            return [p.strip().lower() for p in platforms_env.split(",") if p.strip()]
+        twitter_enabled = os.getenv("TWITTER_LIVE_POSTING", "false").lower() in ("1", "true", "yes", "on")
+        if twitter_enabled:
+            return ["twitter", "facebook", "linkedin"]
+        return ["facebook", "linkedin"]
+    
     def execute_data_scraping(self):
         """Execute data scraping service"""
         logger.info("🕷️ Running data scraping...")
@@ -3751,6 +5887,19 @@ class CashEngine:
         except Exception as e:
             logger.error(f"Error syncing Shopify products: {e}")
     
+    def reconcile_shopify_orders(self):
+        """Repair Shopify revenue from orders changed since the last reconcile (covers missed webhooks)"""
+        if not self.shopify_manager or not self.shopify_manager.enabled:
+            return
+        
+        logger.info("🛍️ Reconciling Shopify orders...")
+        try:
+            result = self.shopify_manager.reconcile_orders()
+            if result["inserted"] or result["updated"]:
+                logger.info(f"✅ Reconciled Shopify orders: {result['inserted']} missing, {result['updated']} corrected")
+        except Exception as e:
+            logger.error(f"Error reconciling Shopify orders: {e}")
+    
     def generate_products(self):
         """Generate products periodically with template optimization"""
         logger.info("📦 Generating products...")
@@ -3776,35 +5925,38 @@ class CashEngine:
             if CONFIG["template_generation_enabled"] and self.template_generator.is_available():
                 if self.should_generate_templates():
                     # Get trending topics
+                    batch_size = CONFIG["template_batch_size"]
                     suggested_topics = []
                     if opt_config["trend_analysis_enabled"]:
-                        suggested_topics = self.trend_analyzer.suggest_template_topics(limit=3)
+                        suggested_topics = self.trend_analyzer.suggest_template_topics(limit=max(3, batch_size))
+                    candidates = suggested_topics if suggested_topics else CONFIG["template_topics"]
+                    topics = random.sample(candidates, min(batch_size, len(candidates)))
+                    logger.info(f"🤖 Template generation triggered for topics: {', '.join(topics)}")
                     
-                    topic = random.choice(suggested_topics if suggested_topics else CONFIG["template_topics"])
-                    logger.info(f"🤖 Template generation triggered for topic: {topic}")
-                    
-                    generated_path = self.template_generator.generate_template(topic)
-                    if generated_path:
+                    # Templates (and their A/B variants) are generated concurrently
+                    batch = self.template_generator.generate_templates_batch(
+                        topics, create_variants=opt_config["ab_testing_enabled"]
+                    )
+                    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    for i, result in enumerate(r for r in batch["results"] if r["path"]):
+                        generated_path = result["path"]
                         logger.info(f"✅ New template generated: {generated_path.name}")
                         
-                        # 3. A/B Testing (create variant if enabled)
-                        if opt_config["ab_testing_enabled"]:
-                            # Create a variant by modifying the template slightly
-                            variant_path = self._create_template_variant(generated_path)
-                            if variant_path:
-                                test_name = f"Template_Test_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                                test_id = self.template_ab_testing.create_ab_test(generated_path, variant_path, test_name)
-                                if test_id:
-                                    logger.info(f"🧪 A/B test created: {test_name} (ID: {test_id})")
+                        # 3. A/B Testing (variant created in the batch if enabled)
+                        variant_path = result["variant_path"]
+                        if variant_path:
+                            test_name = f"Template_Test_{stamp}" + (f"_{i}" if i else "")
+                            test_id = self.template_ab_testing.create_ab_test(generated_path, variant_path, test_name)
+                            if test_id:
+                                logger.info(f"🧪 A/B test created: {test_name} (ID: {test_id})")
+                                self.template_bandit.refresh()
             
             # 4. Scan templates and create products
+            # Every test variant gets its own product so its sales can be attributed; only the
+            # posts distributed in execute_content_syndication count as A/B impressions
             created = self.product_factory.scan_templates_and_create_products()
             if created > 0:
                 logger.info(f"✅ Created {created} products from templates")
-                
-                # Record impressions for A/B tests
-                if opt_config["ab_testing_enabled"]:
-                    self._record_ab_test_impressions()
             
             # 5. Evaluate A/B tests
             if opt_config["ab_testing_enabled"]:
@@ -3827,11 +5979,8 @@ class CashEngine:
                 ''', (cutoff,))
                 recent_products = self.product_factory.cursor.fetchall()
                 
-                uploaded = 0
-                for product_id, name, price in recent_products:
-                    gumroad_url = self.product_factory.upload_product_to_gumroad(product_id)
-                    if gumroad_url:
-                        uploaded += 1
+                # Products are created one by one; their files then upload concurrently
+                uploaded = self.product_factory.upload_products_to_gumroad([row[0] for row in recent_products])
                 
                 if uploaded > 0:
                     logger.info(f"✅ Auto-uploaded {uploaded} products to Gumroad")
@@ -3876,71 +6025,18 @@ class CashEngine:
     
     def _create_template_variant(self, template_path: Path) -> Optional[Path]:
         """Create a variant of a template for A/B testing"""
-        if not template_path.exists():
-            return None
-        
-        try:
-            content = template_path.read_text(encoding='utf-8')
-            
-            # Simple variant: modify sales blurb slightly (could use AI for better variants)
-            # For now, create a copy with "_variant" suffix
-            variant_path = template_path.parent / f"{template_path.stem}_variant.md"
-            
-            # Add variant marker in content
-            variant_content = content.replace(
-                "Sales Blurb",
-                "Sales Blurb\n\n*Variant for A/B Testing*"
-            )
-            
-            variant_path.write_text(variant_content, encoding='utf-8')
-            return variant_path
-        except Exception as e:
-            logger.error(f"Error creating template variant: {e}")
-            return None
-    
-    def _record_ab_test_impressions(self):
-        """Record impressions for active A/B tests when products are created"""
-        try:
-            active_tests = self.template_ab_testing.get_active_tests()
-            cutoff = datetime.now() - timedelta(hours=1)
-            
-            for test in active_tests:
-                test_id = test["id"]
-                template_a_id = test["template_a_id"]
-                template_b_id = test["template_b_id"]
-                
-                # Check for products created from these templates
-                self.cursor.execute('''
-                    SELECT COUNT(*) FROM products
-                    WHERE created_date >= ? AND template_id IN (?, ?)
-                ''', (cutoff, template_a_id, template_b_id))
-                
-                count = self.cursor.fetchone()[0] or 0
-                
-                if count > 0:
-                    # Determine which variant was used (simplified - would need better tracking)
-                    # For now, record impression for variant A
-                    self.template_ab_testing.record_impression(test_id, "A")
-        except Exception as e:
-            logger.error(f"Error recording A/B test impressions: {e}")
+        return self.template_generator.create_variant(template_path)
     
     def _evaluate_ab_tests(self):
         """Evaluate active A/B tests and determine winners"""
         try:
-            active_tests = self.template_ab_testing.get_active_tests()
-            
-            for test in active_tests:
-                test_id = test["id"]
-                results = self.template_ab_testing.get_test_results(test_id)
-                
-                # Check if we have enough data
-                total_conversions = sum(r.get("conversions", 0) for r in results.values())
-                min_conversions = CONFIG["template_optimization"]["ab_test_min_conversions"]
-                
-                if total_conversions >= min_conversions:
-                    winner = self.template_ab_testing.determine_winner(test_id, min_conversions)
-                    if winner:
-                        self.template_ab_testing.apply_winner(test_id)
+            # All active tests in one query and one vectorized pass; winners are closed in one batch
+            evaluations = self.template_ab_testing.evaluate_active_tests()
+            decided = sum(1 for e in evaluations if e["winner"])
+            if evaluations:
+                logger.info(f"🔬 Evaluated {len(evaluations)} A/B tests, {decided} decided")
+            # Pick up new tests and stop allocating traffic to closed ones
+            self.template_bandit.refresh()
         except Exception as e:
             logger.error(f"Error evaluating A/B tests: {e}")
     
@@ -4121,7 +6217,8 @@ class CashEngine:
             "total_revenue_30d": self.revenue_tracker.get_total_revenue(days=30),
             "total_revenue_7d": self.revenue_tracker.get_total_revenue(days=7),
             "active_streams": len(CONFIG["revenue_streams"]),
-            "risk_level": self.risk_manager.risk_level
+            "risk_level": self.risk_manager.risk_level,
+            "post_queue": self.content_syndicator.post_queue.metrics()
         }
 
 
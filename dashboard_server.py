@@ -428,6 +428,39 @@ def get_trend_analysis(limit: int = 10) -> List[Dict[str, Any]]:
         print(f"Error getting trend analysis: {e}")
         return []
 
+def get_post_queue_stats() -> Dict[str, Dict[str, Any]]:
+    """Get social post queue depth and drain rate per platform"""
+    conn = get_db_connection()
+    if not conn:
+        return {}
+    
+    try:
+        now_ts = time.time()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT platform,
+                   SUM(status = 'queued'),
+                   SUM(status = 'sending'),
+                   SUM(status = 'failed'),
+                   SUM(sent_at > ?)
+            FROM post_queue
+            WHERE status IN ('queued', 'sending', 'failed') OR sent_at > ?
+            GROUP BY platform
+        ''', (now_ts - 3600, now_ts - 3600))
+        
+        return {
+            row[0]: {
+                "depth": row[1] or 0,
+                "in_flight": row[2] or 0,
+                "failed": row[3] or 0,
+                "drain_rate_per_hour": row[4] or 0
+            }
+            for row in cursor.fetchall()
+        }
+    except Exception as e:
+        print(f"Error getting post queue stats: {e}")
+        return {}
+
 def get_dashboard_data() -> Dict[str, Any]:
     """Get complete dashboard data"""
     return {
@@ -448,7 +481,8 @@ def get_dashboard_data() -> Dict[str, Any]:
         "campaign_performance": get_campaign_performance(30),
         "system_status": get_system_status(),
         "ab_tests": get_ab_tests(),
-        "trends": get_trend_analysis(10)
+        "trends": get_trend_analysis(10),
+        "post_queue": get_post_queue_stats()
     }
 
 # Flask Routes
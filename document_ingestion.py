@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Document Ingestion
+Extracts text and outline from PDF products once, caches the result in
+engine.db by content hash, and fans new extractions out across a process pool
+"""
+
+import io
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterable
+
+# Setup logger
+logger = logging.getLogger('DocumentIngestion')
+
+# PDF parser (optional)
+try:
+    from pypdf import PdfReader
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+PDF_MAGIC = b"%PDF-"
+
+
+def _flatten_outline(items, level: int = 0) -> List[Dict[str, Any]]:
+    """pypdf's nested outline as a flat list of {title, level}"""
+    flat = []
+    for item in items:
+        if isinstance(item, list):
+            flat.extend(_flatten_outline(item, level + 1))
+        else:
+            title = str(getattr(item, "title", "") or "").strip()
+            if title:
+                flat.append({"title": title, "level": level})
+    return flat
+
+
+def extract_document(path: str) -> Dict[str, Any]:
+    """Extract text, outline and title from one document.
+
+    Runs in worker processes, so it only depends on this module. Files without
+    a PDF header (e.g. plain-text delivery placeholders saved as .pdf) are
+    rejected, so their stub text never reaches syndication or product creation.
+    Returns a dict with an "error" key if extraction failed.
+    """
+    data = Path(path).read_bytes()
+    result = {
+        "content_hash": hashlib.sha256(data).hexdigest(),
+        "title": "",
+        "text": "",
+        "outline": [],
+        "pages": 0,
+        "extractor": "text",
+    }
+    try:
+        if data.lstrip()[:len(PDF_MAGIC)] != PDF_MAGIC:
+            result["error"] = "no %PDF- header (placeholder, not a real PDF)"
+            return result
+        elif not PYPDF_AVAILABLE:
+            result["error"] = "pypdf is not installed"
+            return result
+        else:
+            reader = PdfReader(io.BytesIO(data))
+            result["extractor"] = "pypdf"
+            result["pages"] = len(reader.pages)
+            result["text"] = "\n\n".join((page.extract_text() or "").strip() for page in reader.pages).strip()
+            try:
+                result["outline"] = _flatten_outline(reader.outline)
+            except Exception:
+                result["outline"] = []
+            metadata_title = getattr(reader.metadata, "title", None) if reader.metadata else None
+            result["title"] = str(metadata_title).strip() if metadata_title else ""
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    if not result["title"]:
+        if result["outline"]:
+            result["title"] = result["outline"][0]["title"]
+        else:
+            result["title"] = next((line.strip() for line in result["text"].splitlines() if line.strip()), "")
+    return result
+
+
+def _extract_safely(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        return extract_document(path)
+    except OSError as e:
+        logger.warning(f"Could not read document {path}: {e}")
+        return None
+
+
+class DocumentIngestor:
+    """Cached text extraction for the PDF products in products/.
+
+    Extractions live in the document_extractions table keyed by content hash,
+    so a PDF is parsed once no matter how often it is renamed, touched or
+    looked up. Files are only re-hashed when their mtime or size changes, and
+    a batch of new documents is extracted in parallel on a spawn-based process
+    pool (DOCUMENT_EXTRACTION_WORKERS).
+    """
+    SUFFIXES = (".pdf",)
+
+    def __init__(self, db_conn=None, max_workers: Optional[int] = None):
+        self.db = db_conn or sqlite3.connect(":memory:", check_same_thread=False)
+        self.max_workers = max_workers or int(os.getenv('DOCUMENT_EXTRACTION_WORKERS', str(min(4, os.cpu_count() or 1))))
+        self._lock = threading.Lock()
+        self._files = {}  # path -> (mtime, size, content hash)
+        self._failed = {}  # content hash -> error, so broken files aren't retried every cycle
+        self._ensure_table()
+
+    def _ensure_table(self):
+        """Create the document extraction cache table if it doesn't exist"""
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS document_extractions (
+                content_hash TEXT PRIMARY KEY,
+                title TEXT,
+                text TEXT,
+                outline TEXT,
+                pages INTEGER,
+                extractor TEXT,
+                extracted_at REAL
+            )
+        ''')
+        # Earlier versions cached placeholder .pdf files as plain text
+        self.db.execute("DELETE FROM document_extractions WHERE extractor = 'text'")
+        self.db.commit()
+
+    def has_extraction(self, content_hash: str) -> bool:
+        """Whether an extraction for this content is cached"""
+        return self._lookup(content_hash) is not None
+
+    @classmethod
+    def handles(cls, path: Path) -> bool:
+        """Whether path is a document this ingestor extracts"""
+        return path.suffix.lower() in cls.SUFFIXES
+
+    def ingest(self, paths: Iterable[Path]) -> Dict[Path, Dict[str, Any]]:
+        """Extraction for each path (title, text, outline, pages, content_hash).
+
+        Cached extractions are returned as-is; the rest are extracted, on the
+        process pool when there is more than one. Paths that cannot be read or
+        extracted are left out of the result.
+        """
+        with self._lock:
+            results = {}
+            pending = {}  # content hash -> paths with that content
+            for path in paths:
+                path = Path(path)
+                content_hash = self._content_hash(path)
+                if not content_hash or content_hash in self._failed:
+                    continue
+                cached = self._lookup(content_hash)
+                if cached:
+                    results[path] = cached
+                else:
+                    pending.setdefault(content_hash, []).append(path)
+
+            if pending:
+                start = time.perf_counter()
+                extractions = self._extract_all([same_content[0] for same_content in pending.values()])
+                for (content_hash, same_content), extraction in zip(pending.items(), extractions):
+                    if extraction is None:
+                        continue
+                    error = extraction.pop("error", None)
+                    if error:
+                        self._failed[content_hash] = error
+                        logger.warning(f"Could not extract {same_content[0].name}: {error}")
+                        continue
+                    self._store(extraction)
+                    for path in same_content:
+                        results[path] = extraction
+                logger.info(f"Extracted {len(pending)} documents in {(time.perf_counter() - start) * 1000:.0f} ms")
+            return results
+
+    def extract(self, path: Path) -> Optional[Dict[str, Any]]:
+        """Extraction for a single document, or None if it can't be extracted"""
+        return self.ingest([path]).get(Path(path))
+
+    def text(self, path: Path) -> str:
+        """Extracted text of a document ("" if it can't be extracted)"""
+        extraction = self.extract(path)
+        return extraction["text"] if extraction else ""
+
+    def _content_hash(self, path: Path) -> Optional[str]:
+        """Content hash of path, recomputed only when its mtime or size changed"""
+        try:
+            stat = path.stat()
+            known = self._files.get(path)
+            if known and known[0] == stat.st_mtime and known[1] == stat.st_size:
+                return known[2]
+            content_hash = hashlib.sha256(path.read_bytes()).hexdigest()
+        except OSError as e:
+            logger.warning(f"Could not read document {path}: {e}")
+            return None
+        self._files[path] = (stat.st_mtime, stat.st_size, content_hash)
+        return content_hash
+
+    def _lookup(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        row = self.db.execute(
+            'SELECT title, text, outline, pages, extractor FROM document_extractions WHERE content_hash = ?',
+            (content_hash,)
+        ).fetchone()
+        if not row:
+            return None
+        return {
+            "content_hash": content_hash, "title": row[0] or "", "text": row[1] or "",
+            "outline": json.loads(row[2] or "[]"), "pages": row[3] or 0, "extractor": row[4]
+        }
+
+    def _store(self, extraction: Dict[str, Any]):
+        self.db.execute('''
+            INSERT OR REPLACE INTO document_extractions (content_hash, title, text, outline, pages, extractor, extracted_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (extraction["content_hash"], extraction["title"], extraction["text"], json.dumps(extraction["outline"]),
+              extraction["pages"], extraction["extractor"], time.time()))
+        self.db.commit()
+
+    def _extract_all(self, paths: List[Path]) -> List[Optional[Dict[str, Any]]]:
+        """Extract paths, in worker processes when there is more than one"""
+        if len(paths) == 1 or self.max_workers <= 1:
+            return [_extract_safely(str(path)) for path in paths]
+        # spawn: the engine is multi-threaded, and forking it is not safe
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(paths)), mp_context=context) as pool:
+            return list(pool.map(_extract_safely, [str(path) for path in paths]))
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+LLM Gateway
+Single entry point for chat completions: one shared client, response cache,
+concurrency limit, and per-caller token/latency metering in performance_metrics
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Setup logger
+logger = logging.getLogger('LLMGateway')
+
+# OpenAI client (optional)
+try:
+    from openai import OpenAI
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+
+# USD per 1K tokens (prompt, completion); unknown models are metered at zero cost
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4-turbo-preview": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+
+@dataclass
+class LLMResponse:
+    """Result of a completion, whether served by the backend or the cache"""
+    text: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: float = 0.0
+    cached: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cost(self) -> float:
+        prompt_price, completion_price = MODEL_PRICES.get(self.model, (0.0, 0.0))
+        return (self.prompt_tokens * prompt_price + self.completion_tokens * completion_price) / 1000
+
+
+class OpenAIBackend:
+    """OpenAI chat completions through one pooled client with timeout and retry policy"""
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.client = OpenAI(
+            api_key=api_key or os.getenv('OPENAI_API_KEY'),
+            timeout=float(os.getenv('LLM_TIMEOUT_SECONDS', '60')),
+            max_retries=int(os.getenv('LLM_MAX_RETRIES', '2'))
+        )
+
+    def complete(self, messages: List[Dict[str, str]], model: str, temperature: float, max_tokens: int) -> LLMResponse:
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        usage = getattr(response, 'usage', None)
+        return LLMResponse(
+            text=response.choices[0].message.content or "",
+            model=model,
+            prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+            completion_tokens=getattr(usage, 'completion_tokens', 0) or 0
+        )
+
+
+class StubBackend:
+    """Offline backend with deterministic responses and simulated latency, for benchmarks and dry runs.
+
+    Prompts asking for JSON get an object with the requested keys; anything else
+    gets a Markdown product template long enough to pass template validation.
+    """
+    name = "stub"
+    JSON_KEYS_RE = re.compile(r"JSON with keys:\s*([^\n]+)")
+
+    def __init__(self, latency_ms: Optional[float] = None):
+        self.latency_ms = latency_ms if latency_ms is not None else float(os.getenv('LLM_STUB_LATENCY_MS', '50'))
+
+    def complete(self, messages: List[Dict[str, str]], model: str, temperature: float, max_tokens: int) -> LLMResponse:
+        time.sleep(self.latency_ms / 1000)
+        prompt = "\n".join(m.get("content", "") for m in messages)
+        keys_match = self.JSON_KEYS_RE.search(prompt)
+        if keys_match:
+            keys = re.findall(r"([a-z_]+)(?:\s*\([^)]*\))?\s*(?:,|$)", keys_match.group(1).rstrip(". "))
+            text = json.dumps({key: [] for key in keys})
+        else:
+            text = self._template(prompt)
+        return LLMResponse(
+            text=text,
+            model=model,
+            prompt_tokens=len(prompt) // 4,
+            completion_tokens=min(len(text) // 4, max_tokens)
+        )
+
+    @staticmethod
+    def _template(prompt: str) -> str:
+        topic_match = re.search(r'"([^"]+)" niche', prompt)
+        topic = topic_match.group(1) if topic_match else "Productivity"
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]
+        sections = "\n\n".join(
+            f"## Step {i}: Build Your {topic.title()} System\n\n"
+            + f"Work through this step to turn {topic} into a repeatable routine. " * 6
+            for i in range(1, 6)
+        )
+        return (
+            f"# The {topic.title()} Playbook ({digest})\n\n"
+            f"## Sales Blurb\n\nEverything you need to master {topic}, in one ready-to-use template.\n\n"
+            f"## Structure\n\n- Overview\n- Five guided steps\n- Checklists\n\n{sections}\n"
+        )
+
+
+class LLMGateway:
+    """Shared LLM access point used by every AI-powered component.
+
+    Responses are cached by a hash of (model, messages, temperature, max_tokens)
+    in memory and in the llm_cache table of engine.db. In-flight requests are
+    capped by LLM_MAX_CONCURRENCY, and every call is metered per caller into
+    performance_metrics (metric_type 'llm').
+    """
+
+    def __init__(self, backend=None, db_path: Path = Path("./data/engine.db")):
+        self.backend = backend if backend is not None else self._default_backend()
+        self.default_model = os.getenv('LLM_MODEL', os.getenv('OPENAI_MODEL', 'gpt-4'))
+        self.db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._cache = OrderedDict()  # request key -> LLMResponse
+        self._cache_size = int(os.getenv('LLM_CACHE_SIZE', '256'))
+        self._cache_ttl = float(os.getenv('LLM_CACHE_TTL_HOURS', '168')) * 3600
+        self._cache_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(int(os.getenv('LLM_MAX_CONCURRENCY', '4')))
+        self._usage = {}  # caller -> running totals
+        self._usage_lock = threading.Lock()
+
+    @staticmethod
+    def _default_backend():
+        backend = os.getenv('LLM_BACKEND', 'openai').lower()
+        if backend == 'stub':
+            return StubBackend()
+        if OPENAI_AVAILABLE and os.getenv('OPENAI_API_KEY'):
+            try:
+                return OpenAIBackend()
+            except Exception as e:
+                logger.warning(f"OpenAI initialization failed: {e}")
+        return None
+
+    def is_available(self) -> bool:
+        """Whether completions can be served"""
+        return self.backend is not None
+
+    def complete(self, caller: str, messages: List[Dict[str, str]], model: Optional[str] = None,
+                 temperature: float = 0.7, max_tokens: int = 1000, cache: bool = True) -> Optional[LLMResponse]:
+        """Run a chat completion on behalf of caller.
+
+        Args:
+            caller: Component name used for metering (e.g. "template_generator")
+            messages: Chat messages
+            model: Model name, defaults to LLM_MODEL
+            cache: Serve and store identical requests from the response cache;
+                disable for calls that must produce fresh output every time
+
+        Returns None when no backend is configured; backend errors propagate.
+        """
+        if not self.backend:
+            return None
+        model = model or self.default_model
+        key = self._request_key(messages, model, temperature, max_tokens)
+
+        if cache:
+            hit = self._cache_get(key)
+            if hit:
+                self._meter(caller, hit)
+                return hit
+
+        with self._slots:
+            start = time.perf_counter()
+            response = self.backend.complete(messages, model, temperature, max_tokens)
+            response.latency_ms = (time.perf_counter() - start) * 1000
+
+        if cache:
+            self._cache_put(key, response)
+        self._meter(caller, response)
+        return response
+
+    def usage(self) -> Dict[str, Dict[str, float]]:
+        """Per-caller totals since start: calls, cache hits, tokens, cost and latency"""
+        with self._usage_lock:
+            return {caller: dict(totals) for caller, totals in self._usage.items()}
+
+    @staticmethod
+    def _request_key(messages: List[Dict[str, str]], model: str, temperature: float, max_tokens: int) -> str:
+        payload = json.dumps([model, messages, temperature, max_tokens], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _get_db(self) -> Optional[sqlite3.Connection]:
+        """Lazily open engine.db; the gateway works without it (memory cache only, no metering rows)"""
+        if self._db is None and self.db_path.parent.exists():
+            try:
+                self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+                self._db.execute('''
+                    CREATE TABLE IF NOT EXISTS llm_cache (
+                        request_key TEXT PRIMARY KEY,
+                        model TEXT,
+                        response TEXT,
+                        prompt_tokens INTEGER,
+                        completion_tokens INTEGER,
+                        created_at REAL
+                    )
+                ''')
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"LLM cache database unavailable: {e}")
+                self._db = None
+        return self._db
+
+    def _cache_get(self, key: str) -> Optional[LLMResponse]:
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit:
+                self._cache.move_to_end(key)
+                return LLMResponse(hit.text, hit.model, hit.prompt_tokens, hit.completion_tokens, 0.0, True)
+        with self._db_lock:
+            db = self._get_db()
+            if not db:
+                return None
+            row = db.execute(
+                'SELECT model, response, prompt_tokens, completion_tokens FROM llm_cache WHERE request_key = ? AND created_at > ?',
+                (key, time.time() - self._cache_ttl)
+            ).fetchone()
+        if not row:
+            return None
+        response = LLMResponse(row[1], row[0], row[2], row[3])
+        self._remember(key, response)
+        return LLMResponse(response.text, response.model, response.prompt_tokens, response.completion_tokens, 0.0, True)
+
+    def _cache_put(self, key: str, response: LLMResponse):
+        self._remember(key, response)
+        with self._db_lock:
+            db = self._get_db()
+            if not db:
+                return
+            try:
+                db.execute(
+                    'INSERT OR REPLACE INTO llm_cache (request_key, model, response, prompt_tokens, completion_tokens, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, response.model, response.text, response.prompt_tokens, response.completion_tokens, time.time())
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not store LLM response in cache: {e}")
+
+    def _remember(self, key: str, response: LLMResponse):
+        with self._cache_lock:
+            self._cache[key] = response
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _meter(self, caller: str, response: LLMResponse):
+        """Accumulate per-caller usage and record it in performance_metrics"""
+        with self._usage_lock:
+            totals = self._usage.setdefault(caller, {
+                "calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "latency_ms": 0.0
+            })
+            totals["calls"] += 1
+            totals["cache_hits"] += int(response.cached)
+            totals["prompt_tokens"] += response.prompt_tokens
+            totals["completion_tokens"] += response.completion_tokens
+            totals["cost"] += 0.0 if response.cached else response.cost
+            totals["latency_ms"] += response.latency_ms
+
+        metadata = json.dumps({
+            "model": response.model,
+            "backend": getattr(self.backend, 'name', ''),
+            "prompt_tokens": response.prompt_tokens,
+            "completion_tokens": response.completion_tokens,
+            "cost": 0.0 if response.cached else round(response.cost, 6),
+            "cached": response.cached
+        })
+        with self._db_lock:
+            db = self._get_db()
+            if not db:
+                return
+            try:
+                db.executemany('''
+                    INSERT INTO performance_metrics (metric_type, metric_name, value, source, metadata)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [
+                    ("llm", "tokens", 0 if response.cached else response.total_tokens, caller, metadata),
+                    ("llm", "latency_ms", round(response.latency_ms, 1), caller, metadata),
+                ])
+                db.commit()
+            except sqlite3.Error as e:
+                logger.debug(f"Could not record LLM usage: {e}")
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Process-wide gateway shared by all callers"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
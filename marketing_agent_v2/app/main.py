@@ -2,30 +2,45 @@
 FastAPI main application.
 """
 
+from contextlib import asynccontextmanager
 from datetime import datetime
 from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 
-from app.database import get_db, init_db
+from app.database import get_async_db, init_db
 from app.schemas import (
     HealthCheckResponse, CampaignCreate, CampaignResponse, CampaignUpdate,
-    LinkCreate, LinkResponse, LinkStatsResponse, ActionCreate, ActionResponse,
+    LinkCreate, LinkBulkCreate, LinkResponse, LinkStatsResponse, ActionCreate, ActionResponse,
     ActionListResponse, ApprovalCreate, ApprovalResponse, TrendDigestResponse
 )
-from app.models import ActionTypeEnum, ActionStatusEnum
-from app.services import LinkService, TrendEngine, ActionService, SettingsService
+from app.models import ActionTypeEnum, ActionStatusEnum, Campaign, Link
+from app.services import LinkService, TrendEngine, ActionService, SettingsService, ClickBuffer
 
 # Initialize database
 init_db()
 
+# Buffered click ingestion for the redirect path
+click_buffer = ClickBuffer()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the click-event flusher and drain it on shutdown."""
+    await click_buffer.start()
+    yield
+    await click_buffer.stop()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Marketing Agent V2",
     description="Production-ready marketing automation platform",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 
@@ -42,43 +57,35 @@ async def health_check():
 
 # Campaign endpoints
 @app.post("/api/campaigns", response_model=CampaignResponse)
-async def create_campaign(campaign: CampaignCreate, db: Session = Depends(get_db)):
+async def create_campaign(campaign: CampaignCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new campaign."""
-    from app.models import Campaign
-    
     db_campaign = Campaign(**campaign.model_dump())
     db.add(db_campaign)
-    db.commit()
-    db.refresh(db_campaign)
+    await db.commit()
+    await db.refresh(db_campaign)
     return CampaignResponse.model_validate(db_campaign)
 
 
 @app.get("/api/campaigns", response_model=list[CampaignResponse])
-async def list_campaigns(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def list_campaigns(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
     """List campaigns."""
-    from app.models import Campaign
-    
-    campaigns = db.query(Campaign).offset(skip).limit(limit).all()
-    return [CampaignResponse.model_validate(c) for c in campaigns]
+    result = await db.execute(select(Campaign).offset(skip).limit(limit))
+    return [CampaignResponse.model_validate(c) for c in result.scalars().all()]
 
 
 @app.get("/api/campaigns/{campaign_id}", response_model=CampaignResponse)
-async def get_campaign(campaign_id: int, db: Session = Depends(get_db)):
+async def get_campaign(campaign_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a campaign by ID."""
-    from app.models import Campaign
-    
-    campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    campaign = await db.get(Campaign, campaign_id)
     if not campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
     return CampaignResponse.model_validate(campaign)
 
 
 @app.put("/api/campaigns/{campaign_id}", response_model=CampaignResponse)
-async def update_campaign(campaign_id: int, campaign: CampaignUpdate, db: Session = Depends(get_db)):
+async def update_campaign(campaign_id: int, campaign: CampaignUpdate, db: AsyncSession = Depends(get_async_db)):
     """Update a campaign."""
-    from app.models import Campaign
-    
-    db_campaign = db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    db_campaign = await db.get(Campaign, campaign_id)
     if not db_campaign:
         raise HTTPException(status_code=404, detail="Campaign not found")
     
@@ -86,22 +93,32 @@ async def update_campaign(campaign_id: int, campaign: CampaignUpdate, db: Sessio
     for field, value in update_data.items():
         setattr(db_campaign, field, value)
     
-    db.commit()
-    db.refresh(db_campaign)
+    await db.commit()
+    await db.refresh(db_campaign)
     return CampaignResponse.model_validate(db_campaign)
 
 
 # Link endpoints
+# Services are synchronous ORM code; AsyncSession.run_sync runs them on the
+# async connection so the event loop is never blocked on database I/O.
 @app.post("/api/links", response_model=LinkResponse)
-async def create_link(link: LinkCreate, db: Session = Depends(get_db)):
+async def create_link(link: LinkCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new tracked link."""
-    service = LinkService(db)
-    return service.create_link(
+    return await db.run_sync(lambda session: LinkService(session).create_link(
         campaign_id=link.campaign_id,
         channel=link.channel,
         long_url=link.long_url,
         utm_params=link.utm_json
-    )
+    ))
+
+
+@app.post("/api/links/bulk", response_model=list[LinkResponse])
+async def create_links_bulk(request: LinkBulkCreate, db: AsyncSession = Depends(get_async_db)):
+    """Create or return tracked links, idempotent on (campaign_id, long_url, utm)."""
+    try:
+        return await db.run_sync(lambda session: LinkService(session).create_links_bulk(request.links))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 @app.get("/api/links", response_model=list[LinkResponse])
@@ -109,57 +126,63 @@ async def list_links(
     campaign_id: int = Query(None),
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List tracked links."""
-    service = LinkService(db)
-    return service.list_links(campaign_id=campaign_id, skip=skip, limit=limit)
+    query = select(Link)
+    if campaign_id:
+        query = query.where(Link.campaign_id == campaign_id)
+    result = await db.execute(query.offset(skip).limit(limit))
+    return [LinkResponse.model_validate(link) for link in result.scalars().all()]
 
 
 @app.get("/api/links/{link_id}", response_model=LinkResponse)
-async def get_link(link_id: int, db: Session = Depends(get_db)):
+async def get_link(link_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a link by ID."""
-    service = LinkService(db)
-    link = service.get_link(link_id)
+    link = await db.get(Link, link_id)
     if not link:
         raise HTTPException(status_code=404, detail="Link not found")
-    return link
+    return LinkResponse.model_validate(link)
 
 
 @app.get("/api/links/{link_id}/stats", response_model=LinkStatsResponse)
-async def get_link_stats(link_id: int, days: int = 30, db: Session = Depends(get_db)):
+async def get_link_stats(link_id: int, days: int = 30, db: AsyncSession = Depends(get_async_db)):
     """Get statistics for a link."""
-    service = LinkService(db)
     try:
-        return service.get_link_stats(link_id, days=days)
+        return await db.run_sync(lambda session: LinkService(session).get_link_stats(link_id, days=days))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
 # Short link redirect
 @app.get("/r/{slug}")
-async def redirect_short_link(slug: str, db: Session = Depends(get_db)):
+async def redirect_short_link(slug: str, db: AsyncSession = Depends(get_async_db)):
     """Redirect short link and record click."""
-    service = LinkService(db)
-    link = service.get_link_by_slug(slug)
+    result = await db.execute(select(Link.id, Link.long_url).where(Link.short_slug == slug))
+    link = result.first()
     
     if not link:
         raise HTTPException(status_code=404, detail="Link not found")
     
     # Record click (in production, would extract from request headers)
-    service.record_click(
+    click_kwargs = dict(
         link_id=link.id,
         referrer=None,  # Would come from request.headers.get('referer')
         user_agent=None,  # Would come from request.headers.get('user-agent')
         ip_address=None  # Would come from request.client.host
     )
+    if click_buffer.is_running:
+        # Fire-and-forget: the background flusher bulk-inserts buffered clicks
+        click_buffer.add(LinkService.build_click_row(**click_kwargs))
+    else:
+        await db.run_sync(lambda session: LinkService(session).record_click(**click_kwargs))
     
     return RedirectResponse(url=link.long_url, status_code=301)
 
 
 # Trend endpoints
 @app.post("/api/trends/ingest")
-async def ingest_trends(db: Session = Depends(get_db)):
+async def ingest_trends():
     """Manually trigger trend ingestion."""
     from app.workers.tasks import ingest_trends as ingest_task
     
@@ -169,10 +192,9 @@ async def ingest_trends(db: Session = Depends(get_db)):
 
 
 @app.get("/api/trends/digest", response_model=TrendDigestResponse)
-async def get_trend_digest(hours: int = 24, limit: int = 10, db: Session = Depends(get_db)):
+async def get_trend_digest(hours: int = 24, limit: int = 10, db: AsyncSession = Depends(get_async_db)):
     """Get trend digest."""
-    engine = TrendEngine(db)
-    digest = engine.get_trend_digest(limit=limit, hours=hours)
+    digest = await db.run_sync(lambda session: TrendEngine(session).get_trend_digest(limit=limit, hours=hours))
     
     return TrendDigestResponse(
         trends=digest['trends'],
@@ -183,15 +205,14 @@ async def get_trend_digest(hours: int = 24, limit: int = 10, db: Session = Depen
 
 # Action endpoints
 @app.post("/api/actions", response_model=ActionResponse)
-async def create_action(action: ActionCreate, db: Session = Depends(get_db)):
+async def create_action(action: ActionCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new action."""
-    service = ActionService(db)
-    return service.create_action(
+    return await db.run_sync(lambda session: ActionService(session).create_action(
         action_type=action.type,
         payload=action.payload,
         dry_run=action.dry_run,
         scheduled_for=action.scheduled_for
-    )
+    ))
 
 
 @app.get("/api/actions", response_model=list[ActionListResponse])
@@ -200,50 +221,51 @@ async def list_actions(
     action_type: ActionTypeEnum = Query(None),
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List actions."""
-    service = ActionService(db)
-    actions = service.list_actions(status=status, action_type=action_type, skip=skip, limit=limit)
+    actions = await db.run_sync(lambda session: ActionService(session).list_actions(
+        status=status, action_type=action_type, skip=skip, limit=limit
+    ))
     return [ActionListResponse.model_validate(a) for a in actions]
 
 
 @app.get("/api/actions/{action_id}", response_model=ActionResponse)
-async def get_action(action_id: int, db: Session = Depends(get_db)):
+async def get_action(action_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get an action by ID."""
-    service = ActionService(db)
-    action = service.get_action(action_id)
+    action = await db.run_sync(lambda session: ActionService(session).get_action(action_id))
     if not action:
         raise HTTPException(status_code=404, detail="Action not found")
     return action
 
 
 @app.post("/api/actions/{action_id}/submit", response_model=ActionResponse)
-async def submit_action(action_id: int, db: Session = Depends(get_db)):
+async def submit_action(action_id: int, db: AsyncSession = Depends(get_async_db)):
     """Submit an action for approval."""
-    service = ActionService(db)
     try:
-        return service.submit_action_for_approval(action_id)
+        return await db.run_sync(lambda session: ActionService(session).submit_action_for_approval(action_id))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/api/actions/{action_id}/approve", response_model=ApprovalResponse)
-async def approve_action(action_id: int, approval: ApprovalCreate, db: Session = Depends(get_db)):
+async def approve_action(action_id: int, approval: ApprovalCreate, db: AsyncSession = Depends(get_async_db)):
     """Approve an action."""
-    service = ActionService(db)
     try:
-        return service.approve_action(action_id, approved_by=1, note=approval.note)
+        return await db.run_sync(
+            lambda session: ActionService(session).approve_action(action_id, approved_by=1, note=approval.note)
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/api/actions/{action_id}/deny", response_model=ApprovalResponse)
-async def deny_action(action_id: int, approval: ApprovalCreate, db: Session = Depends(get_db)):
+async def deny_action(action_id: int, approval: ApprovalCreate, db: AsyncSession = Depends(get_async_db)):
     """Deny an action."""
-    service = ActionService(db)
     try:
-        return service.deny_action(action_id, approved_by=1, note=approval.note)
+        return await db.run_sync(
+            lambda session: ActionService(session).deny_action(action_id, approved_by=1, note=approval.note)
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -81,6 +81,8 @@ class Link(Base):
     long_url = Column(Text, nullable=False)
     short_slug = Column(String(50), unique=True, index=True, nullable=False)
     utm_json = Column(JSON, default={})
+    # Idempotency key for bulk creation: sha256 of (campaign_id, long_url, utm)
+    link_key = Column(String(64), unique=True, index=True, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -47,6 +47,10 @@ class LinkCreate(LinkBase):
     utm_json: Optional[Dict[str, str]] = None
 
 
+class LinkBulkCreate(BaseModel):
+    links: List[LinkCreate] = Field(..., max_length=1000)
+
+
 class LinkResponse(LinkBase):
     id: int
     short_slug: str
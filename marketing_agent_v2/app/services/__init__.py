@@ -1,12 +1,15 @@
 """Services package."""
 
-from .link_service import LinkService, BotDetector
+from .link_service import LinkService, BotDetector, SlugAllocator
+from .click_buffer import ClickBuffer
 from .trend_service import TrendEngine
 from .action_service import ActionService, SettingsService
 
 __all__ = [
     'LinkService',
+    'SlugAllocator',
     'BotDetector',
+    'ClickBuffer',
     'TrendEngine',
     'ActionService',
     'SettingsService'
@@ -0,0 +1,146 @@
+"""
+Buffered click-event ingestion with bulk inserts.
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Optional, Dict, List, Any, Callable
+from starlette.concurrency import run_in_threadpool
+from app.database import SessionLocal
+from app.services.link_service import LinkService
+
+logger = logging.getLogger(__name__)
+
+
+class ClickBuffer:
+    """
+    In-memory buffer for click events, flushed to the database in bulk.
+
+    The redirect path only appends a prepared row to the buffer. A background
+    asyncio task flushes the buffer whenever it reaches ``batch_size`` rows or
+    ``flush_interval`` seconds have passed, and ``stop()`` drains whatever is
+    left on shutdown.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = SessionLocal,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_pending: Optional[int] = None
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or int(os.getenv("CLICK_BUFFER_BATCH_SIZE", "500"))
+        self.flush_interval = flush_interval or float(os.getenv("CLICK_BUFFER_FLUSH_INTERVAL", "1.0"))
+        self.max_pending = max_pending or int(os.getenv("CLICK_BUFFER_MAX_PENDING", "100000"))
+        self._pending = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.flushed_count = 0
+        self.dropped_count = 0
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the background flusher is active."""
+        return self._task is not None and not self._task.done()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, row: Dict[str, Any]) -> None:
+        """
+        Queue a click-event row for the next bulk insert.
+
+        Args:
+            row: Column mapping for a ClickEvent (see LinkService.build_click_row)
+        """
+        if len(self._pending) >= self.max_pending:
+            # Shed the oldest event rather than grow without bound
+            self._pending.popleft()
+            self.dropped_count += 1
+        self._pending.append(row)
+
+        if len(self._pending) >= self.batch_size and self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self) -> None:
+        """Start the background flush task on the running event loop."""
+        if self.is_running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Click buffer started (batch_size={self.batch_size}, flush_interval={self.flush_interval}s)"
+        )
+
+    async def stop(self) -> None:
+        """Stop the flush task and drain all pending events."""
+        self._stopping = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush_all()
+        logger.info(f"Click buffer stopped ({self.flushed_count} events flushed, {self.dropped_count} dropped)")
+
+    async def flush(self) -> int:
+        """Flush up to one batch of pending events. Returns the number written."""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        try:
+            written = await run_in_threadpool(self._write_batch, batch)
+        except Exception as e:
+            logger.error(f"Error flushing {len(batch)} click events: {e}")
+            # Put the batch back so the next flush retries it
+            self._pending.extendleft(reversed(batch))
+            return 0
+        self.flushed_count += written
+        return written
+
+    async def flush_all(self) -> int:
+        """Flush every pending event, one batch at a time."""
+        total = 0
+        while self._pending:
+            written = await self.flush()
+            if not written:
+                break
+            total += written
+        return total
+
+    async def _run(self) -> None:
+        """Flush loop bounded by batch size and flush interval."""
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            await self.flush()
+            # Keep going immediately while full batches are waiting
+            while len(self._pending) >= self.batch_size and not self._stopping:
+                if not await self.flush():
+                    break
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        """Pop at most ``batch_size`` rows off the buffer."""
+        batch = []
+        while self._pending and len(batch) < self.batch_size:
+            batch.append(self._pending.popleft())
+        return batch
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> int:
+        """Write a batch with a single bulk insert in its own session."""
+        db = self.session_factory()
+        try:
+            return LinkService(db).record_clicks_bulk(batch)
+        finally:
+            db.close()
@@ -3,12 +3,14 @@ Link tracking service with bot filtering and analytics.
 """
 
 import hashlib
+import json
 import secrets
 import string
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, case, insert
+from sqlalchemy.exc import IntegrityError
 from app.models import Link, ClickEvent, Campaign
 from app.schemas import LinkCreate, LinkResponse, LinkStatsResponse, ClickEventCreate
 
@@ -49,9 +51,51 @@ class BotDetector:
         return False
 
 
+class SlugAllocator:
+    """
+    Allocates short slugs without querying the database.
+
+    Slugs are base62 encodings of random integers drawn from a fixed-width
+    space (62^8 ~ 2.2e14 for the default length), so collisions are rare
+    enough that the unique index on ``links.short_slug`` is the only check.
+    """
+    
+    ALPHABET = string.digits + string.ascii_letters
+    
+    def __init__(self, length: int = 8):
+        self.length = length
+        self.space = len(self.ALPHABET) ** length
+    
+    @classmethod
+    def encode(cls, value: int, length: int) -> str:
+        """Base62-encode ``value`` left-padded to ``length`` characters."""
+        chars = []
+        base = len(cls.ALPHABET)
+        while value:
+            value, rem = divmod(value, base)
+            chars.append(cls.ALPHABET[rem])
+        return ''.join(reversed(chars)).rjust(length, cls.ALPHABET[0])
+    
+    def next(self) -> str:
+        """Return a fresh slug."""
+        return self.encode(secrets.randbelow(self.space), self.length)
+    
+    def allocate(self, count: int) -> List[str]:
+        """Return ``count`` slugs that are distinct from each other."""
+        slugs = set()
+        while len(slugs) < count:
+            slugs.add(self.next())
+        return list(slugs)
+
+
 class LinkService:
     """Service for managing tracked links."""
     
+    # Attempts before giving up when a slug collides on insert
+    MAX_SLUG_ATTEMPTS = 5
+    
+    slug_allocator = SlugAllocator()
+    
     def __init__(self, db: Session):
         self.db = db
     
@@ -79,32 +123,116 @@ class LinkService:
         if not campaign:
             raise ValueError(f"Campaign {campaign_id} not found")
         
-        # Generate short slug
-        short_slug = self._generate_short_slug()
+        utm_json = self._build_utm(campaign_id, channel, utm_params)
+        
+        # Create link, relying on the unique index to catch slug collisions
+        for attempt in range(self.MAX_SLUG_ATTEMPTS):
+            link = Link(
+                campaign_id=campaign_id,
+                channel=channel,
+                long_url=long_url,
+                short_slug=self.slug_allocator.next(),
+                utm_json=utm_json
+            )
+            try:
+                with self.db.begin_nested():
+                    self.db.add(link)
+                break
+            except IntegrityError:
+                if attempt == self.MAX_SLUG_ATTEMPTS - 1:
+                    raise
+        
+        self.db.commit()
+        self.db.refresh(link)
+        
+        return LinkResponse.model_validate(link)
+    
+    def create_links_bulk(self, links: List[LinkCreate]) -> List[LinkResponse]:
+        """
+        Create or return tracked links in bulk.
+        
+        Links are idempotent on (campaign_id, long_url, utm): requesting the
+        same link twice returns the row created the first time. Existing links
+        are found with one SELECT on ``link_key`` and the rest are written with
+        one bulk INSERT.
         
-        # Build UTM JSON
-        utm_json = utm_params or {}
+        Args:
+            links: Links to create
+        
+        Returns:
+            LinkResponse for each requested link, in request order
+        """
+        if not links:
+            return []
+        
+        campaign_ids = {item.campaign_id for item in links}
+        found = {
+            row.id for row in
+            self.db.query(Campaign.id).filter(Campaign.id.in_(campaign_ids)).all()
+        }
+        missing = campaign_ids - found
+        if missing:
+            raise ValueError(f"Campaign {min(missing)} not found")
+        
+        rows = {}
+        keys = []
+        for item in links:
+            utm_json = self._build_utm(item.campaign_id, item.channel, item.utm_json)
+            key = self.link_key(item.campaign_id, item.long_url, utm_json)
+            keys.append(key)
+            rows.setdefault(key, {
+                "campaign_id": item.campaign_id,
+                "channel": item.channel,
+                "long_url": item.long_url,
+                "utm_json": utm_json,
+                "link_key": key,
+            })
+        
+        for attempt in range(self.MAX_SLUG_ATTEMPTS):
+            existing = self._links_by_key(rows.keys())
+            pending = [row for key, row in rows.items() if key not in existing]
+            if not pending:
+                break
+            slugs = self.slug_allocator.allocate(len(pending))
+            now = datetime.utcnow()
+            try:
+                self.db.execute(insert(Link), [
+                    dict(row, short_slug=slug, created_at=now)
+                    for row, slug in zip(pending, slugs)
+                ])
+                self.db.commit()
+                break
+            except IntegrityError:
+                # A slug collided or a concurrent request created the same link
+                self.db.rollback()
+                if attempt == self.MAX_SLUG_ATTEMPTS - 1:
+                    raise
+        
+        existing = self._links_by_key(rows.keys())
+        return [LinkResponse.model_validate(existing[key]) for key in keys]
+    
+    @staticmethod
+    def link_key(campaign_id: int, long_url: str, utm_json: Dict[str, str]) -> str:
+        """Stable idempotency key for (campaign_id, long_url, utm)."""
+        payload = json.dumps([campaign_id, long_url, utm_json], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def _links_by_key(self, keys) -> Dict[str, Link]:
+        """Load links by idempotency key."""
+        links = self.db.query(Link).filter(Link.link_key.in_(list(keys))).all()
+        return {link.link_key: link for link in links}
+    
+    @staticmethod
+    def _build_utm(campaign_id: int, channel: str, utm_params: Optional[Dict[str, str]]) -> Dict[str, str]:
+        """Fill in default UTM parameters for a link."""
+        utm_json = dict(utm_params or {})
         if not utm_json.get('utm_source'):
             utm_json['utm_source'] = channel
         if not utm_json.get('utm_medium'):
             utm_json['utm_medium'] = 'marketing'
         if not utm_json.get('utm_campaign'):
             utm_json['utm_campaign'] = f"campaign_{campaign_id}"
-        
-        # Create link
-        link = Link(
-            campaign_id=campaign_id,
-            channel=channel,
-            long_url=long_url,
-            short_slug=short_slug,
-            utm_json=utm_json
-        )
-        
-        self.db.add(link)
-        self.db.commit()
-        self.db.refresh(link)
-        
-        return LinkResponse.model_validate(link)
+        return utm_json
     
     def get_link(self, link_id: int) -> Optional[LinkResponse]:
         """Get a link by ID."""
@@ -147,6 +275,44 @@ class LinkService:
         Returns:
             Click event ID
         """
+        click = ClickEvent(**self.build_click_row(
+            link_id=link_id,
+            referrer=referrer,
+            user_agent=user_agent,
+            ip_address=ip_address,
+            geo_country=geo_country
+        ))
+        
+        self.db.add(click)
+        self.db.commit()
+        self.db.refresh(click)
+        
+        return click.id
+    
+    @classmethod
+    def build_click_row(
+        cls,
+        link_id: int,
+        referrer: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        ip_address: Optional[str] = None,
+        geo_country: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Build the column mapping for a click event without touching the database.
+        
+        Needs no session, so the redirect path can call it on the class.
+        
+        Args:
+            link_id: Link ID
+            referrer: HTTP referrer
+            user_agent: HTTP user agent
+            ip_address: IP address
+            geo_country: Country code
+        
+        Returns:
+            Dict suitable for ClickEvent(**row) or a bulk insert
+        """
         # Detect bot
         is_bot = BotDetector.is_bot(user_agent, referrer)
         
@@ -155,25 +321,34 @@ class LinkService:
         if ip_address:
             ip_hash = hashlib.sha256(ip_address.encode()).hexdigest()[:16]
         
-        # Detect device type
-        device_type = self._detect_device_type(user_agent)
+        return {
+            "link_id": link_id,
+            "timestamp": datetime.utcnow(),
+            "referrer": referrer,
+            "user_agent": user_agent,
+            "ip_hash": ip_hash,
+            "is_bot": is_bot,
+            "device_type": cls._detect_device_type(user_agent),
+            "geo_country": geo_country
+        }
+    
+    def record_clicks_bulk(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Insert many click events in a single statement and transaction.
         
-        # Create click event
-        click = ClickEvent(
-            link_id=link_id,
-            referrer=referrer,
-            user_agent=user_agent,
-            ip_hash=ip_hash,
-            is_bot=is_bot,
-            device_type=device_type,
-            geo_country=geo_country
-        )
+        Args:
+            rows: Click event mappings from build_click_row
         
-        self.db.add(click)
+        Returns:
+            Number of rows inserted
+        """
+        if not rows:
+            return 0
+        
+        self.db.execute(insert(ClickEvent), rows)
         self.db.commit()
-        self.db.refresh(click)
         
-        return click.id
+        return len(rows)
     
     def get_link_stats(self, link_id: int, days: int = 30) -> LinkStatsResponse:
         """
@@ -191,73 +366,69 @@ class LinkService:
             raise ValueError(f"Link {link_id} not found")
         
         cutoff_date = datetime.utcnow() - timedelta(days=days)
+        window = and_(
+            ClickEvent.link_id == link_id,
+            ClickEvent.timestamp >= cutoff_date
+        )
         
-        # Get all clicks
-        clicks = self.db.query(ClickEvent).filter(
-            and_(
-                ClickEvent.link_id == link_id,
-                ClickEvent.timestamp >= cutoff_date
-            )
-        ).all()
-        
-        # Calculate statistics
-        total_clicks = len(clicks)
-        total_bots = sum(1 for c in clicks if c.is_bot)
+        # Totals (aggregated in SQL - no click rows are loaded)
+        total_clicks, total_bots = self.db.query(
+            func.count(ClickEvent.id),
+            func.coalesce(func.sum(case((ClickEvent.is_bot.is_(True), 1), else_=0)), 0)
+        ).filter(window).one()
         
         # Top referrers
-        referrer_counts = {}
-        for click in clicks:
-            if click.referrer:
-                referrer_counts[click.referrer] = referrer_counts.get(click.referrer, 0) + 1
+        referrer_count = func.count(ClickEvent.id).label("count")
+        referrer_rows = self.db.query(ClickEvent.referrer, referrer_count).filter(
+            window,
+            ClickEvent.referrer.isnot(None),
+            ClickEvent.referrer != ""
+        ).group_by(ClickEvent.referrer).order_by(referrer_count.desc()).limit(10).all()
         
         top_referrers = [
             {"referrer": ref, "count": count}
-            for ref, count in sorted(referrer_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+            for ref, count in referrer_rows
         ]
         
         # Device breakdown
-        device_breakdown = {}
-        for click in clicks:
-            device = click.device_type or "unknown"
-            device_breakdown[device] = device_breakdown.get(device, 0) + 1
+        device_breakdown = self._count_by(ClickEvent.device_type, window)
         
         # Country breakdown
-        country_breakdown = {}
-        for click in clicks:
-            country = click.geo_country or "unknown"
-            country_breakdown[country] = country_breakdown.get(country, 0) + 1
+        country_breakdown = self._count_by(ClickEvent.geo_country, window)
         
         # Clicks by day
-        clicks_by_day = {}
-        for click in clicks:
-            day = click.timestamp.date().isoformat()
-            clicks_by_day[day] = clicks_by_day.get(day, 0) + 1
+        day = func.date(ClickEvent.timestamp).label("day")
+        day_rows = self.db.query(day, func.count(ClickEvent.id)).filter(
+            window
+        ).group_by(day).order_by(day).all()
         
         clicks_by_day_list = [
-            {"date": date, "clicks": count}
-            for date, count in sorted(clicks_by_day.items())
+            {"date": date.isoformat() if hasattr(date, "isoformat") else str(date), "clicks": count}
+            for date, count in day_rows
         ]
         
         return LinkStatsResponse(
             link_id=link_id,
             total_clicks=total_clicks,
-            total_bots=total_bots,
+            total_bots=int(total_bots),
             unique_referrers=top_referrers,
             device_breakdown=device_breakdown,
             country_breakdown=country_breakdown,
             clicks_by_day=clicks_by_day_list
         )
     
-    def _generate_short_slug(self, length: int = 8) -> str:
-        """Generate a unique short slug."""
-        while True:
-            slug = ''.join(secrets.choice(string.ascii_lowercase + string.digits) for _ in range(length))
-            # Check uniqueness
-            existing = self.db.query(Link).filter(Link.short_slug == slug).first()
-            if not existing:
-                return slug
+    def _count_by(self, column, window) -> Dict[str, int]:
+        """Count clicks per value of a column inside the stats window (NULL -> 'unknown')."""
+        rows = self.db.query(column, func.count(ClickEvent.id)).filter(window).group_by(column).all()
+        
+        breakdown = {}
+        for value, count in rows:
+            key = value or "unknown"
+            breakdown[key] = breakdown.get(key, 0) + count
+        return breakdown
     
-    def _detect_device_type(self, user_agent: Optional[str]) -> Optional[str]:
+    @staticmethod
+    def _detect_device_type(user_agent: Optional[str]) -> Optional[str]:
         """Detect device type from user agent."""
         if not user_agent:
             return None
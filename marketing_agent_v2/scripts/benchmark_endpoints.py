@@ -0,0 +1,98 @@
+"""
+Concurrency benchmark for the redirect and link-list endpoints.
+
+Usage:
+    python scripts/benchmark_endpoints.py --base-url http://localhost:9000 --requests 2000 --concurrency 100
+
+Creates a campaign and a tracked link through the API, then fires concurrent
+requests at ``GET /r/{slug}`` and ``GET /api/links`` and reports throughput
+and latency percentiles for each.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import httpx
+
+
+async def seed_link(client: httpx.AsyncClient) -> Dict:
+    """Create a campaign and a link to benchmark against."""
+    campaign = await client.post("/api/campaigns", json={
+        "name": "Benchmark Campaign",
+        "objective": "Load testing",
+        "start_date": datetime.utcnow().isoformat(),
+        "end_date": (datetime.utcnow() + timedelta(days=1)).isoformat()
+    })
+    campaign.raise_for_status()
+
+    link = await client.post("/api/links", json={
+        "campaign_id": campaign.json()["id"],
+        "channel": "benchmark",
+        "long_url": "https://example.com/benchmark"
+    })
+    link.raise_for_status()
+    return link.json()
+
+
+async def run_load(client: httpx.AsyncClient, path: str, total: int, concurrency: int) -> Dict:
+    """Issue ``total`` GET requests to ``path`` with at most ``concurrency`` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one_request():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path, follow_redirects=False)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "path": path,
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+async def main(base_url: str, total: int, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        link = await seed_link(client)
+
+        for path in (f"/r/{link['short_slug']}", "/api/links?limit=50"):
+            # Warm up connections and the server-side pool
+            await run_load(client, path, min(total, concurrency), concurrency)
+            result = await run_load(client, path, total, concurrency)
+            print(
+                f"{result['path']:<30} {result['rps']:>9.1f} req/s  "
+                f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms p99={result['p99_ms']:.1f}ms  "
+                f"errors={result['errors']}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark redirect and list endpoints")
+    parser.add_argument("--base-url", default="http://localhost:9000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.base_url, args.requests, args.concurrency))
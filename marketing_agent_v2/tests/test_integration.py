@@ -6,10 +6,13 @@ import pytest
 from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from app.main import app
-from app.database import Base, get_db
+from app.database import Base, get_db, get_async_db, init_db
 from app.models import Campaign, Link, ClickEvent, Action, Approval, ActionTypeEnum, ActionStatusEnum
 from app.services import LinkService, ActionService
 
@@ -22,6 +25,10 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The TestClient runs each request on a fresh event loop, so no pooling here
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base.metadata.create_all(bind=engine)
 
 
@@ -33,7 +40,13 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
 
 client = TestClient(app)
 
@@ -123,6 +136,117 @@ class TestLinkTracking:
         assert click.is_bot is True
         
         db.close()
+    
+    def test_click_buffer_bulk_flush_drains_on_stop(self):
+        """Test that buffered clicks are bulk-inserted and drained on shutdown."""
+        import asyncio
+        from app.services import ClickBuffer
+        
+        db = TestingSessionLocal()
+        
+        campaign = Campaign(
+            name="Test Campaign",
+            objective="Testing",
+            start_date=datetime.utcnow(),
+            end_date=datetime.utcnow() + timedelta(days=30)
+        )
+        db.add(campaign)
+        db.commit()
+        
+        service = LinkService(db)
+        link_response = service.create_link(
+            campaign_id=campaign.id,
+            channel="email",
+            long_url="https://example.com"
+        )
+        
+        async def run_buffer():
+            buffer = ClickBuffer(session_factory=TestingSessionLocal, batch_size=10, flush_interval=60)
+            await buffer.start()
+            for _ in range(25):
+                buffer.add(service.build_click_row(
+                    link_id=link_response.id,
+                    referrer="https://google.com",
+                    user_agent="Mozilla/5.0 (iPhone)"
+                ))
+            await buffer.stop()
+            return buffer
+        
+        buffer = asyncio.run(run_buffer())
+        
+        assert len(buffer) == 0
+        assert buffer.flushed_count == 25
+        assert db.query(ClickEvent).filter(ClickEvent.link_id == link_response.id).count() == 25
+        click = db.query(ClickEvent).filter(ClickEvent.link_id == link_response.id).first()
+        assert click.device_type == "mobile"
+        assert click.is_bot is False
+        
+        db.close()
+    
+    def test_link_stats_aggregates(self):
+        """Test that link stats are aggregated correctly in SQL."""
+        db = TestingSessionLocal()
+        
+        campaign = Campaign(
+            name="Test Campaign",
+            objective="Testing",
+            start_date=datetime.utcnow(),
+            end_date=datetime.utcnow() + timedelta(days=30)
+        )
+        db.add(campaign)
+        db.commit()
+        
+        service = LinkService(db)
+        link_response = service.create_link(
+            campaign_id=campaign.id,
+            channel="email",
+            long_url="https://example.com"
+        )
+        
+        service.record_click(link_id=link_response.id, referrer="https://google.com",
+                             user_agent="Mozilla/5.0 (iPhone)", geo_country="US")
+        service.record_click(link_id=link_response.id, referrer="https://google.com",
+                             user_agent="Mozilla/5.0 (Windows NT 10.0)", geo_country="US")
+        service.record_click(link_id=link_response.id, referrer="https://t.co",
+                             user_agent="Mozilla/5.0 (Windows NT 10.0)")
+        service.record_click(link_id=link_response.id, user_agent="Googlebot/2.1")
+        
+        stats = service.get_link_stats(link_response.id, days=30)
+        
+        assert stats.total_clicks == 4
+        assert stats.total_bots == 1
+        assert stats.unique_referrers[0] == {"referrer": "https://google.com", "count": 2}
+        assert len(stats.unique_referrers) == 2
+        assert stats.device_breakdown == {"mobile": 1, "desktop": 2, "unknown": 1}
+        assert stats.country_breakdown == {"US": 2, "unknown": 2}
+        assert stats.clicks_by_day == [{"date": datetime.utcnow().date().isoformat(), "clicks": 4}]
+        
+        db.close()
+    
+    def test_create_link_retries_on_slug_collision(self):
+        """Test that a colliding slug is caught by the unique index and re-drawn."""
+        db = TestingSessionLocal()
+        
+        campaign = Campaign(
+            name="Test Campaign",
+            objective="Testing",
+            start_date=datetime.utcnow(),
+            end_date=datetime.utcnow() + timedelta(days=30)
+        )
+        db.add(campaign)
+        db.commit()
+        
+        service = LinkService(db)
+        first = service.create_link(campaign_id=campaign.id, channel="email", long_url="https://example.com/a")
+        
+        slugs = iter([first.short_slug, "fresh123"])
+        service.slug_allocator = type("FixedAllocator", (), {"next": lambda self: next(slugs)})()
+        second = service.create_link(campaign_id=campaign.id, channel="email", long_url="https://example.com/b")
+        
+        assert second.short_slug == "fresh123"
+        assert db.query(Link).count() == 2
+        
+        db.close()
 
 
 class TestActions:
@@ -262,6 +386,121 @@ class TestAPI:
         data = response.json()
         assert data["short_slug"] is not None
         assert data["campaign_id"] == campaign_id
+    
+    def test_redirect_and_list_links(self):
+        """Test redirect and list endpoints on the async session."""
+        campaign_response = client.post(
+            "/api/campaigns",
+            json={
+                "name": "Test Campaign",
+                "objective": "Testing",
+                "start_date": datetime.utcnow().isoformat(),
+                "end_date": (datetime.utcnow() + timedelta(days=30)).isoformat()
+            }
+        )
+        campaign_id = campaign_response.json()["id"]
+        
+        link = client.post(
+            "/api/links",
+            json={
+                "campaign_id": campaign_id,
+                "channel": "email",
+                "long_url": "https://example.com/page"
+            }
+        ).json()
+        
+        response = client.get(f"/r/{link['short_slug']}", follow_redirects=False)
+        assert response.status_code == 301
+        assert response.headers["location"] == "https://example.com/page"
+        
+        assert client.get("/r/does-not-exist", follow_redirects=False).status_code == 404
+        
+        links = client.get("/api/links", params={"campaign_id": campaign_id}).json()
+        assert [l["id"] for l in links] == [link["id"]]
+        
+        stats = client.get(f"/api/links/{link['id']}/stats").json()
+        assert stats["total_clicks"] == 1
+    
+    def test_bulk_create_links_is_idempotent(self):
+        """Test that bulk link creation returns existing links for repeated keys."""
+        campaign_response = client.post(
+            "/api/campaigns",
+            json={
+                "name": "Test Campaign",
+                "objective": "Testing",
+                "start_date": datetime.utcnow().isoformat(),
+                "end_date": (datetime.utcnow() + timedelta(days=30)).isoformat()
+            }
+        )
+        campaign_id = campaign_response.json()["id"]
+        
+        payload = {"links": [
+            {"campaign_id": campaign_id, "channel": "affiliate", "long_url": "https://example.com/a",
+             "utm_json": {"utm_source": "affiliate"}},
+            {"campaign_id": campaign_id, "channel": "affiliate", "long_url": "https://example.com/b"},
+            {"campaign_id": campaign_id, "channel": "affiliate", "long_url": "https://example.com/a",
+             "utm_json": {"utm_source": "affiliate"}},
+        ]}
+        
+        first = client.post("/api/links/bulk", json=payload)
+        assert first.status_code == 200
+        first_links = first.json()
+        assert len(first_links) == 3
+        assert first_links[0]["id"] == first_links[2]["id"]
+        assert first_links[0]["id"] != first_links[1]["id"]
+        
+        second = client.post("/api/links/bulk", json=payload).json()
+        assert [l["short_slug"] for l in second] == [l["short_slug"] for l in first_links]
+        assert len(client.get("/api/links", params={"campaign_id": campaign_id}).json()) == 2
+        
+        missing = client.post("/api/links/bulk", json={"links": [
+            {"campaign_id": 999999, "channel": "affiliate", "long_url": "https://example.com/a"}
+        ]})
+        assert missing.status_code == 404
+
+
+class TestSchemaUpgrade:
+    """Test upgrading databases created before later schema changes."""
+    
+    def test_init_db_adds_link_key_to_existing_links_table(self, tmp_path):
+        """Test that init_db adds links.link_key to a links table from the original schema."""
+        old_engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with old_engine.begin() as conn:
+            # links as created by the original models, before link_key existed
+            conn.exec_driver_sql('''
+                CREATE TABLE links (
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    campaign_id INTEGER NOT NULL,
+                    channel VARCHAR(50) NOT NULL,
+                    long_url TEXT NOT NULL,
+                    short_slug VARCHAR(50) NOT NULL,
+                    utm_json JSON,
+                    created_at DATETIME
+                )
+            ''')
+            conn.exec_driver_sql("CREATE UNIQUE INDEX ix_links_short_slug ON links (short_slug)")
+            conn.exec_driver_sql(
+                "INSERT INTO links (campaign_id, channel, long_url, short_slug, utm_json) "
+                "VALUES (1, 'affiliate', 'https://example.com', 'abc123', '{}')"
+            )
+        
+        init_db(old_engine)
+        init_db(old_engine)  # idempotent
+        
+        db = sessionmaker(bind=old_engine)()
+        try:
+            link = db.query(Link).filter(Link.short_slug == "abc123").one()
+            assert link.link_key is None
+            link.link_key = "k" * 64
+            db.commit()
+            db.add(Link(campaign_id=1, channel="affiliate", long_url="https://example.com/b",
+                        short_slug="def456", link_key="k" * 64))
+            with pytest.raises(IntegrityError):
+                db.commit()
+            db.rollback()
+        finally:
+            db.close()
+            old_engine.dispose()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Test Gumroad product file uploads against a local stub server
+
+Starts an in-process server that speaks the multipart upload protocol
+documented in GumroadClient.upload_product_file, then checks streaming,
+resume after a failed part, checksum verification, concurrent uploads over
+pooled connections, and that uploads are skipped when GUMROAD_UPLOAD_URL is
+not set. Needs no Gumroad account or network access.
+
+Usage:
+    python test_gumroad_upload.py --size-mb 20 --files 4
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import cash_engine
+from cash_engine import GumroadClient
+
+
+class StubUploadServer(ThreadingHTTPServer):
+    """Stores parts on disk under part_dir; fail_parts maps part number -> how many PUTs of it to reject with a 500"""
+    daemon_threads = True
+
+    def __init__(self, part_dir: Path):
+        super().__init__(("127.0.0.1", 0), StubUploadHandler)
+        self.part_dir = part_dir
+        self.lock = threading.Lock()
+        self.upload_ids = itertools.count(1)
+        self.uploads = {}  # upload id -> {product_id, sha256, size, part_size, parts: {n: part file}}
+        self.files = {}  # product id -> sha256 of the completed file
+        self.fail_parts = {}
+        self.corrupt = False  # report a wrong checksum on complete
+        self.part_puts = 0
+        self.connections = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubUploadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled connections are reused
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        server = self.server
+        server.connections.add(self.client_address)
+        body = json.loads(self._body() or b"{}")
+        path = self.path.split("?")[0]
+        match = re.fullmatch(r"/products/([^/]+)/files/uploads", path)
+        if match:
+            with server.lock:
+                # An unfinished upload of the same file is resumed
+                for upload_id, upload in server.uploads.items():
+                    if upload["product_id"] == match.group(1) and upload["sha256"] == body["sha256"]:
+                        break
+                else:
+                    upload_id = f"up{next(server.upload_ids)}"
+                    upload = server.uploads[upload_id] = {
+                        "product_id": match.group(1), "sha256": body["sha256"], "size": body["size"],
+                        "part_size": body["part_size"], "parts": {}
+                    }
+                return self._reply(200, {"success": True, "upload": {
+                    "id": upload_id, "part_size": upload["part_size"], "parts": sorted(upload["parts"])
+                }})
+        match = re.fullmatch(r"/products/([^/]+)/files/uploads/([^/]+)/complete", path)
+        if match:
+            with server.lock:
+                upload = server.uploads.pop(match.group(2))
+            digest, size = hashlib.sha256(), 0
+            for n in sorted(upload["parts"]):
+                data = upload["parts"][n].read_bytes()
+                digest.update(data)
+                size += len(data)
+            checksum = "0" * 64 if server.corrupt else digest.hexdigest()
+            server.files[upload["product_id"]] = checksum
+            return self._reply(200, {"success": True, "file": {"id": match.group(2), "size": size, "sha256": checksum}})
+        self._reply(404, {"success": False, "message": "not found"})
+
+    def do_PUT(self):
+        server = self.server
+        server.connections.add(self.client_address)
+        data = self._body()
+        match = re.fullmatch(r"/products/[^/]+/files/uploads/([^/]+)/parts/(\d+)", self.path.split("?")[0])
+        if not match:
+            return self._reply(404, {"success": False, "message": "not found"})
+        part = int(match.group(2))
+        with server.lock:
+            server.part_puts += 1
+            if server.fail_parts.get(part, 0) > 0:
+                server.fail_parts[part] -= 1
+                return self._reply(500, {"success": False, "message": "injected failure"})
+        if hashlib.sha256(data).hexdigest() != self.headers.get("X-Part-SHA256"):
+            return self._reply(400, {"success": False, "message": "part checksum mismatch"})
+        part_file = server.part_dir / f"{match.group(1)}.{part}"
+        part_file.write_bytes(data)
+        with server.lock:
+            server.uploads[match.group(1)]["parts"][part] = part_file
+        self._reply(200, {"success": True})
+
+
+def make_file(path: Path, size_mb: float) -> Path:
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(int(size_mb)):
+            f.write(block)
+        f.write(b"tail" * 1000)
+    return path
+
+
+def main(size_mb: float, file_count: int):
+    cash_engine.logger = logging.getLogger("test_gumroad_upload")
+    with tempfile.TemporaryDirectory() as tmp:
+        server = StubUploadServer(Path(tmp))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        client = GumroadClient(access_token="stub-token")
+        client.upload_url = server.url
+        client.upload_part_size = 1024 * 1024
+        client.upload_backoff = 0.01
+        client.upload_retries = 2
+
+        print("=" * 60)
+        print(f"Testing Gumroad uploads against {server.url}")
+        print("=" * 60)
+        big = make_file(Path(tmp) / "big.pdf", size_mb)
+        checksum = GumroadClient.file_sha256(big)
+        parts = -(-big.stat().st_size // client.upload_part_size)
+
+        # 1. Streaming: peak Python memory stays around one part, not the file size
+        tracemalloc.start()
+        ok = client.upload_product_file("p1", big)
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+        assert ok and server.files["p1"] == checksum
+        print(f"✅ Streamed {size_mb:.0f} MB in {parts} parts, peak traced memory {peak_mb:.1f} MB")
+
+        # 2. A transient 500 is retried within the same call
+        server.fail_parts = {2: 1}
+        assert client.upload_product_file("p2", big) and server.files["p2"] == checksum
+        print("✅ Retried a part after a transient server error")
+
+        # 3. A part that keeps failing aborts the call; the next call only sends the missing parts
+        server.fail_parts = {3: client.upload_retries}
+        assert not client.upload_product_file("p3", big)
+        puts_before = server.part_puts
+        assert client.upload_product_file("p3", big) and server.files["p3"] == checksum
+        resent = server.part_puts - puts_before
+        assert resent == parts - 2, resent
+        print(f"✅ Resumed an interrupted upload: re-sent {resent} of {parts} parts")
+
+        # 4. A checksum mismatch on completion is reported as a failure
+        server.corrupt = True
+        assert not client.upload_product_file("p4", big)
+        server.corrupt = False
+        print("✅ Rejected an upload whose server-side checksum did not match")
+
+        # 5. Concurrent uploads share a small pool of keep-alive connections
+        files = [make_file(Path(tmp) / f"product_{i}.pdf", max(1, size_mb / 4)) for i in range(file_count)]
+        server.connections.clear()
+        puts_before = server.part_puts
+        results = client.upload_product_files([(f"c{i}", f) for i, f in enumerate(files)])
+        requests_made = server.part_puts - puts_before + 2 * file_count
+        assert all(results.values()) and len(results) == file_count
+        assert all(server.files[f"c{i}"] == GumroadClient.file_sha256(f) for i, f in enumerate(files))
+        print(f"✅ Uploaded {file_count} products concurrently: {requests_made} requests "
+              f"over {len(server.connections)} connections")
+
+        # 6. Without GUMROAD_UPLOAD_URL, uploads are skipped without any request
+        os.environ.pop("GUMROAD_UPLOAD_URL", None)
+        default = GumroadClient(access_token="stub-token")
+        assert default.upload_url == ""
+        assert default.upload_product_files([("d1", big), ("d2", big)]) == {"d1": True, "d2": True}
+        assert default._upload_session is None and "d1" not in server.files
+        print("✅ No GUMROAD_UPLOAD_URL: uploads skipped without contacting any server")
+        server.shutdown()
+
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test Gumroad file uploads against a local stub server")
+    parser.add_argument("--size-mb", type=float, default=20)
+    parser.add_argument("--files", type=int, default=4)
+    args = parser.parse_args()
+    main(args.size_mb, args.files)
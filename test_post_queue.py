@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""Test the posting ledger and outbound post queue against a scratch engine.db
+
+Exercises PostingLedger claims and PostQueue claiming, dedup, backoff and
+budgets the way the engine uses them: several instances on one database
+file (as separate processes would), worker threads, and the engine's own
+shared connection writing alongside. The Twitter live-window check stubs
+requests.post, so no social platform credentials are needed.
+
+Usage:
+    python test_post_queue.py --posts 40 --threads 8
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import cash_engine
+from cash_engine import ContentSyndicator, PostingLedger, PostQueue
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, payload):
+        self.status_code = status_code
+        self._payload = payload
+        self.content = b"{}"
+        self.text = ""
+
+    def json(self):
+        return self._payload
+
+
+def race(threads: int, func) -> list:
+    """Run func(i) on threads threads released at the same moment; return the results"""
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def run(i):
+        barrier.wait()
+        results[i] = func(i)
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def main(post_count: int, threads: int):
+    cash_engine.logger = logging.getLogger("test_post_queue")
+    os.environ["POST_BUDGET_TESTNET"] = "3/hour"
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "engine.db"
+        engine_conn = sqlite3.connect(db_path, check_same_thread=False)
+
+        print("=" * 60)
+        print(f"Testing posting ledger and post queue on {db_path}")
+        print("=" * 60)
+
+        # 1. One claim per (platform, file, window), however many claimants race for it
+        ledgers = [PostingLedger(engine_conn) for _ in range(threads)]
+        assert all(ledger.db is not engine_conn for ledger in ledgers)
+        window = ledgers[0].window_key("facebook")
+        won = race(threads, lambda i: ledgers[i].claim("facebook", "guide.md", window))
+        assert won.count(True) == 1, won
+        assert not ledgers[0].claim("facebook", "guide.md", window)
+        assert ledgers[0].claim("facebook", "guide.md", "other-window")
+        assert ledgers[0].claim("linkedin", "guide.md", window)
+        print(f"✅ {threads} racing claims on the same post: exactly one won")
+
+        # 2. Failed and stale claims can be retaken; posted and fresh ones can't
+        ledger = ledgers[0]
+        ledger.finish("facebook", "guide.md", window, posted=False)
+        assert ledger.claim("facebook", "guide.md", window)
+        ledger.finish("facebook", "guide.md", window, posted=True)
+        assert not ledger.claim("facebook", "guide.md", window)
+        assert ledger.already_posted("facebook", "guide.md")
+        assert ledger.claim("facebook", "stale.md", window)
+        assert not ledger.claim("facebook", "stale.md", window)
+        with ledger._lock:
+            ledger.db.execute(
+                "UPDATE posting_ledger SET claimed_at = ? WHERE content_file = 'stale.md'",
+                (time.time() - PostingLedger.CLAIM_TIMEOUT_SECONDS - 1,)
+            )
+            ledger.db.commit()
+        assert ledger.claim("facebook", "stale.md", window)
+        print("✅ Retook a failed claim and an abandoned one; a posted claim stayed closed")
+
+        # 3. A duplicate enqueue is folded into the outstanding post
+        queue = PostQueue(engine_conn)
+        assert queue.db is not engine_conn
+        assert queue.enqueue("linkedin", "guide.md", "first draft", priority=0)
+        assert not queue.enqueue("linkedin", "guide.md", "second draft", priority=10)
+        assert not queue.enqueue("linkedin", "guide.md", "third draft", priority=5)
+        rows = engine_conn.execute(
+            "SELECT content, priority FROM post_queue WHERE platform = 'linkedin' AND content_file = 'guide.md'"
+        ).fetchall()
+        assert rows == [("third draft", 10)], rows
+        assert queue.enqueue("facebook", "guide.md", "other platform")
+        print("✅ Duplicate enqueue rejected: one outstanding row, newest content, highest priority")
+
+        # 4. Racing workers from several queue instances never claim a post twice
+        queues = [PostQueue(engine_conn) for _ in range(threads)]
+        for i in range(post_count):
+            queue.enqueue("twitter", f"post_{i}.md", f"post {i}")
+        os.environ["POST_BUDGET_TWITTER"] = f"{post_count * 2}/day"
+
+        def drain(i):
+            claimed = []
+            while True:
+                job, _ = queues[i]._claim_next("twitter")
+                if job is None:
+                    return claimed
+                claimed.append(job[0])
+
+        claims = Counter(post_id for claimed in race(threads, drain) for post_id in claimed)
+        assert len(claims) == post_count and max(claims.values()) == 1, claims
+        print(f"✅ {threads} workers drained {post_count} posts: each claimed exactly once")
+
+        # 5. A post left 'sending' by a dead worker is requeued on start; a fresh one is not
+        stale_id = next(iter(claims))
+        engine_conn.execute("UPDATE post_queue SET claimed_at = ? WHERE id = ?",
+                            (time.time() - PostQueue.CLAIM_TIMEOUT_SECONDS - 1, stale_id))
+        engine_conn.commit()
+        queue.start([])
+        statuses = dict(engine_conn.execute(
+            "SELECT status, COUNT(*) FROM post_queue WHERE platform = 'twitter' GROUP BY status"
+        ).fetchall())
+        assert statuses == {"queued": 1, "sending": post_count - 1}, statuses
+        print("✅ Requeued a stale in-flight post on start, left live ones alone")
+
+        # 6. Failures back off exponentially, then give up after max_attempts
+        queue.backoff_seconds = 60
+        queue.max_attempts = 3
+        job, _ = queue._claim_next("twitter")
+        assert job[0] == stale_id and job[3] == 2, job
+        before = time.time()
+        queue._complete(job[0], job[3], "failed", "HTTP 503")
+        status, next_at, error = engine_conn.execute(
+            "SELECT status, next_attempt_at, last_error FROM post_queue WHERE id = ?", (stale_id,)
+        ).fetchone()
+        delay = next_at - before
+        assert status == "queued" and error == "HTTP 503" and 0.8 * 120 - 1 <= delay <= 1.2 * 120 + 1, (status, delay)
+        assert queue._claim_next("twitter")[0] is None  # not due yet
+        engine_conn.execute("UPDATE post_queue SET next_attempt_at = 0 WHERE id = ?", (stale_id,))
+        engine_conn.commit()
+        job, _ = queue._claim_next("twitter")
+        queue._complete(job[0], job[3], "failed", "HTTP 503")
+        assert engine_conn.execute("SELECT status FROM post_queue WHERE id = ?", (stale_id,)).fetchone()[0] == "failed"
+        print(f"✅ Retried after {delay:.0f}s backoff (attempt 2), marked failed at attempt {queue.max_attempts}")
+
+        # 7. A platform's budget caps sends per window and reports when it frees up
+        for i in range(5):
+            queue.enqueue("testnet", f"budget_{i}.md", f"budget {i}")
+        sent = 0
+        while True:
+            job, wait = queue._claim_next("testnet")
+            if job is None:
+                break
+            queue._complete(job[0], job[3], "sent", None)
+            sent += 1
+        assert sent == 3 and 3590 <= wait <= 3600, (sent, wait)
+        assert queue.metrics()["testnet"]["depth"] == 2
+        print(f"✅ Budget 3/hour: sent {sent}, 2 left queued, next slot in {wait / 60:.0f} min")
+
+        # 8. The queue's commits don't touch the engine connection's open transaction
+        engine_conn.execute("CREATE TABLE scratch (value TEXT)")
+        engine_conn.commit()
+        engine_conn.execute("INSERT INTO scratch VALUES ('uncommitted')")
+        enqueued = threading.Thread(target=queue.enqueue, args=("facebook", "isolation.md", "isolated"))
+        enqueued.start()
+        time.sleep(0.3)
+        engine_conn.rollback()
+        enqueued.join()
+        assert engine_conn.execute("SELECT COUNT(*) FROM scratch").fetchone()[0] == 0
+        assert engine_conn.execute(
+            "SELECT COUNT(*) FROM post_queue WHERE content_file = 'isolation.md'"
+        ).fetchone()[0] == 1
+        print("✅ Engine rollback discarded only its own write; the queued post survived")
+
+        # 9. Worker threads end to end, with one transient failure
+        failures = {"flaky.md": 1}
+        delivered = Counter()
+
+        def sender(platform, content_file, content):
+            if failures.get(content_file):
+                failures[content_file] -= 1
+                return "failed"
+            delivered[content_file] += 1
+            return "sent"
+
+        os.environ["POST_BUDGET_WORKNET"] = "100/hour"
+        os.environ["POST_WORKERS_WORKNET"] = "3"
+        worker_queue = PostQueue(engine_conn, sender=sender)
+        worker_queue.backoff_seconds = 0.05
+        worker_queue.poll_seconds = 0.05
+        for name in ("a.md", "b.md", "c.md", "flaky.md"):
+            worker_queue.enqueue("worknet", name, name)
+        worker_queue.start(["worknet"])
+        deadline = time.time() + 10
+        while sum(delivered.values()) < 4 and time.time() < deadline:
+            time.sleep(0.05)
+        worker_queue.stop()
+        assert delivered == Counter({"a.md": 1, "b.md": 1, "c.md": 1, "flaky.md": 1}), delivered
+        print("✅ 3 workers delivered every post once, retrying the flaky one")
+
+        # 10. Processes racing to send the first tweet agree on one live window and one tweet
+        tweets = Counter()
+
+        def fake_tweet(url, json=None, **kwargs):
+            time.sleep(0.5 if json["text"] == "slow launch" else 0.05)
+            tweets[json["text"]] += 1
+            return FakeResponse(201, {"data": {"id": str(sum(tweets.values()))}})
+
+        os.environ.update({name: "stub" for name in (
+            "TWITTER_API_KEY", "TWITTER_API_SECRET", "TWITTER_ACCESS_TOKEN", "TWITTER_ACCESS_TOKEN_SECRET")})
+        os.environ["TWITTER_LIVE_POSTING"] = "true"
+        cwd = os.getcwd()
+        os.chdir(tmp)  # keep the syndicators away from the real data/twitter_post_state.json
+        real_post = cash_engine.requests.post
+        cash_engine.requests.post = fake_tweet
+        try:
+            syndicators = [ContentSyndicator(None, db_conn=engine_conn) for _ in range(threads)]
+            first = Path(tmp) / "launch.md"
+            sent = race(threads, lambda i: syndicators[i]._post_to_twitter("launch day", first))
+            assert sent.count(True) == 1 and tweets == Counter({"launch day": 1}), (sent, tweets)
+            start_ts = ledger.live_window_start("twitter")
+            keys = engine_conn.execute(
+                "SELECT window_key, status FROM posting_ledger WHERE platform = 'twitter'"
+            ).fetchall()
+            assert keys == [(f"live-{int(start_ts)}", "posted")], keys
+            assert not syndicators[0]._post_to_twitter("launch day", first)
+            print(f"✅ {threads} racing first tweets opened one live window and posted once")
+
+            # A post still in flight when the window opens keeps its claim under the same key
+            engine_conn.execute("DELETE FROM posting_live_windows")
+            engine_conn.execute("DELETE FROM posting_ledger WHERE platform = 'twitter'")
+            engine_conn.commit()
+            slow_file = Path(tmp) / "slow.md"
+            in_flight = []
+            slow = threading.Thread(target=lambda: in_flight.append(
+                syndicators[0]._post_to_twitter("slow launch", slow_file)))
+            slow.start()
+            time.sleep(0.1)
+            assert syndicators[1]._post_to_twitter("other post", Path(tmp) / "other.md")
+            assert not syndicators[2]._post_to_twitter("slow launch", slow_file)
+            slow.join()
+            assert in_flight == [True] and tweets["slow launch"] == 1, (in_flight, tweets)
+            statuses = engine_conn.execute(
+                "SELECT content_file, status FROM posting_ledger WHERE platform = 'twitter' ORDER BY content_file"
+            ).fetchall()
+            assert statuses == [("other.md", "posted"), ("slow.md", "posted")], statuses
+        finally:
+            cash_engine.requests.post = real_post
+            os.chdir(cwd)
+        print("✅ Same file from another process while the first tweet was in flight: refused, tweeted once")
+        engine_conn.close()
+
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test the posting ledger and post queue")
+    parser.add_argument("--posts", type=int, default=40)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+    main(args.posts, args.threads)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Test Shopify product matching against a small in-memory catalog
+
+Loads a handful of products into ShopifyManager's cache and keyword index,
+then checks that content only matches a product when it contains one of the
+product's phrases (title, handle, product type or a tag) and that unrelated
+content matches nothing. Needs no Shopify store or network access.
+
+Usage:
+    python test_product_matching.py
+"""
+
+import argparse
+import logging
+
+import cash_engine
+from cash_engine import ShopifyManager
+
+CATALOG = [
+    {"id": 1, "title": "Business Kit", "handle": "business-kit", "tags": "startup, planning", "product_type": "Template"},
+    {"id": 2, "title": "Wealth Habit Tracker", "handle": "wealth-habit-tracker", "tags": "side hustle, money",
+     "product_type": "Digital Planner"},
+    {"id": 3, "title": "Email Launch Playbook", "handle": "email-launch-playbook", "tags": "newsletter",
+     "product_type": "Guide"},
+    {"id": 4, "title": "Business Growth Course", "handle": "business-growth-course", "tags": "",
+     "product_type": "Course"},
+]
+
+
+def main():
+    cash_engine.logger = logging.getLogger("test_product_matching")
+    shop = ShopifyManager()
+    shop.products_cache = {p["id"]: p for p in CATALOG}
+    shop.product_index.rebuild(CATALOG)
+    shop._catalog_fetch_due = lambda: False
+
+    def match(content):
+        product = shop.find_matching_product(content)
+        return product["id"] if product else None
+
+    print("=" * 60)
+    print(f"Testing product matching against {len(CATALOG)} products")
+    print("=" * 60)
+
+    # 1. One shared word is not enough; the whole title is
+    assert match("Five business lessons I learned the hard way this year.") is None
+    assert match("Grab the business kit before Friday.") == 1
+    assert match("Our kit for every business owner") == 1  # word order doesn't matter
+    print("✅ 'business' alone matched nothing; 'business kit' matched Business Kit")
+
+    # 2. A whole tag, handle or product type still matches, as with the old phrase scan
+    assert match("Ten side hustle ideas for the weekend") == 2
+    assert match("Read it at /products/email-launch-playbook") == 3
+    assert match("Is a digital planner worth it?") == 2
+    print("✅ Tag, handle and product type phrases each matched their product")
+
+    # 3. Unrelated content sharing scattered words with several products matches nothing
+    unrelated = ("Business growth is slow at first. Track one habit, plan the launch, "
+                 "and answer the email you keep putting off.")
+    assert match(unrelated) is None
+    print("✅ Unrelated post sharing single words with every product matched nothing")
+
+    # 4. When several products qualify, the strongest one wins
+    assert match("The business growth course pairs well with any business kit") == 4
+    print("✅ Course covering three title words beat the kit covering two")
+
+    # 5. Removed products stop matching
+    shop.product_index.remove(1)
+    del shop.products_cache[1]
+    assert match("Grab the business kit before Friday.") is None
+    print("✅ Removed product no longer matched")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test Shopify product matching")
+    parser.parse_args()
+    main()
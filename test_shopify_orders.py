@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Test Shopify order sync against a stubbed Admin API listing
+
+Replaces ShopifyManager._paginate with an in-memory order store that applies
+the created_at/updated_at filters the way Shopify does (inclusive bounds), then
+checks the duplicate-order migration, backfill slicing, upsert counts and
+reconcile cursor handling. Needs no Shopify store or network access.
+
+Usage:
+    python test_shopify_orders.py --days 3
+"""
+
+import argparse
+import logging
+import sqlite3
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import cash_engine
+from cash_engine import ShopifyAPIError, ShopifyManager
+
+
+class StubOrderStore:
+    """Orders keyed by id; fail_after makes the next listing raise after that many orders"""
+
+    def __init__(self):
+        self.orders = {}
+        self.fetched = Counter()  # order id -> times returned by a listing
+        self.fail_after = None
+
+    def add(self, order_id: int, created_at: datetime, price: float = 19.99):
+        stamp = created_at.isoformat()
+        self.orders[order_id] = {
+            "id": order_id, "order_number": 1000 + order_id, "total_price": f"{price:.2f}",
+            "currency": "USD", "created_at": stamp, "updated_at": stamp,
+            "financial_status": "paid", "line_items": [{"title": f"Template {order_id % 7}"}],
+        }
+
+    def touch(self, order_id: int, when: datetime, **changes):
+        self.orders[order_id].update(changes, updated_at=when.isoformat())
+
+    def paginate(self, endpoint: str, key: str, params):
+        assert endpoint == "/orders.json" and key == "orders"
+        parse = ShopifyManager._parse_shopify_time
+        bounds = [(field, parse(params[param]), op) for field, param, op in (
+            ("created_at", "created_at_min", "min"), ("created_at", "created_at_max", "max"),
+            ("updated_at", "updated_at_min", "min"),
+        ) if param in params]
+        fail_after, self.fail_after = self.fail_after, None
+        for returned, order in enumerate(sorted(self.orders.values(), key=lambda o: o["id"])):
+            if fail_after is not None and returned >= fail_after:
+                raise ShopifyAPIError("Shopify API error: HTTP 502 - stub failure")
+            if all(parse(order[field]) >= bound if op == "min" else parse(order[field]) <= bound
+                   for field, bound, op in bounds):
+                self.fetched[order["id"]] += 1
+                yield dict(order)
+
+
+def make_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute('''
+        CREATE TABLE revenue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            source TEXT,
+            amount REAL,
+            currency TEXT,
+            description TEXT,
+            status TEXT DEFAULT 'pending'
+        )
+    ''')
+    conn.execute('CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT)')
+    conn.commit()
+    return conn
+
+
+def make_manager(conn: sqlite3.Connection, store: StubOrderStore) -> ShopifyManager:
+    shop = ShopifyManager(conn)
+    shop.enabled = True
+    shop.access_token = "stub-token"
+    shop._paginate = store.paginate
+    return shop
+
+
+def main(days: int):
+    cash_engine.logger = logging.getLogger("test_shopify_orders")
+    print("=" * 60)
+    print("Testing Shopify order sync against a stub order listing")
+    print("=" * 60)
+
+    # 1. Duplicate order rows from older databases are archived, not just deleted
+    conn = make_db()
+    conn.execute('ALTER TABLE revenue ADD COLUMN order_id TEXT')
+    conn.executemany('INSERT INTO revenue (source, amount, order_id) VALUES (?, ?, ?)',
+                     [("shopify", 10.0, "1"), ("shopify", 10.0, "1"), ("shopify", 5.0, "2"),
+                      ("shopify", 10.0, "1"), ("gumroad_sale", 3.0, None), ("gumroad_sale", 3.0, None)])
+    conn.commit()
+    make_manager(conn, StubOrderStore())
+    kept = conn.execute('SELECT id FROM revenue ORDER BY id').fetchall()
+    archived = conn.execute('SELECT id, order_id FROM revenue_duplicates ORDER BY id').fetchall()
+    assert [r[0] for r in kept] == [1, 3, 5, 6], kept
+    assert archived == [(2, "1"), (4, "1")], archived
+    print(f"✅ Moved {len(archived)} duplicate order rows to revenue_duplicates, kept the first of each")
+
+    # 2. Backfill slices cover the range with no gaps or overlaps, boundaries included
+    conn = make_db()
+    store = StubOrderStore()
+    shop = make_manager(conn, store)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=days)
+    # One order a minute, so every slice boundary (whole seconds) lands on an order
+    minutes = days * 24 * 60
+    for i in range(minutes):
+        store.add(i + 1, start + timedelta(minutes=i))
+    totals = shop.backfill_orders(start, end, workers=4)
+    assert totals == {"fetched": minutes, "inserted": minutes, "updated": 0, "failed_slices": 0}, totals
+    assert set(store.fetched) == set(store.orders) and max(store.fetched.values()) == 1
+    assert conn.execute("SELECT COUNT(*) FROM revenue WHERE source = 'shopify'").fetchone()[0] == minutes
+    print(f"✅ Backfilled {minutes} orders over {days} days: every order fetched exactly once")
+
+    # 3. Re-running inserts nothing; only orders whose revenue fields changed count as updated
+    store.fetched.clear()
+    again = shop.backfill_orders(start, end, workers=4)
+    assert again == {"fetched": minutes, "inserted": 0, "updated": 0, "failed_slices": 0}, again
+    for order_id in range(1, 11):
+        store.orders[order_id]["current_total_price"] = "9.99"
+    store.orders[11]["financial_status"] = "refunded"
+    changed = shop.backfill_orders(start, end, workers=4)
+    assert changed["inserted"] == 0 and changed["updated"] == 11, changed
+    assert conn.execute("SELECT status FROM revenue WHERE order_id = '11'").fetchone()[0] == "refunded"
+    print("✅ Upsert counts: 0 inserted / 0 updated when unchanged, 11 updated after edits and a refund")
+
+    # 4. Reconcile: the cursor only moves after a complete fetch
+    conn = make_db()
+    store = StubOrderStore()
+    shop = make_manager(conn, store)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    for i in range(1, 51):
+        store.add(i, now - timedelta(days=2, minutes=i))
+    first = shop.reconcile_orders()
+    cursor = shop._get_sync_cursor("shopify_orders")
+    assert first["inserted"] == 50 and cursor == max(o["updated_at"] for o in store.orders.values()), (first, cursor)
+
+    store.touch(3, now - timedelta(hours=1), current_total_price="1.00")
+    store.add(51, now - timedelta(minutes=30))
+    store.fail_after = 20
+    failed = shop.reconcile_orders()
+    assert failed == {"fetched": 0, "inserted": 0, "updated": 0}, failed
+    assert shop._get_sync_cursor("shopify_orders") == cursor
+    assert conn.execute("SELECT COUNT(*) FROM revenue WHERE order_id = '51'").fetchone()[0] == 0
+    print("✅ Reconcile kept its cursor and wrote nothing when a fetch failed part-way")
+
+    retried = shop.reconcile_orders()
+    # updated_at_min is inclusive, so the order the cursor points at comes back too (unchanged)
+    assert retried == {"fetched": 3, "inserted": 1, "updated": 1}, retried
+    assert shop._get_sync_cursor("shopify_orders") == store.orders[51]["updated_at"]
+    assert shop.reconcile_orders() == {"fetched": 1, "inserted": 0, "updated": 0}
+    print("✅ The next reconcile picked up both missed changes and advanced the cursor")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test Shopify order sync against a stubbed order listing")
+    parser.add_argument("--days", type=int, default=3)
+    args = parser.parse_args()
+    main(args.days)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Test change-only syndication across engine restarts
+
+Runs ContentSyndicator.syndicate_changed_files against a scratch products/
+folder and engine.db, with ShopifyManager's product listing stubbed, and
+recreates the syndicator (as a restart would) between runs to check which
+files the persisted manifest lets it skip, then checks that placeholder
+.pdf files are kept out of syndication and product creation. Needs no
+Shopify store, social accounts or network access.
+
+Usage:
+    python test_syndication.py
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import cash_engine
+from cash_engine import AffiliateManager, ContentSyndicator, ProductFactory, ShopifyManager, TemplateCorpusIndex
+
+
+def write_pdf(path: Path, text: str):
+    """Minimal one-page PDF showing text, with a correct xref table"""
+    stream = f"BT /F1 18 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(data))
+
+
+class StubCatalog:
+    """Products served by the stubbed /products.json listing; fetches counts listings"""
+
+    def __init__(self, products):
+        self.products = {p["id"]: dict(p) for p in products}
+        self.fetches = 0
+
+    def update(self, product_id: int, updated_at: str, **changes):
+        self.products[product_id].update(changes, updated_at=updated_at)
+
+    def paginate(self, endpoint: str, key: str, params):
+        assert endpoint == "/products.json" and key == "products"
+        self.fetches += 1
+        yield from (dict(p) for p in self.products.values())
+
+
+def start_engine(db_path: Path, catalog: StubCatalog):
+    """A fresh syndicator and Shopify manager on db_path, as after a restart"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    shop = ShopifyManager()
+    shop.enabled = True
+    shop.access_token = "stub-token"
+    shop._paginate = catalog.paginate
+    syndicator = ContentSyndicator(AffiliateManager("http://localhost:0"), products_dir=Path("products"),
+                                   shopify_manager=shop, db_conn=conn)
+    return syndicator, conn
+
+
+def main():
+    cash_engine.logger = logging.getLogger("test_syndication")
+    os.environ.setdefault("GUMROAD_TOKEN", "stub-token")
+    catalog = StubCatalog([
+        {"id": 1, "title": "Business Kit", "handle": "business-kit", "tags": "", "product_type": "",
+         "updated_at": "2026-01-01T00:00:00Z"},
+        {"id": 2, "title": "Habit Tracker", "handle": "habit-tracker", "tags": "", "product_type": "",
+         "updated_at": "2026-01-01T00:00:00Z"},
+    ])
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # syndicate_content writes under ./data
+        try:
+            Path("products").mkdir()
+            Path("products/guide.md").write_text("# Guide\n\nEverything in the business kit, explained.\n")
+            db_path = Path(tmp) / "engine.db"
+
+            print("=" * 60)
+            print("Testing change-only syndication across restarts")
+            print("=" * 60)
+
+            # 1. First run loads the catalog before fingerprinting it and syndicates the file
+            syndicator, conn = start_engine(db_path, catalog)
+            assert [f.name for f in syndicator.syndicate_changed_files()] == ["guide.md"]
+            saved = conn.execute("SELECT catalog_version FROM syndication_manifest").fetchone()[0]
+            assert catalog.fetches == 1 and saved == syndicator._catalog_version(), saved
+            assert syndicator.syndicate_changed_files() == []
+            print("✅ First run syndicated guide.md and saved the fingerprint of the loaded catalog")
+            conn.close()
+
+            # 2. Restart with the same catalog: the fingerprint matches, nothing is reprocessed
+            syndicator, conn = start_engine(db_path, catalog)
+            assert syndicator.syndicate_changed_files() == []
+            print("✅ Restart with an unchanged catalog skipped guide.md")
+            conn.close()
+
+            # 3. Restart after an unrelated product changed: the file is re-read, but its links are the same
+            catalog.update(2, "2026-02-01T00:00:00Z", title="Habit Tracker Pro")
+            syndicator, conn = start_engine(db_path, catalog)
+            assert syndicator.syndicate_changed_files() == []
+            rechecked = conn.execute("SELECT catalog_version FROM syndication_manifest").fetchone()[0]
+            assert rechecked != saved and rechecked == syndicator._catalog_version(), rechecked
+            print("✅ Restart after an unrelated product change re-read guide.md but didn't re-syndicate it")
+            conn.close()
+
+            # 4. Restart after the linked product changed: the file is reprocessed with the new link
+            catalog.update(1, "2026-03-01T00:00:00Z", handle="business-kit-2026")
+            syndicator, conn = start_engine(db_path, catalog)
+            assert [f.name for f in syndicator.syndicate_changed_files()] == ["guide.md"]
+            assert syndicator.syndicate_changed_files() == []
+            print("✅ Restart after the linked product changed re-syndicated guide.md")
+
+            # 5. Delivery placeholders saved as .pdf are neither syndicated nor turned into products
+            placeholder = Path("products/PLACEHOLDER_KIT.pdf")
+            placeholder.write_text("PRODUCT DELIVERY: placeholder-kit\n\nThis is an automated delivery placeholder. "
+                                   "Replace this function with your preferred PDF generation library.\n")
+            write_pdf(Path("products/REAL_GUIDE.pdf"), "Real Guide to the business kit")
+            assert [f.name for f in syndicator.syndicate_changed_files()] == ["REAL_GUIDE.pdf"]
+            assert syndicator.read_content(placeholder) == ""
+            assert "Real Guide" in syndicator.read_content(Path("products/REAL_GUIDE.pdf"))
+            conn.execute('''
+                CREATE TABLE products (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, price REAL, type TEXT, description TEXT,
+                    created_date DATETIME, template_id TEXT, ab_test_variant TEXT
+                )
+            ''')
+            corpus = TemplateCorpusIndex(conn, Path("products"), documents=syndicator.documents)
+            factory = ProductFactory(conn, corpus)
+            assert factory.scan_templates_and_create_products(max_workers=2) == 2
+            names = sorted(row[0] for row in conn.execute("SELECT name FROM products"))
+            assert names == ["Guide", "Real Guide"], names
+            print("✅ Placeholder PDF was skipped by syndication and product creation; the real PDF was used")
+            conn.close()
+        finally:
+            os.chdir(cwd)
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test change-only syndication across restarts")
+    parser.parse_args()
+    main()
@@ -20,14 +20,8 @@ load_dotenv()
 # Setup logger
 logger = logging.getLogger('WeeklyReportGenerator')
 
-# OpenAI client (optional)
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-    openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY')) if os.getenv('OPENAI_API_KEY') else None
-except ImportError:
-    OPENAI_AVAILABLE = False
-    openai_client = None
+# Shared LLM gateway (pooled client, response cache, usage metering)
+from llm_gateway import get_gateway
 
 
 class DataAggregator:
@@ -465,13 +459,13 @@ class RecommendationEngine:
     """AI-powered recommendation engine for honest, actionable advice"""
     
     def __init__(self):
-        self.openai_client = openai_client
+        self.llm = get_gateway()
     
     def generate_recommendations(self, data: Dict[str, Any], successes: Dict[str, Any],
                                  failures: Dict[str, Any], actions: Dict[str, Any]) -> Dict[str, Any]:
         """Generate honest recommendations the user might miss"""
         
-        if not self.openai_client:
+        if not self.llm.is_available():
             return self._rule_based_recommendations(data, successes, failures, actions)
         
         try:
@@ -509,9 +503,9 @@ Format as JSON with keys: critical_issues (array), missed_opportunities (array),
 Each item should have: title, description, impact (high/medium/low), action_required.
 """
             
-            response = self.openai_client.chat.completions.create(
-                model=os.getenv('OPENAI_MODEL', 'gpt-4'),
-                messages=[
+            response = self.llm.complete(
+                "recommendation_engine",
+                [
                     {"role": "system", "content": "You are an expert business analyst. Provide direct, honest, actionable recommendations. Be specific and data-driven."},
                     {"role": "user", "content": prompt + "\n\nContext:\n" + context}
                 ],
@@ -519,7 +513,7 @@ Each item should have: title, description, impact (high/medium/low), action_requ
                 max_tokens=2500
             )
             
-            result_text = response.choices[0].message.content
+            result_text = response.text
             
             # Try to parse JSON
             try: